@@ -0,0 +1,581 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the slow parts of Tsukiyo: creating polytopes, rotating
+them, and drawing them. Every stage of every symbol in a fixed corpus is
+timed a few times, and the fastest and median times are written as JSON,
+so that they can be compared against a baseline saved from an earlier run.
+
+    $ python bench.py                       # Writes bench_output.txt
+    $ cp bench_output.txt baseline.json
+    $ python bench.py --compare baseline.json
+
+Stages:
+create              Creator, from the symbol to the finished polytope
+snub                Creator._wythoff_snub, finding a snub generating point
+schwarz             Creator._schwarz, reflecting the generating point
+faces               Polytope._set_faces, finding the faces
+mesh                Mesh.__init__, linking the faces and edges
+rotate              Object.rotate and get_points, for every frame
+view                picture_bases and project, like Canvas._view
+raster              Raster.render, drawing every frame offscreen
+canvas              Canvas.rotate and Tk redrawing, only with a display
+canvas_view         Canvas._view, only with a display
+
+Importing tsukiyo is also timed in a fresh interpreter, which must take
+under IMPORTBUDGET seconds and must not import Tkinter, or the run fails.
+So is a turn of ROTATIONFRAMES frames of the slowest symbols to draw, with
+and without the z-buffer, which must each take under ROTATIONBUDGET seconds.
+Painting the faces of that turn in order, DepthOrder repairing the order of
+the last frame must be faster than sorting each frame from scratch.
+The Tk calls of a turn of TKSYMBOLS are counted without a display, in solid
+and wireframe mode, and each frame must make under TKFRACTION of the calls
+that deleting and redrawing every item would make.
+
+Times are the seconds taken by all calls of a stage in one repeat, so the
+frame stages include every frame. The snub search starts from a fixed grid,
+so there are no random seeds to fix: every run does the same work.
+"""
+import argparse
+import contextlib
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import types
+import numpy as np
+import tsukiyo
+
+CORPUS = ['{3}', '{5/2}', '{10}', '{3,3}', '{3,5}', '{5,3}',  # Symbols
+          '(2 2 | 7)', '(3 2 | 2)', '(2 2 2 |)', '(3 3 2)', '(4 3 2 |)',
+          '(5 3 2)', '(5 3 | 2)', '(5 3 2 |)', '(| 4 3 2)', '(| 5 3 2)',
+          '(5/3 3 2)', '(5 5/2 2 |)', '(| 5/3 3 2)', '(5/3 3/2 3)']
+STAGES = {'snub': (tsukiyo.Creator, '_wythoff_snub'),   # Timed methods
+          'schwarz': (tsukiyo.Creator, '_schwarz'),
+          'faces': (tsukiyo.Polytope, '_set_faces'),
+          'mesh': (tsukiyo.Mesh, '__init__'),
+          'canvas_view': (tsukiyo.Canvas, '_view')}
+OUTPUT = 'bench_output.txt'     # Ignored by git
+REPEAT = 5      # Number of times to time each stage
+FRAMES = 24     # Number of frames to rotate and draw in each repeat
+THRESHOLD = 0.2     # Fraction slower than the baseline to flag
+NOISE = 0.001   # Seconds slower than the baseline to flag
+IMPORTBUDGET = 0.25 # Most seconds importing tsukiyo may take
+ROTATIONSYMBOLS = ['(5/3 3 2)', '(| 5/3 3 2)', '(3/2 5/3 3 |)']  # Slowest
+ROTATIONFRAMES = 48     # Number of frames in a turn of the slowest symbols
+ROTATIONBUDGET = 0.75   # Most seconds a turn may take to rotate and draw
+TKSYMBOLS = ['(5 3 2 |)', '(5/3 3 2)']  # Symbols to count the Tk calls of
+TKFRACTION = 0.1    # Most Tk calls per frame, as a fraction of redrawing
+
+
+class Timer():
+
+    """
+    Add up the time spent in each stage of one repeat.
+
+    Public methods:
+    stage               Time a block of code as a stage.
+    patch               Time every call of some methods as stages.
+    get_times           Return the seconds and calls of each stage.
+
+    Private methods:
+    __init__            Construct Timer class.
+    _wrap               Time every call of a method as a stage.
+
+    Private variables:
+    _times              The seconds spent in each stage (dict)
+    _calls              The number of times each stage ran (dict)
+    """
+
+    def __init__(self):
+        """Construct Timer class."""
+        self._times = {}
+        self._calls = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time a block of code as a stage, adding to its earlier time.
+        name: the name of the stage (str)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._times[name] = (self._times.get(name, 0) +
+                                 time.perf_counter() - start)
+            self._calls[name] = self._calls.get(name, 0) + 1
+
+    @contextlib.contextmanager
+    def patch(self, stages):
+        """
+        Time every call of some methods as stages, until the block ends.
+        stages: the class and method name of each stage (dict)
+        """
+        originals = {name: getattr(cls, method)
+                     for name, (cls, method) in stages.items()}
+        try:
+            for name, (cls, method) in stages.items():
+                setattr(cls, method, self._wrap(name, originals[name]))
+            yield
+        finally:
+            for name, (cls, method) in stages.items():
+                setattr(cls, method, originals[name])
+
+    def get_times(self):
+        """
+        Return the seconds and calls of each stage.
+        return: the seconds and calls of each stage that ran (dict)
+                keys are stage names (str)
+                values are seconds (float) and calls (int) (tuple, len=2)
+        """
+        return {name: (self._times[name], self._calls[name])
+                for name in self._times}
+
+    def _wrap(self, name, function):
+        # Time every call of a method as a stage.
+        # name: the name of the stage (str)
+        # function: the method to time (function)
+        # return: the timed method (function)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return timed
+
+
+def bench_symbol(symbol, frames, canvas=None):
+    """
+    Time every stage of one symbol once.
+    symbol: the symbol to create (str)
+    frames: the number of frames to rotate and draw (int)
+    canvas: the canvas to draw on, and the root to update (tuple, len=2)
+            or None to skip the canvas stages
+    return: the seconds and calls of each stage (dict), see Timer.get_times
+    """
+    timer = Timer()
+    with timer.patch(STAGES):
+        with timer.stage('create'):
+            polytope = tsukiyo.Creator(symbol).get_polytope()
+        if polytope is None:
+            raise ValueError('cannot create ' + symbol)
+
+        polytope.set_rotaxis(tsukiyo.Rotation(((0, tsukiyo.pi/2,
+                                                tsukiyo.pi/2), (0, 0, 0))))
+        raster = tsukiyo.Raster(600, 550)
+        bases = tsukiyo.picture_bases(raster.viewAxis, raster.zoom)
+        for frame in range(frames):
+            with timer.stage('rotate'):
+                polytope.rotate(tsukiyo.ROTANGLE)
+                points = polytope.get_points()
+            with timer.stage('view'):
+                tsukiyo.project(points, bases, raster.dist, (300, 275))
+            with timer.stage('raster'):
+                raster.render(polytope)
+
+        if canvas is not None:
+            app, root = canvas
+            app.canvas.make_polytope(symbol)
+            root.update()
+            for frame in range(frames):
+                with timer.stage('canvas'):
+                    app.canvas.rotate(1)
+                    root.update_idletasks()
+    return timer.get_times()
+
+def bench(symbols, repeat, frames, canvas=None):
+    """
+    Time every stage of every symbol, a few times each.
+    symbols: the symbols to time (list)
+    repeat: the number of times to time each stage (int)
+    frames: the number of frames to rotate and draw in each repeat (int)
+    canvas: the canvas to draw on, and the root to update (tuple, len=2)
+            or None to skip the canvas stages
+    return: the results, as written to the output file (dict)
+    """
+    results = {}
+    for symbol in symbols:
+        runs = [bench_symbol(symbol, frames, canvas) for i in range(repeat)]
+        results[symbol] = {}
+        for name in sorted(runs[0]):
+            seconds = [run[name][0] for run in runs]
+            results[symbol][name] = {'min': min(seconds),
+                                     'median': statistics.median(seconds),
+                                     'calls': runs[0][name][1]}
+        print('{:16} {:8.4f}s to create'.format(
+            symbol, results[symbol]['create']['min']), file=sys.stderr)
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'repeat': repeat,
+            'frames': frames, 'results': results}
+
+def compare(results, baseline, threshold, noise):
+    """
+    Find the stages that are slower than in the baseline.
+    A stage is slower if its fastest time grew by more than both the
+    threshold fraction and the noise in seconds.
+    results, baseline: the new and old results (dict), see bench
+    threshold: the fraction slower to flag (float)
+    noise: the seconds slower to flag (float)
+    return: the slower stages (list)
+            elements are symbol, stage, old and new seconds (tuple, len=4)
+    """
+    slower = []
+    for symbol, stages in results['results'].items():
+        for name, times in stages.items():
+            old = baseline['results'].get(symbol, {}).get(name)
+            if old is None:
+                continue
+            if times['min'] > old['min'] * (1 + threshold) \
+                and times['min'] - old['min'] > noise:
+                slower.append((symbol, name, old['min'], times['min']))
+    return slower
+
+def bench_import(repeat):
+    """
+    Time importing tsukiyo in a fresh interpreter, NumPy included,
+    with python -X importtime, and check that Tkinter is not imported.
+    repeat: the number of interpreters to time (int)
+    return: the fastest seconds to import tsukiyo (float), and whether
+            Tkinter was imported by any of them (bool)
+    """
+    times = []
+    loadsTk = False
+    for i in range(repeat):
+        report = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 'import tsukiyo'], stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True).stderr
+        # Lines are 'import time: self [us] | cumulative | package'
+        cumulative = re.search(r'\|\s*(\d+) \| tsukiyo$', report, re.M)
+        times.append(int(cumulative.group(1)) / 1e6)
+        if re.search(r'\| tkinter$', report, re.M):
+            loadsTk = True
+    return min(times), loadsTk
+
+def bench_rotation(symbols, repeat, frames):
+    """
+    Time rotating and drawing a turn of some symbols offscreen, with and
+    without the z-buffer, like a turn of the program window.
+    symbols: the symbols to time (list)
+    repeat: the number of turns to time (int)
+    frames: the number of frames in a turn (int)
+    return: the fastest seconds for a turn of each symbol (dict)
+            keys are symbols (str)
+            values are seconds without and with the z-buffer (dict)
+    """
+    seconds = {}
+    for symbol in symbols:
+        seconds[symbol] = {}
+        for zbuffer in (False, True):
+            polytope = tsukiyo.Creator(symbol).get_polytope()
+            polytope.set_rotaxis(tsukiyo.Rotation(((0, tsukiyo.pi/2,
+                                                    tsukiyo.pi/2),
+                                                   (0, 0, 0))))
+            raster = tsukiyo.Raster(600, 550, zbuffer)
+            times = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                for frame in range(frames):
+                    polytope.rotate(tsukiyo.ROTANGLE)
+                    raster.render(polytope)
+                times.append(time.perf_counter() - start)
+            seconds[symbol]['zbuffer' if zbuffer else 'painter'] = min(times)
+        print('{:16} {:8.4f}s to turn, {:.4f}s with the z-buffer'.format(
+            symbol, seconds[symbol]['painter'], seconds[symbol]['zbuffer']),
+            file=sys.stderr)
+    return seconds
+
+def bench_depth_order(symbols, repeat, frames):
+    """
+    Time putting the faces of each frame of a turn of some symbols in
+    painting order, with DepthOrder repairing the order of the last frame,
+    against sorting each frame from scratch with sorted.
+    symbols: the symbols to time (list)
+    repeat: the number of turns to time (int)
+    frames: the number of frames in a turn (int)
+    return: the fastest seconds to order a turn of each symbol (dict)
+            keys are symbols (str)
+            values are seconds repairing and sorting (dict)
+    """
+    seconds = {}
+    for symbol in symbols:
+        polytope = tsukiyo.Creator(symbol).get_polytope()
+        polytope.set_rotaxis(tsukiyo.Rotation(((0, tsukiyo.pi/2,
+                                                tsukiyo.pi/2), (0, 0, 0))))
+        raster = tsukiyo.Raster(600, 550)
+        camera = tsukiyo.convert([raster.dist] + list(raster.viewAxis), True)
+        turn = []
+        for frame in range(frames):
+            polytope.rotate(tsukiyo.ROTANGLE)
+            turn.append(polytope.get_depths(camera))
+        repairs = []
+        sorts = []
+        for i in range(repeat):
+            order = tsukiyo.DepthOrder()
+            order.sort(turn[-1])    # As if the turn went on from there
+            start = time.perf_counter()
+            for depths in turn:
+                order.sort(depths)
+            repairs.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for depths in turn:
+                sorted(depths, key=depths.get, reverse=True)
+            sorts.append(time.perf_counter() - start)
+        seconds[symbol] = {'repair': min(repairs), 'sorted': min(sorts)}
+        print('{:16} {:8.4f}s to order {} faces a turn, {:.4f}s sorting'
+              .format(symbol, min(repairs), len(turn[0]), min(sorts)),
+              file=sys.stderr)
+    return seconds
+
+class TkCounter():
+
+    """
+    Stand in for a tk.Canvas that counts what is sent to Tk instead of
+    drawing, so the Tk calls of each frame can be counted without a display.
+
+    Public methods:
+    update_idletasks    Run the callbacks waiting for the event loop.
+    create_polygon create_line create_oval create_text
+                        Make a new item and return its ID.
+    after_idle          Wait for update_idletasks to run a callback.
+    winfo_width winfo_height
+                        Return the size of the canvas.
+
+    Public variables:
+    calls               The number of calls made to Tk (int)
+    commands            The number of Tk commands run by those calls (int)
+    tk                  The stand in for the Tcl interpreter (TkCounter)
+
+    Private methods:
+    __init__            Construct TkCounter class.
+    _create             Make a new item and return its ID.
+
+    Private variables:
+    _lastItem           The ID of the last item made (int)
+    _idle               The callbacks waiting for the event loop (list)
+    """
+
+    def __init__(self, parent, **options):
+        """
+        Construct TkCounter class, like a tk.Canvas.
+        parent: the parent of the canvas (Window)
+        options: the canvas options, which are ignored (dict)
+        """
+        self.calls = 0
+        self.commands = 0
+        self.tk = self
+        self._lastItem = 0
+        self._idle = []
+
+    def __str__(self):
+        """Return the Tk path name of the canvas."""
+        return '.counter'
+
+    def eval(self, script):
+        """
+        Count a script of Tk commands as one call.
+        script: the commands, one per line (str)
+        """
+        self.calls += 1
+        self.commands += script.count('\n') + 1
+
+    def after_idle(self, callback):
+        """
+        Wait for update_idletasks to run a callback.
+        callback: the function to run (function)
+        """
+        self._idle.append(callback)
+
+    def update_idletasks(self):
+        """Run the callbacks waiting for the event loop."""
+        idle, self._idle = self._idle, []
+        for callback in idle:
+            callback()
+
+    def winfo_width(self):
+        """Return the width of the canvas, like the program window."""
+        return tsukiyo.WIDTH
+
+    def winfo_height(self):
+        """Return the height of the canvas, like the program window."""
+        return tsukiyo.HEIGHT
+
+    def _create(self, *args, **options):
+        # Make a new item and return its ID.
+        self.calls += 1
+        self.commands += 1
+        self._lastItem += 1
+        return self._lastItem
+
+    create_polygon = create_line = create_oval = create_text = _create
+
+
+class CountingCanvas(tsukiyo.Canvas, TkCounter):
+    """Canvas class that counts its Tk calls instead of drawing."""
+
+
+class Window():
+
+    """
+    Stand in for the program window, with the view of a reset Main.
+
+    Public methods:
+    change              Ignore a change to the buttons.
+
+    Public variables:
+    cols                The colours to draw with (dict)
+    view                The camera, light, and checks (SimpleNamespace)
+    """
+
+    def __init__(self, wire):
+        """
+        Construct Window class.
+        wire: to draw edges and points instead of faces (bool)
+        """
+        self.cols = tsukiyo.COLOURS
+        self.view = types.SimpleNamespace(
+            vtheta=0, vphi=0, vomega=tsukiyo.pi/2, ltheta=0, lphi=0, lint=1,
+            lred=255, lgreen=255, lblue=255, zoom=tsukiyo.ZOOM,
+            dist=int(tsukiyo.ZOOM*tsukiyo.RADIUS*tsukiyo.RETINA/20**(3/2)),
+            wire=wire, sphere=False, axes=False)
+
+    def change(self, *args):
+        """Ignore a change to the buttons, since there are none."""
+
+def bench_tk_calls(symbols, frames):
+    """
+    Count the Tk calls and commands of each frame of a turn of some
+    symbols, in solid and wireframe mode, against redrawing every frame,
+    which deletes all the items in one call and makes each one again.
+    symbols: the symbols to count (list)
+    frames: the number of frames in a turn (int)
+    return: the calls, commands, and redrawing calls per frame (dict)
+            keys are symbols (str)
+            values are dicts of 'solid' and 'wire' (dict)
+                keys are 'calls', 'commands', and 'redraw' (str)
+                values are the mean over the frames (float)
+    """
+    counts = {}
+    for symbol in symbols:
+        counts[symbol] = {}
+        for wire in (False, True):
+            canvas = CountingCanvas(Window(wire))
+            canvas.make_polytope(symbol)
+            canvas.update_idletasks()       # The first frame makes the items
+            canvas.calls = canvas.commands = redraw = 0
+            for frame in range(frames):
+                canvas.rotate(1)
+                canvas.update_idletasks()
+                redraw += 1 + canvas.get_data('items')
+            mode = 'wire' if wire else 'solid'
+            counts[symbol][mode] = {'calls': canvas.calls / frames,
+                                    'commands': canvas.commands / frames,
+                                    'redraw': redraw / frames}
+            print('{:16} {:8.1f} Tk calls and {:.1f} commands per {} '
+                  'frame, {:.1f} redrawing'.format(
+                      symbol, canvas.calls / frames, canvas.commands / frames,
+                      mode, redraw / frames), file=sys.stderr)
+    return counts
+
+def open_canvas():
+    """
+    Open a program window to time the canvas stages.
+    return: the program and its root window (tuple, len=2)
+            or None if there is no display
+    """
+    try:
+        tk = tsukiyo.load_tk()
+    except ImportError:
+        return None
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    app = tsukiyo.Main(root)
+    root.update()
+    return app, root
+
+def main(args=None):
+    """
+    Run the benchmarks, write the results, and compare with a baseline.
+    args: the command line arguments (list), default sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description='Time creating and drawing a fixed corpus of polytopes.')
+    parser.add_argument('symbols', nargs='*', default=CORPUS,
+                        help='symbols to time instead of the corpus')
+    parser.add_argument('-o', '--output', default=OUTPUT,
+                        help='file to write the JSON results to '
+                             '(default: {})'.format(OUTPUT))
+    parser.add_argument('-c', '--compare', metavar='BASELINE',
+                        help='results of an earlier run to compare with')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT,
+                        help='times to time each stage '
+                             '(default: {})'.format(REPEAT))
+    parser.add_argument('-n', '--frames', type=int, default=FRAMES,
+                        help='frames to draw in each repeat '
+                             '(default: {})'.format(FRAMES))
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD,
+                        help='fraction slower than the baseline to flag '
+                             '(default: {})'.format(THRESHOLD))
+    parser.add_argument('--no-canvas', action='store_true',
+                        help='skip the canvas stages even with a display')
+    options = parser.parse_args(args)
+
+    seconds, loadsTk = bench_import(options.repeat)
+    print('{:16} {:8.4f}s to import'.format('tsukiyo', seconds),
+          file=sys.stderr)
+    canvas = None if options.no_canvas else open_canvas()
+    if canvas is None:
+        print('No display, so skipping the canvas stages', file=sys.stderr)
+    results = bench(options.symbols, options.repeat, options.frames, canvas)
+    results['import'] = seconds
+    results['rotation'] = bench_rotation(ROTATIONSYMBOLS, options.repeat,
+                                         ROTATIONFRAMES)
+    results['depth'] = bench_depth_order(ROTATIONSYMBOLS, options.repeat,
+                                         ROTATIONFRAMES)
+    results['tk'] = bench_tk_calls(TKSYMBOLS, ROTATIONFRAMES)
+    if canvas is not None:
+        canvas[1].destroy()
+    with open(options.output, 'w') as output:
+        json.dump(results, output, indent=1, sort_keys=True)
+        output.write('\n')
+
+    if options.compare:
+        with open(options.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+        slower = compare(results, baseline, options.threshold, NOISE)
+        for symbol, name, old, new in slower:
+            print('SLOWER {:16} {:12} {:8.4f}s -> {:8.4f}s ({:+.0%})'.format(
+                symbol, name, old, new, new/old - 1))
+        if slower:
+            raise SystemExit(1)
+        print('No stage is more than {:.0%} slower than {}'.format(
+            options.threshold, options.compare))
+
+    if loadsTk:
+        raise SystemExit('Importing tsukiyo imported Tkinter')
+    if seconds > IMPORTBUDGET:
+        raise SystemExit('Importing tsukiyo took {:.3f}s, more than the '
+                         '{}s budget'.format(seconds, IMPORTBUDGET))
+    for symbol, turns in results['rotation'].items():
+        for mode, seconds in sorted(turns.items()):
+            if seconds > ROTATIONBUDGET:
+                raise SystemExit('A turn of {} ({}) took {:.3f}s, more than '
+                                 'the {}s budget'.format(symbol, mode, seconds,
+                                                         ROTATIONBUDGET))
+    for symbol, times in sorted(results['depth'].items()):
+        if times['repair'] > times['sorted']:
+            raise SystemExit('Ordering a turn of {} took {:.4f}s repairing, '
+                             'slower than the {:.4f}s sorting'.format(
+                                 symbol, times['repair'], times['sorted']))
+    for symbol, modes in results['tk'].items():
+        for mode, counts in sorted(modes.items()):
+            if counts['calls'] > TKFRACTION * counts['redraw']:
+                raise SystemExit('A {} frame of {} made {:.1f} Tk calls, more '
+                                 'than {:.0%} of the {:.1f} made redrawing'
+                                 .format(mode, symbol, counts['calls'],
+                                         TKFRACTION, counts['redraw']))
+
+if __name__ == '__main__':
+    main()
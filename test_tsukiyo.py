@@ -0,0 +1,645 @@
+#!/usr/bin/env python
+"""
+Tests for the numerically sensitive parts of Tsukiyo, which must keep
+making the same polytopes as the original program did.
+
+    $ python -m pytest test_tsukiyo.py
+"""
+import math
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import tsukiyo
+
+XW = ((0, tsukiyo.pi/2, tsukiyo.pi/2), (0, 0, 0))   # Rotation axis-planes
+YZ = ((tsukiyo.pi/2, tsukiyo.pi/2, tsukiyo.pi/2), (0, 0, 0))
+# Vertices, edges, and faces of each polygon type of every symbol listed in
+# the README, as the original program made them. Marked symbols are made
+# differently on purpose: polygons with more than ten sides are drawn now,
+# (| 4 3/2 2) and (| 4/3 3/2 2) were doubled octahedra, as the random snub
+# search stopped just off a mirror, (| 5 5/3 2) raised KeyError, and the
+# old face search joined points of (5 5/3 | 2) and the like into skew
+# quadrilaterals. (5 2 | 2) is left out, since it has always raised
+# KeyError, and None means the symbol is rejected.
+BASELINE = {
+    '{3}': (3, 3, {3: 1}),
+    '{4}': (4, 4, {4: 1}),
+    '{5}': (5, 5, {5: 1}),
+    '{6}': (6, 6, {6: 1}),
+    '{7}': (7, 7, {7: 1}),
+    '{8}': (8, 8, {8: 1}),
+    '{9}': (9, 9, {9: 1}),
+    '{10}': (10, 10, {10: 1}),
+    '{5/2}': (5, 5, {15: 1}),
+    '{5/3}': (5, 5, {15: 1}),
+    '{7/2}': (7, 7, {17: 1}),
+    '{7/3}': (7, 7, {17: 1}),
+    '{8/3}': (8, 8, {18: 1}),
+    '{9/2}': (9, 9, {19: 1}),
+    '{9/4}': (9, 9, {19: 1}),
+    '{10/3}': (10, 10, {20: 1}),
+    '{3,3}': (4, 6, {3: 4}),
+    '{3,4}': (6, 16, {3: 8}),
+    '{3,5}': (12, 30, {3: 20}),
+    '{4,3}': (8, 12, {4: 6}),
+    '{5,3}': (20, 30, {5: 12}),
+    '(2 2 2)': (24, 24, {3: 8}),
+    '(2 2 3)': (36, 36, {3: 12}),
+    '(2 2 4)': (48, 48, {3: 16}),
+    '(2 2 5)': (60, 60, {3: 20}),
+    '(2 2 6)': (72, 72, {3: 24}),
+    '(2 2 7)': (84, 84, {3: 28}),
+    '(2 2 | 2)': (4, 4, {4: 1}),
+    '(2 2 | 3)': (6, 6, {6: 1}),
+    '(2 2 | 4)': (8, 8, {8: 1}),
+    '(2 2 | 5)': (10, 10, {10: 1}),
+    '(2 2 | 6)': (12, 12, {11: 1}),  # was not drawn
+    '(2 2 | 7)': (14, 14, {11: 1}),  # was not drawn
+    '(3 2 | 2)': (6, 9, {3: 2}),
+    '(4 2 | 2)': (8, 12, {4: 6}),
+    '(6 2 | 2)': (12, 18, {4: 6, 6: 2}),
+    '(2 2 2 |)': (8, 12, {4: 6}),
+    '(2 2 3 |)': (12, 18, {4: 6, 6: 2}),
+    '(3 3 2)': (72, 72, {3: 24}),
+    '(| 3 3 2)': (12, 30, {3: 20}),
+    '(3 3 2 |)': (24, 36, {4: 6, 6: 8}),
+    '(3 | 3 2)': (4, 6, {3: 4}),
+    '(3 | 2 3)': (4, 6, {3: 4}),
+    '(2 | 3 3)': (6, 12, {3: 8}),
+    '(3 3 | 2)': (12, 24, {3: 8, 4: 6}),
+    '(3 2 | 3)': (12, 18, {3: 4, 6: 4}),
+    '(2 3 | 3)': (12, 18, {3: 4, 6: 4}),
+    '(4 3 2)': (144, 144, {3: 48}),
+    '(| 4 3 2)': (24, 60, {3: 32, 4: 6}),
+    '(4 3 2 |)': (48, 72, {4: 12, 6: 8, 8: 6}),
+    '(4 | 3 2)': (6, 12, {3: 8}),
+    '(3 | 2 4)': (8, 12, {4: 6}),
+    '(2 | 4 3)': (12, 24, {3: 8, 4: 6}),
+    '(4 3 | 2)': (24, 48, {3: 8, 4: 18}),
+    '(3 2 | 4)': (24, 36, {3: 8, 8: 6}),
+    '(2 4 | 3)': (24, 36, {4: 6, 6: 8}),
+    '(5 3 2)': (360, 360, {3: 120}),
+    '(| 5 3 2)': (60, 150, {3: 80, 5: 12}),
+    '(5 3 2 |)': (120, 180, {4: 30, 6: 20, 10: 12}),
+    '(5 | 3 2)': (12, 30, {3: 20}),
+    '(3 | 2 5)': (20, 30, {5: 12}),
+    '(2 | 5 3)': (30, 60, {3: 20, 5: 12}),
+    '(5 3 | 2)': (60, 120, {3: 20, 4: 30, 5: 12}),
+    '(3 2 | 5)': (60, 90, {3: 20, 10: 12}),
+    '(2 5 | 3)': (60, 90, {5: 12, 6: 20}),
+    '(4 3/2 2)': (144, 144, {3: 48}),
+    '(| 4 3/2 2)': (6, 12, {3: 8}),  # was doubled
+    '(4 3/2 2 |)': (24, 48, {3: 8, 4: 18}),
+    '(4 | 3/2 2)': (6, 12, {3: 8}),
+    '(3/2 | 2 4)': (8, 12, {4: 6}),
+    '(2 | 4 3/2)': (12, 24, {3: 8, 4: 6}),
+    '(4 3/2 | 2)': (24, 48, {3: 8, 4: 18}),
+    '(3/2 2 | 4)': (24, 36, {3: 8, 8: 6}),
+    '(2 4 | 3/2)': (6, 12, {3: 8}),
+    '(4/3 3/2 2)': (144, 144, {3: 48}),
+    '(| 4/3 3/2 2)': (24, 60, {3: 32, 4: 6}),  # was doubled
+    '(4/3 3/2 2 |)': (24, 48, {3: 8, 4: 18}),
+    '(4/3 | 3/2 2)': (6, 12, {3: 8}),
+    '(3/2 | 2 4/3)': (8, 12, {4: 6}),
+    '(2 | 4/3 3/2)': (12, 24, {3: 8, 4: 6}),
+    '(4/3 3/2 | 2)': (24, 48, {3: 8, 4: 18}),
+    '(3/2 2 | 4/3)': (24, 36, {3: 8, 18: 6}),
+    '(2 4/3 | 3/2)': (6, 12, {3: 8}),
+    '(5 5/2 2)': (360, 360, {3: 120}),
+    '(| 5 5/2 2)': (60, 150, {3: 60, 5: 12, 15: 12}),
+    '(5 5/2 2 |)': (60, 120, {3: 20, 4: 30, 5: 12}),
+    '(5 | 5/2 2)': (12, 30, {3: 20, 15: 12}),
+    '(5/2 | 2 5)': (12, 30, {3: 20}),
+    '(2 | 5 5/2)': (30, 60, {5: 12, 6: 10, 15: 12}),
+    '(5 5/2 | 2)': (60, 120, {4: 30, 5: 12, 6: 20, 15: 12}),
+    '(5/2 2 | 5)': (60, 90, {10: 12, 15: 12}),
+    '(2 5 | 5/2)': (20, 30, {5: 12}),
+    '(5 5/3 2)': (360, 360, {3: 120}),
+    '(| 5 5/3 2)': (60, 150, {3: 60, 5: 12, 15: 12}),  # was KeyError
+    '(5 5/3 2 |)': (120, 180, {4: 30, 10: 12, 20: 12}),
+    '(5 | 5/3 2)': (12, 30, {3: 20, 15: 12}),
+    '(5/3 | 2 5)': (12, 30, {3: 20}),
+    '(2 | 5 5/3)': (30, 60, {5: 12, 6: 10, 15: 12}),
+    '(5 5/3 | 2)': (20, 60, {3: 20, 4: 30, 5: 12, 15: 12}),  # skew faces
+    '(5/3 2 | 5)': (60, 90, {10: 12, 15: 12}),
+    '(2 5 | 5/3)': (60, 90, {5: 12, 20: 12}),
+    '(5/3 3 2)': (360, 360, {3: 120}),
+    '(| 5/3 3 2)': (60, 150, {3: 80, 15: 12}),
+    '(5/3 3 2 |)': (120, 180, {4: 30, 6: 20, 20: 12}),
+    '(5/3 | 3 2)': (12, 30, {3: 20, 15: 12}),
+    '(3 | 2 5/3)': (20, 30, {15: 12}),
+    '(2 | 5/3 3)': (30, 60, {3: 20, 15: 12, 20: 6}),
+    '(5/3 3 | 2)': (60, 120, {3: 20, 4: 30, 15: 12, 20: 12}),
+    '(3 2 | 5/3)': (60, 90, {3: 20, 20: 12}),
+    '(2 5/3 | 3)': (60, 90, {6: 20, 15: 12}),
+    '(5/3 3/2 3)': (360, 360, {3: 120}),
+    '(| 5/3 3/2 3)': None,
+    '(5/3 3/2 3 |)': (60, 120, {3: 20, 5: 12, 6: 20, 20: 12}),
+    '(5/3 | 3/2 3)': (12, 30, {3: 20}),
+    '(3/2 | 3 5/3)': (20, 60, {3: 20, 4: 30, 5: 12, 15: 12}),  # skew faces
+    '(3 | 5/3 3/2)': (20, 60, {3: 20, 4: 30, 5: 12, 15: 12}),  # skew faces
+    '(5/3 3/2 | 3)': (60, 120, {3: 20, 6: 20, 10: 12, 15: 12}),
+    '(3/2 3 | 5/3)': (30, 60, {3: 20, 15: 12, 20: 6}),
+    '(3 5/3 | 3/2)': (12, 30, {3: 20, 15: 12}),
+}
+
+
+def make(symbol):
+    """
+    Create a polytope, failing the test if the symbol is rejected.
+    symbol: the symbol to create (str)
+    return: the polytope, unrotated (Polytope)
+    """
+    polytope = tsukiyo.Creator(tsukiyo.canonical(symbol)).get_polytope()
+    assert polytope is not None, symbol + ' was rejected'
+    return polytope
+
+
+def paint_squares(raster, planes=None):
+    """
+    Paint a red square from 5 to 25 across and 5 to 20 down, then a blue
+    one from 15 to 35 across and 10 to 25 down, as two faces.
+    raster: the raster to paint in (Raster)
+    planes: one over the depth of each square, see Raster._paint
+    """
+    corners = [(5, 5, 25, 20), (15, 10, 35, 25)]
+    edges = np.array([[(x0, y0, x1, y0), (x1, y0, x1, y1),
+                       (x1, y1, x0, y1), (x0, y1, x0, y0)]
+                      for x0, y0, x1, y1 in corners],
+                     dtype=float).reshape(-1, 4)
+    raster._paint(edges, np.repeat([0, 1], 4),
+                  np.array([(255, 0, 0), (0, 0, 255)], dtype=np.uint8),
+                  np.array([True, True]), planes)
+
+def raster_colours(raster):
+    """
+    Find the red and the blue pixels of the last frame.
+    raster: the raster painted in (Raster)
+    return: where the pixels are red, and where they are blue
+            (tuple, len=2) of (np.ndarray, height x width, bool)
+    """
+    pixels = raster.get_pixels()
+    return ((pixels == (255, 0, 0)).all(axis=2),
+            (pixels == (0, 0, 255)).all(axis=2))
+
+
+def test_orientation_matches_rotating_points():
+    """Accumulating rotations gives the same points as rotating them."""
+    polytope = make('(5 3 | 2)')
+    points = np.array(polytope.get_points())
+    for axes in [XW, YZ]:
+        rotation = tsukiyo.Rotation(axes)
+        polytope.set_rotaxis(rotation)
+        for angle in [tsukiyo.ROTANGLE, -0.3, 1.1]:
+            polytope.rotate(angle)
+            points = points.dot(rotation.get_matrix(angle).T)
+            assert np.allclose(polytope.get_points(), points, atol=1e-9)
+
+
+def test_orientation_stays_orthogonal():
+    """Many rotations re-orthonormalize instead of drifting."""
+    polytope = make('{3,5}')
+    polytope.set_rotaxis(tsukiyo.Rotation(XW))
+    for step in range(10 * tsukiyo.ORTHOSTEPS + 7):
+        polytope.rotate(0.0123)
+    orientation = polytope.get_orientation()
+    assert np.abs(orientation.dot(orientation.T) - np.identity(4)).max() < 1e-12
+    radii = np.sqrt((np.array(polytope.get_points())**2).sum(axis=1))
+    assert np.allclose(radii, tsukiyo.RADIUS)
+
+
+def test_full_turn_returns_home():
+    """Turning by ROTANGLE all the way around ends where it started."""
+    polytope = make('(4 3 2 |)')
+    start = np.array(polytope.get_points())
+    polytope.set_rotaxis(tsukiyo.Rotation(YZ))
+    for step in range(int(round(2*tsukiyo.pi / tsukiyo.ROTANGLE))):
+        polytope.rotate(tsukiyo.ROTANGLE)
+    assert np.allclose(polytope.get_points(), start, atol=1e-9)
+
+
+def test_copy_is_unrotated():
+    """Copies start unrotated and turn without moving the original."""
+    polytope = make('{4,3}')
+    start = np.array(polytope.get_points())
+    polytope.set_rotaxis(tsukiyo.Rotation(XW))
+    polytope.rotate(0.5)
+    other = polytope.copy()
+    assert np.allclose(other.get_points(), start)
+    other.rotate(0.5)
+    assert np.allclose(other.get_points(), polytope.get_points())
+    other.rotate(0.5)
+    assert not np.allclose(other.get_points(), polytope.get_points())
+
+
+def test_snubs_have_equal_edges():
+    """Every snub the Newton solver finds has all of its edges equal."""
+    for numbers in tsukiyo.SNUBABLE:
+        polytope = make(tsukiyo.place_bar(numbers, 'b'))
+        points = np.array(polytope.get_points())
+        ends = np.array(polytope.get_edges())
+        lengths = np.sqrt(((points[ends[:,0]] - points[ends[:,1]])**2)
+                          .sum(axis=1))
+        assert len(ends) and np.ptp(lengths) < 1e-6 * lengths.max(), numbers
+
+
+def test_degenerate_snub():
+    """(| 4 3/2 2) only has equal sides on a mirror, so it is an octahedron."""
+    polytope = make('(| 4 3/2 2)')
+    assert len(polytope.get_points()) == 6
+    assert len(polytope.get_edges()) == 12
+    assert polytope.get_face_sides()[3] == 8
+
+
+def test_counts_match_baseline():
+    """Every README symbol has the vertices, edges, and faces it had."""
+    for symbol, expected in BASELINE.items():
+        polytope = tsukiyo.Creator(tsukiyo.canonical(symbol)).get_polytope()
+        if expected is None:
+            assert polytope is None, symbol
+            continue
+        assert polytope is not None, symbol + ' was rejected'
+        sides = polytope.get_face_sides()
+        assert (len(polytope.get_points()), len(polytope.get_edges()),
+                {n: sides[n] for n in sides if sides[n]}) == expected, symbol
+
+
+def test_coxeter_enumerates_the_whole_group(monkeypatch):
+    """The reflection group has exactly its order of distinct elements."""
+    groups = []
+    coxeter = tsukiyo.Creator._coxeter
+    def record(self, triangle, order):
+        levels = coxeter(self, triangle, order)
+        groups.append((order, levels))
+        return levels
+    monkeypatch.setattr(tsukiyo.Creator, '_coxeter', record)
+    for symbol in ['(2 2 | 7)', '(3 3 | 2)', '(4 3 | 2)', '(5 3 | 2)',
+                   '(5/3 3 | 2)', '(5 5/2 | 2)', '(5/3 3/2 | 3)']:
+        make(symbol)
+    assert [order for order, levels in groups] == [28, 24, 48, 120,
+                                                   120, 120, 120]
+    for order, levels in groups:
+        elements = [element for level in levels for element in level]
+        assert len(elements) == order
+        assert len({tuple(np.round(element, 6).ravel())
+                    for element in elements}) == order
+        for length, level in enumerate(levels):
+            for element in level:  # Words of odd length are reflections
+                assert np.allclose(element.dot(element.T), np.identity(3))
+                assert np.isclose(np.linalg.det(element), (-1)**length)
+
+
+def test_branching_plane_warns():
+    """Points with more than two edges in a plane are not dropped quietly."""
+    polytope = make('{4}')
+    edges = {(0, 1), (1, 2), (2, 3), (0, 3), (0, 2)}   # Square and diagonal
+    with pytest.warns(RuntimeWarning, match=r'\[0, 2\]'):
+        assert polytope._cycles(edges) == []
+
+
+def test_pairs_within_matches_brute_force():
+    """The grid finds the same pairs as comparing every pair of points."""
+    state = np.random.RandomState(11)
+    def brute(points, radius):
+        return [(i, j) for i in range(len(points))
+                for j in range(i+1, len(points))
+                if tsukiyo.distance2(points[i], points[j]) <= radius**2]
+    for dimensions, radius in [(3, 0.1), (3, 0.5), (4, 0.3), (4, 2.5)]:
+        points = (state.rand(300, dimensions) * 2 - 1).tolist()
+        assert tsukiyo.pairs_within(points, radius) == brute(points, radius)
+    grid = [[x, y, 0.0] for x in range(-3, 4) for y in range(-3, 4)]
+    assert tsukiyo.pairs_within(grid, 1.0) == brute(grid, 1.0)  # On cells
+    polytope = make('(| 5 3 2)')
+    points = polytope.get_points()
+    radius = max([math.sqrt(tsukiyo.distance2(points[i], points[j]))
+                  for i, j in polytope.get_edges()]) * 1.001
+    assert tsukiyo.pairs_within(points, radius) == brute(points, radius)
+
+
+def test_mesh_sides_are_edges():
+    """The half-edges walk around each face along the polytope's edges."""
+    for symbol in ['{3,4}', '(5 3 | 2)', '(5/3 3 2)']:
+        mesh = make(symbol).get_mesh()
+        edges = {tuple(sorted(edge)) for edge in mesh.get_edges()}
+        faces = mesh.get_faces()
+        sides = mesh.get_sides().tolist()
+        assert len(sides) == sum([len(face) for face in faces.values()])
+        for head, tail, face in sides:
+            assert tuple(sorted((head, tail))) in edges
+            cycle = faces[face]
+            assert cycle[(cycle.index(head) + 1) % len(cycle)] == tail
+
+
+def test_mesh_links_boundary_edges():
+    """Edges on one face or none have outside half-edges, marked -1."""
+    # Two triangles sharing the edge (2, 0), and an edge on no face
+    edges = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 0), (3, 4)]
+    mesh = tsukiyo.Mesh(edges, [(0, 1, 2), (0, 2, 3)], 5)
+    assert mesh.get_edges() == edges
+    assert sorted(mesh.get_edge_faces(2)) == [0, 1]
+    assert sorted(mesh.get_edge_faces(0)) == [-1, 0]
+    assert mesh.get_edge_faces(5) == [-1, -1]
+    assert mesh.get_face_neighbours(0) == [-1, -1, 1]
+    assert mesh.get_face_neighbours(1) == [0, -1, -1]
+    assert mesh.get_vertex_star(3) == [[3, 4, 5], [1]]
+    assert mesh.get_vertex_star(4) == [[5], []]
+    assert mesh.get_silhouette([True, False]) == [0, 1, 2]
+    assert mesh.get_silhouette([False, False]) == []
+
+
+def test_mesh_links_non_manifold_edges():
+    """An edge on three faces links all three, and missing sides are added."""
+    # Three triangles on the edge (0, 1), and the side (4, 0) is not given
+    edges = [(0, 1), (1, 2), (2, 0), (0, 3), (3, 1), (1, 4)]
+    mesh = tsukiyo.Mesh(edges, [(0, 1, 2), (1, 0, 3), (0, 1, 4)], 5)
+    assert mesh.get_edges() == edges + [(4, 0)]
+    assert sorted(mesh.get_edge_faces(0)) == [0, 1, 2]
+    for face in range(3):
+        neighbours = mesh.get_face_neighbours(face)
+        assert neighbours.count(-1) == 2
+        assert max(neighbours) in {0, 1, 2} - {face}
+    assert mesh.get_vertex_star(0) == [[0, 2, 3, 6], [0, 1, 2]]
+    assert mesh.get_silhouette([True, True, False]) == [0, 1, 2, 3, 4]
+    assert mesh.get_silhouette([False, False, True]) == [0, 5, 6]
+    assert mesh.get_sides().shape == (9, 3)
+
+
+def test_convex_polyhedra_cull_back_faces():
+    """Only closed convex polyhedra leave out the faces facing away."""
+    camera = [30, 40, 1000, 0]
+    def culled(polytope):
+        depths = polytope.get_depths(camera)
+        for face, centre in polytope.get_face_centres().items():
+            facing = sum([centre[i] * (camera[i] - centre[i])
+                          for i in range(4)]) > 0
+            assert (face in depths) == (facing or not polytope.convex)
+        return len(depths) < len(polytope.get_faces())
+    polytope = make('(5 3 | 2)')    # Inside faces removed, still closed
+    assert polytope.convex and culled(polytope)
+    assert not make('(5/3 3 2 |)').convex         # Star
+    assert not culled(make('(5/3 3 2 |)'))
+    polytope = make('(2 2 2)')      # Convex, but the triangles never meet
+    assert not polytope.get_mesh().is_closed()
+    assert not polytope.convex and not culled(polytope)
+    data = make('{4,3}').get_data()
+    assert tsukiyo.Polytope(data).convex
+    sides = dict(data[5])
+    sides[4] -= 1
+    cube = tsukiyo.Polytope(data[:3] + [data[3][1:], data[4][1:], sides])
+    assert not cube.get_mesh().is_closed()      # A face was left out
+    assert not cube.convex and not culled(cube)
+
+
+def test_library_round_trip(tmp_path):
+    """Saved polytopes load back the same, and the folder is made lazily."""
+    folder = tmp_path / 'library'
+    library = tsukiyo.Library(str(folder))
+    assert not folder.exists()
+    for symbol in ['{5/2}', '{3,5}', '(5 3 | 2)', '(| 4 3 2)', '(5/3 3 2)']:
+        creator = tsukiyo.Creator(symbol, library)
+        assert folder.exists()
+        loaded = library.load(symbol)
+        assert loaded is not None, symbol
+        polytope, wythoff, noSnub = loaded
+        assert (wythoff, noSnub) == creator.get_wythoff()
+        made, kept = creator.get_polytope().get_data(), polytope.get_data()
+        assert np.array_equal(made[0], kept[0])
+        assert made[1:] == kept[1:]
+        assert polytope.convex == creator.get_polytope().convex
+
+
+def test_library_rejects_outdated_and_damaged_files(tmp_path):
+    """Files from another source or with damaged data are made again."""
+    library = tsukiyo.Library(str(tmp_path))
+    tsukiyo.Creator('(4 3 | 2)', library)
+    assert library.load('(4 3 | 2)') is not None
+    path = library._path('(4 3 | 2)')
+    with open(path, 'rb') as saved:
+        data = bytearray(saved.read())
+    data[-1] ^= 1           # Flip a bit of the last corner
+    with open(path, 'wb') as damaged:
+        damaged.write(bytes(data))
+    assert library.load('(4 3 | 2)') is None
+
+    tsukiyo.Creator('(4 3 | 2)', library)
+    other = tsukiyo.Library(str(tmp_path))
+    other._source ^= 1      # As if tsukiyo.py had changed
+    assert other.load('(4 3 | 2)') is None
+    assert library.load('(4 3 | 2)') is not None
+
+
+def test_library_can_be_turned_off():
+    """An empty folder saves and loads nothing."""
+    library = tsukiyo.Library('')
+    assert tsukiyo.Creator('{3,3}', library).get_polytope() is not None
+    assert library.load('{3,3}') is None
+
+
+def test_cache_evicts_least_recently_used():
+    """A full cache forgets the creator that was used longest ago."""
+    cache = tsukiyo.Cache(2)
+    first = cache.get_creator('{3}')
+    second = cache.get_creator('{4}')
+    assert cache.get_creator('{3}') is first    # {4} is now the oldest
+    cache.get_creator('{5}')
+    assert cache.get_counts() == (1, 3)
+    assert cache.get_creator('{3}') is first
+    assert cache.get_creator('{4}') is not second
+    assert cache.get_counts() == (2, 4)
+
+
+def test_cache_keys_are_canonical():
+    """Entries that write the same polytope differently share a creator."""
+    assert tsukiyo.canonical('(2 3|5)') == tsukiyo.canonical('(3 2 | 5)')
+    assert tsukiyo.canonical(' ( | 2 3 5) ') == '(| 5 3 2)'
+    assert tsukiyo.canonical('(2 | 3 5)') != tsukiyo.canonical('(3 | 2 5)')
+    assert tsukiyo.canonical('(3 5/3 | 2)') == '(3 5/3 | 2)'
+    cache = tsukiyo.Cache(4)
+    creator = cache.get_creator('(3 2 | 5)')
+    assert cache.get_creator('(2 3 | 5)') is creator
+    assert cache.get_creator(' (3  2|5) ') is creator
+    assert cache.get_counts() == (2, 1)
+
+
+def test_cache_hits_are_unrotated_copies():
+    """Rotating a polytope from the cache does not rotate the next one."""
+    cache = tsukiyo.Cache(4)
+    polytope = cache.get_creator('(5 3 | 2)').get_polytope()
+    start = np.array(polytope.get_points())
+    polytope.set_rotaxis(tsukiyo.Rotation(XW))
+    polytope.rotate(0.5)
+    assert not np.allclose(polytope.get_points(), start)
+    other = cache.get_creator('(3 5 | 2)').get_polytope()
+    assert other is not polytope
+    assert np.allclose(other.get_points(), start)
+    assert np.allclose(other.get_orientation(), np.identity(4))
+
+
+def test_depth_order_matches_sorted():
+    """Repairing the last order sorts like sorted, whatever the last order."""
+    state = np.random.RandomState(6)
+    n = 120
+    def check(order, depths):
+        assert order.sort(depths) == sorted(depths, key=depths.get,
+                                            reverse=True)
+        return order.get_swaps()
+    order = tsukiyo.DepthOrder()
+    depths = {i: (d, -i) for i, d in enumerate(state.rand(n).tolist())}
+    assert check(order, depths) is None             # From scratch
+    assert check(order, depths) == 0                # Already sorted
+    nearly = {i: (d + 0.01*e, -i) for (i, (d, j)), e
+              in zip(depths.items(), state.rand(n).tolist())}
+    assert 0 < check(order, nearly) < n / 2         # Nearly sorted
+    reverse = {i: (-d, j) for i, (d, j) in nearly.items()}
+    assert check(order, reverse) == n               # Reversed, n is even
+    shuffle = {i: (d, -i) for i, d in enumerate(state.rand(n).tolist())}
+    assert 0 < check(order, shuffle) <= n           # Random
+    fewer = {i: shuffle[i] for i in range(0, n, 2)}
+    assert check(order, fewer) is None              # Things disappeared
+    swapped = dict(fewer)
+    swapped[n] = swapped.pop(0)
+    assert check(order, swapped) is None            # One thing replaced
+    assert check(order, {}) is None
+    assert check(order, {}) == 0
+
+
+def test_raster_paints_items_in_order():
+    """Items fill from edge to edge, later ones over earlier ones."""
+    raster = tsukiyo.Raster(40, 30)
+    paint_squares(raster)
+    red, blue = raster_colours(raster)
+    assert blue[10:25,15:35].all() and blue.sum() == 300
+    assert red[5:10,5:25].all() and red.sum() == 200
+
+
+def test_raster_zbuffer_shows_closest_face():
+    """Faces passing through each other meet where they are as close."""
+    raster = tsukiyo.Raster(40, 30, zbuffer=True)
+    # One over the depth grows to the right on red, and to the left on blue
+    paint_squares(raster, np.array([(0.001, 0, 1), (-0.001, 0, 1.04)]))
+    red, blue = raster_colours(raster)
+    assert blue[10:20,15:20].all() and red[10:20,20:25].all()
+    assert red.sum() == 250 and blue.sum() == 250
+
+
+def test_canvas_sends_each_frame_in_one_call(monkeypatch):
+    """A turn sends each frame to Tk at once, stacked by depth layer."""
+    import bench
+    monkeypatch.setattr(tsukiyo, 'LIBRARY', '')
+    for wire in (False, True):
+        canvas = bench.CountingCanvas(bench.Window(wire))
+        canvas.make_polytope('(5 3 2 |)')
+        for frame in range(48):     # A whole turn makes every item
+            canvas.rotate(1)
+            canvas.update_idletasks()
+        for frame in range(8):
+            canvas.calls = 0
+            canvas.rotate(1)
+            canvas.update_idletasks()
+            assert canvas.calls == 1
+            layers = [canvas._itemStates[item][4] for item in canvas._stack
+                      if item in canvas._frame]
+            assert len(layers) == canvas.get_data('items')
+            assert layers == sorted(layers)
+
+
+def test_canvas_raises_when_a_new_polytope_cannot_be_drawn(monkeypatch):
+    """Render errors reach the input box, and the last polytope stays."""
+    import bench
+    monkeypatch.setattr(tsukiyo, 'LIBRARY', '')
+    canvas = bench.CountingCanvas(bench.Window(False))
+    canvas.make_polytope('(5 3 2 |)')
+    items = canvas.get_data('items')
+    def fail(self, camera):
+        raise ValueError('cannot draw')
+    monkeypatch.setattr(tsukiyo.Polytope, 'get_depths', fail)
+    with pytest.raises(ValueError):
+        canvas.make_polytope('(4 3 | 2)')
+    assert len(canvas._currPolytope.get_faces()) == 62
+    monkeypatch.undo()
+    canvas.update_idletasks()
+    assert canvas.get_data('items') == items
+
+
+def test_scheduler_stops_when_its_step_raises():
+    """A step that raises stops the frames, so they can start again."""
+    class Widget():
+        def __init__(self):
+            self.waiting = []
+        def after(self, delay, callback):
+            self.waiting.append(callback)
+            return 'after#{}'.format(len(self.waiting))
+        def after_cancel(self, afterID):
+            self.waiting.pop()
+
+    def step(elapsed):
+        if len(steps) == 2:
+            raise ZeroDivisionError('bad frame')
+        steps.append(elapsed)
+
+    widget = Widget()
+    scheduler = tsukiyo.Scheduler(widget, 60)
+    steps = []
+    scheduler.start(step)
+    assert scheduler.is_running() and len(widget.waiting) == 1
+    widget.waiting.pop()()
+    assert len(steps) == 2 and len(widget.waiting) == 1
+    with pytest.raises(ZeroDivisionError):
+        widget.waiting.pop()()
+    assert not scheduler.is_running() and widget.waiting == []
+    steps = []
+    scheduler.start(step)
+    assert scheduler.is_running() and steps and len(widget.waiting) == 1
+
+
+def test_batch_records_list_points_and_edges():
+    """Batch records give the points and the pairs of points joined."""
+    record = tsukiyo.make_record((0, '(3 | 2 5)', None, False, False))
+    assert record['error'] is None
+    points = np.array(record['points'])
+    pairs = np.array(record['pairs'])
+    assert points.shape == (record['vertices'], 4)
+    assert pairs.shape == (record['edges'], 2)
+    assert np.allclose(np.linalg.norm(points, axis=1), tsukiyo.RADIUS)
+    lengths = np.linalg.norm(points[pairs[:,0]] - points[pairs[:,1]], axis=1)
+    assert np.allclose(lengths, lengths[0])
+
+    counts = tsukiyo.make_record((0, '(3 | 2 5)', None, False, True))
+    assert 'points' not in counts and 'pairs' not in counts
+    assert (counts['vertices'], counts['edges']) == (20, 30)
+
+
+@pytest.mark.skipif(not hasattr(tsukiyo.signal, 'setitimer'),
+                    reason='needs SIGALRM to stop a symbol')
+def test_batch_record_times_out():
+    """A symbol that takes too long is reported, and its alarm is gone."""
+    for timeout in [1e-6, 0.001, 0.005]:    # Wherever the alarm goes off
+        record = tsukiyo.make_record((0, '(5/3 3/2 3)', timeout, False, False))
+        assert record['error'] == 'timed out'
+        assert tsukiyo.signal.getitimer(tsukiyo.signal.ITIMER_REAL) == (0, 0)
+
+
+def test_import_does_not_load_tk():
+    """Importing tsukiyo leaves Tkinter alone until a window is needed."""
+    code = 'import sys, tsukiyo; print("tkinter" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert output.stdout.strip() == 'False'
+
+
+def test_tk_classes_leave_module_classes_alone(monkeypatch):
+    """Loading Tk makes widget subclasses, and never rebinds Main or Canvas."""
+    tkinter = pytest.importorskip('tkinter')
+    main, canvas = tsukiyo.Main, tsukiyo.Canvas
+    assert tsukiyo.load_tk() is tkinter
+    assert tsukiyo.Main is main and tsukiyo.Canvas is canvas
+    widget = tsukiyo.tk_class(canvas, tkinter.Canvas)
+    assert issubclass(widget, canvas) and issubclass(widget, tkinter.Canvas)
+    assert tsukiyo.tk_class(canvas, tkinter.Canvas) is widget
+    assert isinstance(canvas.__new__(canvas), widget)
+    assert isinstance(main.__new__(main), tkinter.ttk.Frame)
+    monkeypatch.setattr(canvas, '_view', lambda self: 'patched')
+    assert widget._view(None) == 'patched'
@@ -16,10 +16,25 @@ See the GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program. If not, see http://www.gnu.org/licenses/.
 """
-import tkinter as tk
-import tkinter.ttk as ttk
+import argparse
+import collections
+import copy
+import functools
+import importlib
+import itertools
+import json
 import math
-import random
+import multiprocessing
+import operator
+import os
+import re
+import signal
+import struct
+import sys
+import time
+import warnings
+import zlib
+import numpy as np
 
 TITLE = 'Tsukiyo v1.0'
 DESCRIPTION = '\nThis program displays beautiful polyhedra.'
@@ -34,9 +49,27 @@ ZOOM = 50       # ZOOM * RADIUS * RETINA / 2 gives maximum possible zoom
                 # ZOOM * RADIUS * RETINA gives maximum possible distance
                 # ZOOM * RADIUS * RETINA / 1000 gives the least distance
 FADEDELAY = 1000# Time for bad input status to fade away
-DELAY = 28      # Time between polling when mouse is held on a button
-ROTANGLE = pi/24# 28 ms per pi/24 rotation = 3 rotations every 4 seconds
+FRAMERATE = 60  # Most frames per second drawn while a button is held
+ROTSPEED = 3*pi/2   # Radians per second while Rotate is held, so 3
+                    # rotations every 4 seconds, however slow the frames
+STEPRATE = 36   # Zoom or distance steps per second while a button is held
+ROTANGLE = pi/24# Radians per press of an arrow key
 SPHERENUM = 12  # Number of longitude/latitude sections on the radial sphere
+SNAP = RADIUS/100# Reflected points closer than this are the same point
+ORTHOSTEPS = 48 # Rotations between re-orthonormalizing object orientations
+SHADESTEPS = 256# Shades per face colour, so 1/SHADESTEPS is the smallest
+                # change in shade, and the canvas keeps 16 * SHADESTEPS colours
+DEPTHBUCKETS = 16   # Depth layers the canvas stacks faces and edges in, so
+                    # an item is only restacked when it changes layer
+CACHESIZE = 32  # Number of recently created polytopes kept in memory
+LIBRARY = os.environ.get('TSUKIYO_LIBRARY',
+                         os.path.join(os.path.expanduser('~'), '.tsukiyo'))
+                # Folder where created polytopes are saved between runs,
+                # set TSUKIYO_LIBRARY to change it, or to '' to save nothing
+IMAGES = os.path.dirname(os.path.abspath(__file__))
+                # Folder of the icon and arrow button images
+PROFILEFRAMES = 120  # Frames kept by the profiler for its percentiles
+BATCHDIGITS = 6 # Decimal places of the point coordinates in batch records
 SNUBABLE = (['2','3','3'], ['2','3','4'], ['2','3','5'], ['2','3','5/3'],
             ['2','5','5/2'], ['2','5','5/3'], ['2','3/2','3/2'],
             ['2','3/2','4'], ['2','3/2','4/3'], ['2','3/2','5/3'],
@@ -44,13 +77,15 @@ SNUBABLE = (['2','3','3'], ['2','3','4'], ['2','3','5'], ['2','3','5/3'],
 POLYGONS = {0:'notgon', 1:'monogon', 2:'digon', # Polygon names
             3:'triangle', 4:'quadrilateral', 5:'pentagon', 6:'hexagon',
             7:'heptagon', 8:'octagon', 9:'nonagon', 10:'decagon',
+            11:'polygon', 12:'polygram',    # More than ten sides
             13:'triangle', 14:'line', 15:'pentagram', 16:'hexagram',
             17:'heptagram', 18:'octagram', 19:'nonagram', 20:'decagram'}
 COLOURS = {'point': ['#000', '#F00', '#00F'],
            'line' : {'face': '#000', 'sphere': '#666'},
            'face' : {3:'#719',4:'#1B1',5:'#04D',6:'#F8C',7:'#630',8:'#E00',
-                     9:'#9DF', 10:'#098', 13:'#C07', 14:'#FF1', 15:'#7BF',
-                     16:'#999', 17:'#8F0', 18:'#B7F', 19:'#90E', 20:'#030'},
+                     9:'#9DF', 10:'#098', 11:'#DA5', 12:'#5AD',
+                     13:'#C07', 14:'#FF1', 15:'#7BF', 16:'#999',
+                     17:'#8F0', 18:'#B7F', 19:'#90E', 20:'#030'},
            'axis' : ['#F00', '#0F0', '#00F', '#F90'],
            'menu' : {'main': '#CCC', 'button': '#CCC',
                      'canvas': '#FFF', 'trough': '#BBB'},
@@ -117,6 +152,102 @@ def cross4D(u, v, w, unit=[1]):
            -u[2]*(v[0]*w[1]-v[1]*w[0])]
     return normalize(uvw, unit)
 
+def pairs_within(points, radius):
+    """
+    Find all pairs of points that are at most radius apart.
+    Points are put in a grid of cells radius wide, so only points in
+    neighbouring cells need to be compared.
+
+    points: the points in Cartesian coordinates (list)
+    radius: the largest distance between paired points (float), > 0
+    return: the pairs of point indices (i, j), with i < j, in order (list)
+    """
+    cells = {}
+    for i,point in enumerate(points):
+        cell = tuple([math.floor(x / radius) for x in point])
+        cells.setdefault(cell, []).append(i)
+    offsets = list(itertools.product((-1, 0, 1), repeat=len(points[0])))
+    pairs = []
+    for cell, members in cells.items():
+        for offset in offsets:
+            others = cells.get(tuple([c + o for c,o in zip(cell, offset)]))
+            if others is None:
+                continue
+            for i in members:
+                for j in others:
+                    if i < j and distance2(points[i], points[j]) <= radius**2:
+                        pairs.append((i, j))
+    pairs.sort()
+    return pairs
+
+def snap(point):
+    """
+    Snap a point to a grid, so that points closer than SNAP are the same.
+
+    point: the point in Cartesian coordinates (list, len>=3)
+    return: the grid cell of the first three coordinates (tuple, len=3)
+            coordinates that snap to zero still keep their sign
+    """
+    return tuple([(round(x / SNAP), math.copysign(1, x)) for x in point[:3]])
+
+def canonical(entry):
+    """
+    Write a Schlafli or Wythoff symbol in a standard way, so that entries
+    that differ only in spacing create the same polytope. Whole numbers on
+    the same side of the bar can swap places, so they are written from
+    largest to smallest: (2 3 | 5) is (3 2 | 5). Fractions stay where they
+    are, as the faces found for some star polytopes depend on their order.
+
+    entry: the text input (str): '{d}', '{ d, d }', '( d d|d )' etc.
+    return: the symbol without spaces if Schlafli, or with single spaces
+            between numbers and bars if Wythoff (str): '{d,d}', '(d d | d)'
+    """
+    entry = entry.strip()
+    if entry.startswith('(') and entry.endswith(')'):
+        words = []
+        for i, side in enumerate(entry[1:-1].split('|')):
+            numbers = side.split()
+            if all(number.isdigit() for number in numbers):
+                numbers.sort(key=int, reverse=True)
+            words += ['|'] * (i > 0) + numbers
+        return '(' + ' '.join(words) + ')'
+    return ''.join(entry.split())
+
+def expand(entry):
+    """
+    Expand the ranges in a symbol into all of the symbols they cover.
+
+    entry: the symbol, where any number can be a range a..b (str)
+           '{3..10}', '(2 2 | 2..6)', '{3..5,3..5}' etc.
+    return: every symbol covered, the last range changing fastest (list)
+    """
+    parts = re.split(r'(\d+\.\.\d+)', entry)
+    choices = []
+    for i,part in enumerate(parts):
+        if i % 2 == 1:      # Odd parts are ranges, even parts are the rest
+            first, last = map(int, part.split('..'))
+            choices.append([str(n) for n in range(first, last + 1)])
+        else:
+            choices.append([part])
+    return [''.join(parts) for parts in itertools.product(*choices)]
+
+def place_bar(numbers, bar):
+    """
+    Place the bar of a Wythoff symbol.
+
+    numbers: the fundamental triangle numbers p, q, s (list, len=3)
+    bar: the position of the bar (str)
+         a = p q s      b = | p q s    c = p q s |
+         p = p | q s    q = q | s p    s = s | p q
+        pq = p q | s   qs = q s | p   sp = s p | q
+    return: the Wythoff symbol, spaced like canonical (str)
+    """
+    p, q, s = [str(x) for x in numbers]
+    places = {'a': [p,q,s], 'b': ['|',p,q,s], 'c': [p,q,s,'|'],
+              'p': [p,'|',q,s], 'q': [q,'|',s,p], 's': [s,'|',p,q],
+              'pq': [p,q,'|',s], 'qs': [q,s,'|',p], 'sp': [s,p,'|',q]}
+    return '(' + ' '.join(places[bar]) + ')'
+
 def satisfy_axis_restrictions(axis):
     """
     Make an axis in spherical coordinates satisfy the restrictions:
@@ -167,12 +298,79 @@ def convert(point, toCartesian):
             omega = math.acos(point[3]/r)
         return (r, theta, phi, omega)
 
+def picture_bases(viewAxis, zoom):
+    """
+    Find the bases of the picture hyperplane normal to the viewing axis.
 
+    viewAxis: the viewing axis in spherical coordinates (list, len=3)
+    zoom: the zoom of the camera (int)
+    return: the bases w, h, u as columns (np.ndarray, 4x3)
+            w and h are scaled by the zoom and RETINA, u is the view axis
+    """
+    so = math.sin(viewAxis[2])
+    co = math.cos(viewAxis[2])
+    sp = math.sin(viewAxis[1])
+    cp = math.cos(viewAxis[1])
+    st = math.sin(viewAxis[0])
+    ct = math.cos(viewAxis[0])
+
+    w = (-st, ct, 0, 0)                     # Directions of bases of
+    h = (cp*ct, cp*st, -sp, 0)              # the picture hyperplane
+    u = (so*sp*ct, so*sp*st, so*cp, co)     # Direction of viewAxis
+    # The third basis (-co*sp*ct, -co*sp*st, -co*cp, so) never shows up
+    # on the picture, so it is left out. Scale w and h by the zoom and the
+    # distance from the focus to the picture plane, since they're constant
+    scale = RETINA * zoom
+    return np.array([[x*scale for x in w], [x*scale for x in h], u]).T
+
+def project(points, bases, dist, centre):
+    """
+    Project 4D points on the plane normal to the viewing axis.
+    Each point i goes to where the line from the camera at dist*u
+    through i meets the picture plane, so by similar triangles,
+    its coordinates are (i.w, i.h) * RETINA / (dist - i.u) times zoom.
+
+    points: the points in Cartesian coordinates (list or np.ndarray, Nx4)
+    bases: the picture bases from picture_bases (np.ndarray, 4x3)
+    dist: the distance of the camera along the viewing axis (int)
+    centre: the picture coordinates of the viewing plane origin (tuple)
+    return: the picture coordinates of the points (np.ndarray, Nx2)
+            y-coordinates increase downwards, like on the canvas
+    """
+    whu = np.asarray(points, dtype=float).reshape(-1, 4).dot(bases)
+    scale = 1 / (dist - whu[:,2])
+    return np.column_stack((centre[0] + whu[:,0]*scale,
+                            centre[1] - whu[:,1]*scale))
 
-class Main(ttk.Frame):
+def shade_colours(hexcol, lcol, lint):
+    """
+    Find the colour of a face at every shade of the light.
+
+    hexcol: the colour of the face (str): '#rgb' or '#rrggbb'
+    lcol: the colour of the light, from 0 to 255 (list, len=3)
+    lint: the intensity of the light (float)
+    return: the colours from darkest to lightest (list, len=SHADESTEPS+1)
+            all elements are red, green, and blue from 0 to 255 (list)
+    """
+    digits = (len(hexcol) - 1) // 3     # Either #rgb or #rrggbb
+    base = []
+    for i in range(3):
+        deccol = int(hexcol[1+digits*i:1+digits*(i+1)], 16)
+        if digits == 1:     # Multiply deccol (0-15) by 16
+            deccol *= 16    # Since lcol is (0-255)
+        # Average base colour and light colour times intensity
+        # Then multiply result by shade and intensity again
+        base.append((deccol + lcol[i] * lint)/2 * lint)
+    return [[int(min(255, col * step / SHADESTEPS)) for col in base]
+            for step in range(SHADESTEPS + 1)]
+
+
+
+class Main():
 
     """
     GUI class that manages all windows and actions except the canvas.
+    Making one makes a ttk.Frame, loading Tk, see tk_class.
 
     Public methods:
     set_status          Display status changes on the status bar.
@@ -180,6 +378,8 @@ class Main(ttk.Frame):
     set_view            Change the current viewing axis and re-render.
     set_light           Change properties of the lighting and re-render.
     set_rotax           Change the rotation axis-plane and re-render.
+    key_down            Queue a rotation or distance step from a key.
+    key_up              Drop the queued steps of a released key.
     take_input          Take text input from input box.
     close               Close the program.
 
@@ -213,12 +413,16 @@ class Main(ttk.Frame):
     axes                To keep track of axes check (tk.BooleanVar)
     wire                To keep track of wire check (tk.BooleanVar)
     wireCheck           To allow the check to be disabled (ttk.Checkbutton)
+    profile             To keep track of profiler check (tk.BooleanVar)
     only3D              To know if only 3D mode is on (tk.BooleanVar)
     zoom                To keep track of the current zoom (tk.IntVar)
+    view                Plain copies of the variables rendering reads
+                            (ViewState)
     dist                To keep track of the current distance (tk.IntVar)
     unitDist            To change dist depending on the distance (int)
 
     Private methods:
+    __new__             Make a ttk.Frame that is also a Main.
     __init__            Construct Main class.
     _make_menus         Initialize dropdown menus.
     _make_popups        Create the actual pop-up windows.
@@ -226,10 +430,12 @@ class Main(ttk.Frame):
     _initUI             Initialize GUI placement and bind buttons.
     _collapse           Collapse the right sidebar.
     _valid              Ensure that scale entry inputs are valid.
-    _poll               Handle events when buttons are pressed.
-    _mouse_down
-    _mouse_up
-    _press
+    _mouse_down         Start animating when a button is held down.
+    _mouse_up           Stop animating when the button is released.
+    _press              Rotate, zoom, or move for one frame of animation.
+    _step               Change the zoom or distance by one step.
+    _drop_key           Drop the queued steps of a key still released.
+    _flush_keys         Rotate or move by all queued steps at once.
     _set_style          Set consistent background colours.
 
     Private variables:
@@ -237,22 +443,37 @@ class Main(ttk.Frame):
     _menuBar                                                      (tk.Menu)
     _fileMenu                                                     (tk.Menu)
     _inputBox                                                     (tk.Entry)
-    _mousePressed       To keep track of when mouse is pressed down (bool)
     _leftBtn            To avoid garbage collection (tk.PhotoImage)
     _rightBtn
     _upBtn
     _downBtn
-    _after_pollID       To call _poll again after DELAY milliseconds (str)
+    _scheduler          To animate while a button is held (Scheduler)
+    _steps              The zoom or distance steps owed so far (float)
+    _keyScheduler       To apply queued key steps once a frame (Scheduler)
+    _keys               The queued steps of each held key (dict)
+                            keys are the buttons of the keys (str)
+                            values are radians or distance steps (float)
+    _held               The keys held down, even while repeating (set)
+    _released           The keys released since their last press (set)
     """
 
+    def __new__(cls, *args, **kwargs):
+        """Make a ttk.Frame that is also an instance of cls."""
+        return super().__new__(tk_class(cls, ttk.Frame))
+
     def __init__(self, parent):
         """
         Construct Main class.
         parent: the parent of main (tk.Tk)
         """
         self.cols = COLOURS
-        self._mousePressed = False
         self.parent = parent
+        self._scheduler = Scheduler(self.parent, FRAMERATE)
+        self._steps = 0
+        self._keyScheduler = Scheduler(self.parent, FRAMERATE)
+        self._keys = {}
+        self._held = set()
+        self._released = set()
         self.parent.title(TITLE)
         self.parent.geometry(
             '{}x{}+{}+{}'.format(
@@ -277,6 +498,11 @@ class Main(ttk.Frame):
                                    command=lambda: self._make_popups('About'))
         self._fileMenu.add_command(label='Help', underline=0,
                                    command=lambda: self._make_popups('Help'))
+        # Show how long each frame takes to render on the canvas
+        self.profile = tk.BooleanVar()
+        self._fileMenu.add_checkbutton(label='Profiler', underline=0,
+            variable=self.profile,
+            command=lambda: self.canvas.set_profiler(self.profile.get()))
         self._fileMenu.add_command(label='Exit', underline=1,
                                    command=self.close)
         self._menuBar.add_cascade(label='File', menu=self._fileMenu,
@@ -455,15 +681,18 @@ class Main(ttk.Frame):
 
         popUpFrame.destroy()    # Can't put multiple statements in a lambda
         self._set_style()
+        if popUpType == 'Face':
+            self.canvas.clear_palette()
+            self.canvas.invalidate()
 
     def _initUI(self):
         # Initialize GUI placement and bind buttons.
 
         # Must keep references to avoid garbage-collection
-        self._leftBtn = tk.PhotoImage(file='left.gif')
-        self._rightBtn = tk.PhotoImage(file='right.gif')
-        self._upBtn = tk.PhotoImage(file='up.gif')
-        self._downBtn = tk.PhotoImage(file='down.gif')
+        self._leftBtn = tk.PhotoImage(file=os.path.join(IMAGES, 'left.gif'))
+        self._rightBtn = tk.PhotoImage(file=os.path.join(IMAGES, 'right.gif'))
+        self._upBtn = tk.PhotoImage(file=os.path.join(IMAGES, 'up.gif'))
+        self._downBtn = tk.PhotoImage(file=os.path.join(IMAGES, 'down.gif'))
 
         # Grid main widget frames
         # On left: title on top, canvas on middle, guiBottom on bottom
@@ -762,6 +991,7 @@ class Main(ttk.Frame):
         # Set consistent background colour to all ttk widgets
         self._style = ttk.Style()
         self._set_style()
+        self.view = ViewState(self)     # After all its variables exist
         self.change('r')    # Initialize all properties with default values
 
     def _collapse(self, sidebar):
@@ -818,29 +1048,27 @@ class Main(ttk.Frame):
             return False        # Out of from_ and to bounds, is invalid
         return True             # Otherwise, is valid
 
-    def _poll(self, button):
-        # Call _press every HELAY milliseconds while mouse is held down.
-        # after(t, foo, arg) calls foo(arg) once after t ms and returns an ID
-        # after calls _poll when mouse pressed, which calls _press every t ms
-        if self._mousePressed:
-            self._press(button)
-            self._after_pollID = self.parent.after(DELAY, self._poll, button)
     def _mouse_down(self, button):
-        # Call _poll when mouse is held down.
-        self._mousePressed = True
-        self._poll(button)
+        # Call _press every frame while mouse is held down.
+        # button: the button that is held (str), see _press
+        self._steps = 1         # Step once straight away, like a click
+        self._scheduler.start(lambda elapsed: self._press(button, elapsed))
     def _mouse_up(self, event):
-        # Stop _poll when mouse is released.
-        self._mousePressed = False
-        self.parent.after_cancel(self._after_pollID)    # Cancel polling
-    def _press(self, button):
-        # Handle events when buttons are pressed.
-        # button: the button that is pressed (str)
+        # Stop calling _press when mouse is released.
+        self._scheduler.stop()
+    def _press(self, button, elapsed):
+        # Rotate, zoom, or move as far as the time since the last frame.
+        # button: the button that is held (str)
         #         'r0', 'r1', 'z+', 'z-', 'd+', 'd-'
+        # elapsed: the seconds since the last frame (float)
         if button[0] == 'r':
-            self.canvas.rotate(int(button[1]))
-        else:
-            self.change(button)
+            self.canvas.rotate(int(button[1]), ROTSPEED * elapsed)
+        else:   # Only whole steps, saving the rest for the next frame
+            self._steps += STEPRATE * elapsed
+            steps = int(self._steps)
+            if steps > 0:
+                self._steps -= steps
+                self.change(button, steps)
 
     def _set_style(self):
         # Set consistent background colour to all widgets
@@ -908,6 +1136,8 @@ class Main(ttk.Frame):
                     faceText += str(faces[i]) + ' ' + POLYGONS[i] + ' '
                 if faces[i] > 1:
                     faceText += str(faces[i]) + ' ' + POLYGONS[i] + 's '
+            hits, misses = self.canvas.get_data('cache')
+            faceText += '(cached: {} hits, {} misses)'.format(hits, misses)
             self.statusText.set(faceText)
         else:
             if event == 'clear':
@@ -922,6 +1152,8 @@ class Main(ttk.Frame):
         change: the type of change to make (str)
                 'b', 'w', 'y', '3', 's', 'r', 'z+', 'z-', 'd+', 'd-'
         value: the value to change to (float), default 0
+               or for zoom and distance, the number of steps (int),
+               default 0 for one step
         """
         if change == None:      # When checkboxes are ticked, just re-render
             pass
@@ -1011,11 +1243,11 @@ class Main(ttk.Frame):
             try:                # Canvas initializes before zoom
                 self.canvas.make_polytope(None)
                 self.set_view([0, 0, pi/2])
-                self.set_light([255,255,255])
                 self.set_rotax('xw')
                 self.lint.set('{0:.2f}'.format(1))
                 self.ltheta.set('{0:.2f}'.format(0))
                 self.lphi.set('{0:.2f}'.format(0))
+                self.set_light([255,255,255])   # After intensity is set
                 self.zoom.set(ZOOM) # Set initial zoom to ZOOM
                 self.unitDist = 20  # Set initial distance to 20 from max
                 # unitDist changes by one per button press, between 1 and 100
@@ -1031,7 +1263,17 @@ class Main(ttk.Frame):
             except:
                 return
 
-        elif change == 'z+':    # Change zoom, explained in the constants
+        elif change in ('z+', 'z-', 'd+', 'd-'):
+            # A slow frame may owe several steps, but only renders once
+            for step in range(max(1, int(value))):
+                self._step(change)
+
+        self.canvas.invalidate()
+
+    def _step(self, change):
+        # Change the zoom or distance by one step, without re-rendering.
+        # change: the type of step to take (str), 'z+', 'z-', 'd+', 'd-'
+        if change == 'z+':      # Change zoom, explained in the constants
             self.zoom.set(int(min(self.zoom.get() + 5, ZOOM*RADIUS*RETINA/2)))
             if self.zoom.get() == 6:
                 self.zoom.set(5)    # Keep everything a multiple of 5
@@ -1056,8 +1298,6 @@ class Main(ttk.Frame):
                 and self.canvas.get_data('star') == False):
                 self.wireCheck.config(state=tk.NORMAL)
 
-        self.canvas.render()
-
     def set_view(self, viewAxis):
         """
         Change the current viewing axis and re-render.
@@ -1067,7 +1307,7 @@ class Main(ttk.Frame):
         self.vtheta.set('{0:.2f}'.format(viewAxis[0]))
         self.vphi.set('{0:.2f}'.format(viewAxis[1]))
         self.vomega.set('{0:.2f}'.format(viewAxis[2]))
-        self.canvas.render()
+        self.canvas.invalidate()
 
     def set_light(self, lcol):
         """
@@ -1080,7 +1320,8 @@ class Main(ttk.Frame):
             self.lblue.set('{0:.0f}'.format(lcol[2]))
         except:
             pass    # Light colour scales not loaded yet, fix this soon!
-        self.canvas.render()
+        self.canvas.clear_palette()     # Light intensity may have changed too
+        self.canvas.invalidate()
 
     def set_rotax(self, rotAxis):
         """
@@ -1118,7 +1359,55 @@ class Main(ttk.Frame):
             u[i].set('{0:.2f}'.format(rotuAxis[i]))
             v[i].set('{0:.2f}'.format(rotvAxis[i]))
         self.canvas.set_rotaxes((rotuAxis, rotvAxis))
-        self.canvas.render()
+        self.canvas.invalidate()
+
+    def key_down(self, button):
+        """
+        Queue a rotation or distance step when a key is pressed or repeats.
+        Queued steps are added up and applied once per frame, so keys that
+        repeat faster than frames render do not fall behind, but the first
+        press of a key is applied straight away, so a tap is never dropped.
+        button: the button the key acts as (str), 'r0', 'r1', 'd+', 'd-'
+        """
+        self._released.discard(button)
+        step = ROTANGLE if button[0] == 'r' else 1
+        self._keys[button] = self._keys.get(button, 0) + step
+        if not self._keyScheduler.is_running():
+            self._keyScheduler.start(self._flush_keys)
+        elif button not in self._held:
+            self._flush_keys(0)
+        self._held.add(button)
+
+    def key_up(self, button):
+        """
+        Drop the queued steps of a released key, so nothing moves after it.
+        Auto-repeat may release and press the key again at once, so only
+        drop them if the key is still released when the events run out.
+        button: the button the key acts as (str), 'r0', 'r1', 'd+', 'd-'
+        """
+        self._released.add(button)
+        self.parent.after_idle(self._drop_key, button)
+
+    def _drop_key(self, button):
+        # Drop the queued steps of a key, unless it was pressed again.
+        # button: the button the key acts as (str), see key_down
+        if button in self._released:
+            self._released.discard(button)
+            self._held.discard(button)
+            self._keys.pop(button, None)
+
+    def _flush_keys(self, elapsed):
+        # Rotate or move by all queued steps at once, one render each.
+        # elapsed: the seconds since the last frame (float), unused
+        if not self._keys:      # Nothing queued since the last frame
+            self._keyScheduler.stop()
+            return
+        angle = self._keys.pop('r0', 0) - self._keys.pop('r1', 0)
+        steps = self._keys.pop('d-', 0) - self._keys.pop('d+', 0)
+        if angle:               # Positive angles rotate left, like rotate(0)
+            self.canvas.rotate(0, angle)
+        if steps:
+            self.change('d-' if steps > 0 else 'd+', abs(steps))
 
     def take_input(self, event):
         """Take text input from input box."""
@@ -1142,13 +1431,62 @@ class Main(ttk.Frame):
 
 
 
+class ViewState():
+
+    """
+    Helper class that keeps plain copies of the Tk variables read by the
+    canvas every frame, so rendering never has to ask Tcl for them. Each
+    copy is updated by a trace whenever its variable is set, and keeps its
+    last good value while an entry box holds something that is not a number.
+
+    Public variables:
+    vtheta vphi vomega  The camera location (floats)
+    ltheta lphi lint    The light location and intensity (floats)
+    lred lgreen lblue   The light colour (floats)
+    dist zoom           The camera distance and zoom (ints)
+    wire sphere axes    The wire, sphere, and axes checks (bools)
+
+    Private methods:
+    __init__            Construct ViewState class.
+    _watch              Copy a variable now and whenever it is set.
+    """
+
+    __slots__ = ('vtheta', 'vphi', 'vomega', 'ltheta', 'lphi', 'lint',
+                 'lred', 'lgreen', 'lblue', 'dist', 'zoom',
+                 'wire', 'sphere', 'axes')
+
+    def __init__(self, parent):
+        """
+        Construct ViewState class.
+        parent: the owner of the Tk variables with the same names (Main)
+        """
+        for name in self.__slots__:
+            self._watch(name, getattr(parent, name))
+
+    def _watch(self, name, variable):
+        # Copy a variable now and whenever it is set.
+        # name: the name of the copy (str)
+        # variable: the variable to copy (tk.Variable)
+        def update(*args):
+            try:
+                setattr(self, name, variable.get())
+            except (tk.TclError, ValueError):
+                pass    # Keep the last good value until the entry is fixed
+        update()
+        try:
+            variable.trace_add('write', update)
+        except AttributeError:  # Python 3.5 only has the older trace
+            variable.trace('w', update)
+
+
+
 class Creator():
 
     """
     Mathematical class that manages polytope creation.
 
     Public methods:
-    get_polytope        Get the polytope created during initialization.
+    get_polytope        Get a copy of the polytope made during initialization.
 
     Private methods:
     __init__            Construct Creator class.
@@ -1156,7 +1494,10 @@ class Creator():
     _schlafli3D         Create a polyhedron using a 3D Schlafli symbol.
     _wythoff            Create a polyhedron using a Wythoff symbol.
     _wythoff_snub       Find the generating point of a snub polyhedron.
+    _snub_newton        Make the sides of a snub's reflected triangle equal.
+    _snub_sides         Find the sides of a snub's reflected triangle.
     _schwarz            Reflect the generating point everywhere.
+    _coxeter            Enumerate the reflection group of a Schwarz triangle.
 
     Private variables:
     _polytope           The polytope created during initialization (Polytope)
@@ -1164,14 +1505,22 @@ class Creator():
     _noSnub             To keep track of if the snub does not exist (bool)
     """
 
-    def __init__(self, entry):
+    def __init__(self, entry, library=None):
         """
         Construct Creator class.
         entry: the text input (str): '{d}', '{d/d}', '{d,d}', '(d | d d)' etc.
+        library: where to load the polytope from, and save it to if it
+                 has to be created (Library), default None to always create
         """
         self._polytope = None
         self._currWythoff = None
         self._noSnub = False
+        if library is not None:
+            saved = library.load(entry)
+            if saved is not None:
+                self._polytope, self._currWythoff, self._noSnub = saved
+                return
+
         if entry.startswith('{') and entry.endswith('}'):
             try:
                 if ',' in entry:
@@ -1183,27 +1532,27 @@ class Creator():
 
         elif entry.startswith('(') and entry.endswith(')'):
             try:
-                if entry[1] == '|':
-                    # Las Vegas algorithm, repeat until success
-                    while self._polytope == None:
-                        points, edges, colours, self._currWythoff, \
-                            self._noSnub = self._wythoff(entry[1:-1])
-                        self._polytope = Polytope([points, edges, colours])
-                else:
-                    points, edges, colours, self._currWythoff, \
-                        self._noSnub = self._wythoff(entry[1:-1])
-                    self._polytope = Polytope([points, edges, colours])
+                points, edges, colours, self._currWythoff, \
+                    self._noSnub = self._wythoff(entry[1:-1])
+                self._polytope = Polytope([points, edges, colours])
             except ValueError:
                 self._polytope = None
         else:
             self._polytope = None
 
+        if library is not None and self._polytope is not None:
+            library.save(entry, self._polytope, self._currWythoff,
+                         self._noSnub)
+
     def get_polytope(self):
         """
-        Get the polytope created during initialization.
+        Get an unrotated copy of the polytope created during initialization.
         return: the polytope created during initialization (Polytope)
+                or None if the entry was not a valid symbol
         """
-        return self._polytope
+        if self._polytope is None:
+            return None
+        return self._polytope.copy()
 
     def get_wythoff(self):
         """
@@ -1369,6 +1718,18 @@ class Creator():
         if p == 1 or q == 1 or s == 1:  # Cannot have pi angle
             raise ValueError
 
+        # Find the order of the reflection group from the numerators, which
+        # are the orders of the rotations about each vertex of the triangle
+        numers = sorted([int(x.split('/')[0]) for x in symbol])
+        if numers[1] == 2:      # Dihedral, (2 2 n)
+            order = 4 * numers[2]
+        elif 5 in numers:       # Icosahedral
+            order = 120
+        elif 4 in numers:       # Octahedral
+            order = 48
+        else:                   # Tetrahedral
+            order = 24
+
         # Check Wythoff symbol validity, then save current Wythoff polyhedron
         lpq = math.acos((math.cos(pi/s) + math.cos(pi/p)*math.cos(pi/q))/
                         (math.sin(pi/p)*math.sin(pi/q)))
@@ -1472,8 +1833,8 @@ class Creator():
 
         # Find actual points, given fundamental triangle and generating point
         if selection == 'b':    # Find generating point of snub polyhedron
-            n = self._wythoff_snub(p, q, s)
-        points, side = self._schwarz(selection, triangles, n)
+            n = self._wythoff_snub(p, q, s, order)
+        points, side = self._schwarz(selection, triangles, n, order)
 
         # Connect all points to neighbours if Catalan solid
         if selection == 'a':
@@ -1487,27 +1848,28 @@ class Creator():
         # Connect all points to points side away if uniform polyhedron
         else:
             colours = [(k, 0) for k in range(len(points))]
-            for i in range(len(points)):
-                for j in range(i+1, len(points)):
-                    if abs(distance2(points[i], points[j]) - side) < 2:
-                        edges.append((i,j))
+            for i,j in pairs_within(points, math.sqrt(side + 2)):
+                if abs(distance2(points[i], points[j]) - side) < 2:
+                    edges.append((i,j))
         # Use sorted symbol for consistency with set_bar
         return points, edges, colours, sorted(symbol), noSnub
 
-    def _wythoff_snub(self, p, q, s):
+    def _wythoff_snub(self, p, q, s, order):
         # Find the generating point of a snub Wythoff polyhedron.
+        # The point is where the three points reflected from it are
+        # equally far apart. Newton's method finds it from the best points
+        # of a coarse grid, skipping points on mirrors, which have equal
+        # sides but reflect into smaller polyhedra.
         # p, q, s: the Wythoff numbers of the polyhedron (floats)
+        # order: the order of the reflection group (int)
         # return: the generating point in Cartesian coordinates (list, len=4)
+        # raise: ValueError if there is no such point
 
         # Hard-coded constants
         r = RADIUS
-        snubdepth = 4
-        snubfreq = 1024
-        snubradius = pi/8
-        snubdiv = 8
+        snubtries = 16      # Most grid points to start Newton's method from
         snubtheta = 0.1
         snubphi = 0.1
-        variance = 1e16
 
         # Check Wythoff symbol validity
         lpq = math.acos((math.cos(pi/s) + math.cos(pi/p)*math.cos(pi/q))/
@@ -1524,81 +1886,100 @@ class Creator():
         op = triangles[0][0]
         oq = triangles[0][1]
         os = triangles[0][2]
-        pq = cross3D(op, oq)
-        qs = cross3D(oq, os)
-        sp = cross3D(os, op)
+        normals = [cross3D(oq, os), cross3D(os, op), cross3D(op, oq)]
+        levels = self._coxeter(triangles[0], order)
+        odd = [element for level in levels[1::2] for element in level]
 
-        # Systematically divide fundamental triangle to find closest region
+        # Systematically divide fundamental triangle to find closest regions
+        grid = []
         phi = max(lsp, lpq)
         while phi > 0:
             theta = pi/p
             while theta > 0:
-                on = convert((r, theta, phi, pi/2), True)
-                knp = sum([on[t]*qs[t] for t in range(3)])
-                knq = sum([on[t]*sp[t] for t in range(3)])
-                kns = sum([on[t]*pq[t] for t in range(3)])
-                newnp = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*knp*qs[t] for t in range(3)]]
-                newnq = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*knq*sp[t] for t in range(3)]]
-                newns = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*kns*pq[t] for t in range(3)]]
-                dpq = sum((newnp[t] - newnq[t])**2 for t in range(3))
-                dqs = sum((newnq[t] - newns[t])**2 for t in range(3))
-                dsp = sum((newns[t] - newnp[t])**2 for t in range(3))
+                dpq, dqs, dsp = self._snub_sides((theta, phi), normals)
                 mean = (dpq + dqs + dsp)/3
                 var = (dpq-mean)**2 + (dqs-mean)**2 + (dsp-mean)**2
-                if var < variance:
-                    variance = var
-                    n = on
+                grid.append((var, (theta, phi)))
                 theta -= snubtheta/phi
             phi -= snubphi
+        grid.sort()
+
+        # Solve from the closest regions first, until a solution is good
+        # A good point has sides that are equal and reflects to a new point
+        # under every odd element, so it is not on any mirror
+        # If every point with equal sides is on a mirror, like (| 4 3/2 2),
+        # the snub is degenerate, so use the first one anyway
+        degenerate = None
+        for var, angles in grid[:snubtries]:
+            angles, sides = self._snub_newton(angles, normals)
+            if max(sides) - min(sides) > EPSILON * max(sides):
+                continue
+            on = convert((r, angles[0], angles[1], pi/2), True)
+            if len({snap(element @ on[:3]) for element in odd}) == len(odd):
+                return on
+            if degenerate is None:
+                degenerate = on
+        if degenerate is None:
+            raise ValueError
+        return degenerate
 
-        # Randomly sample the region to find the closest point
-        while snubdepth > 0:
-            trials = snubfreq
-            n = convert(n, False)
-            thetalow = n[1] - snubradius
-            thetahigh = n[1] + snubradius
-            philow = n[2] - snubradius
-            phihigh = n[2] + snubradius
-            if thetalow < 0:
-                thetalow = 0
-            if thetahigh > pi/p:
-                thetahigh = pi/p
-            if philow < 0:
-                philow = 0
-            if phihigh > max(lsp, lpq):
-                phihigh = max(lsp, lpq)
-            while trials > 0:
-                # Find random points in spherical coordinates
-                randtheta = random.uniform(thetalow, thetahigh)
-                randphi = random.uniform(philow, phihigh)
-                on = convert((r, randtheta, randphi, pi/2), True)
-                # Convert to Cartesian coordinates and check if it works
-                knp = sum([on[t]*qs[t] for t in range(3)])
-                knq = sum([on[t]*sp[t] for t in range(3)])
-                kns = sum([on[t]*pq[t] for t in range(3)])
-                newnp = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*knp*qs[t] for t in range(3)]]
-                newnq = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*knq*sp[t] for t in range(3)]]
-                newns = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*kns*pq[t] for t in range(3)]]
-                dpq = sum((newnp[t] - newnq[t])**2 for t in range(3))
-                dqs = sum((newnq[t] - newns[t])**2 for t in range(3))
-                dsp = sum((newns[t] - newnp[t])**2 for t in range(3))
-                mean = (dpq + dqs + dsp)/3
-                var = (dpq-mean)**2 + (dqs-mean)**2 + (dsp-mean)**2
-                if var < variance:
-                    variance = var
-                    n = on
-                trials -= 1
-            snubradius /= snubdiv
-            snubdepth -= 1
-        return n
-
-    def _schwarz(self, selection, triangles, n):
+    def _snub_newton(self, angles, normals):
+        # Make the sides of a snub's reflected triangle equal with Newton.
+        # angles: the starting point's theta and phi (tuple, len=2)
+        # normals: the unit normals of the great circles qs, sp, pq (list)
+        # return: the final angles (tuple, len=2) and sides (list, len=3)
+
+        # Hard-coded constants
+        snubsteps = 64      # Most Newton steps to take
+        snubhalves = 32     # Most times to halve a step that does not help
+        snubdelta = 1e-7    # Angle to differentiate with
+
+        sides = self._snub_sides(angles, normals)
+        f = [sides[0] - sides[1], sides[1] - sides[2]]
+        for step in range(snubsteps):
+            # Find the Jacobian by forward differences
+            jac = [[0, 0], [0, 0]]
+            for j in range(2):
+                near = list(angles)
+                near[j] += snubdelta
+                dpq, dqs, dsp = self._snub_sides(near, normals)
+                jac[0][j] = (dpq - dqs - f[0])/snubdelta
+                jac[1][j] = (dqs - dsp - f[1])/snubdelta
+            det = jac[0][0]*jac[1][1] - jac[0][1]*jac[1][0]
+            if det == 0:
+                break
+            dtheta = (f[0]*jac[1][1] - f[1]*jac[0][1])/det
+            dphi = (f[1]*jac[0][0] - f[0]*jac[1][0])/det
+
+            # Take the whole step, unless it makes the sides less equal
+            for half in range(snubhalves):
+                new = (angles[0] - dtheta, angles[1] - dphi)
+                newSides = self._snub_sides(new, normals)
+                fnew = [newSides[0] - newSides[1], newSides[1] - newSides[2]]
+                if distance2(fnew) < distance2(f):
+                    break
+                dtheta /= 2
+                dphi /= 2
+            else:
+                break       # Converged as far as floats allow
+            angles, sides, f = new, newSides, fnew
+        return angles, sides
+
+    def _snub_sides(self, angles, normals):
+        # Find the sides of the triangle of points reflected from a point.
+        # angles: the point's theta and phi on the sphere (tuple, len=2)
+        # normals: the unit normals of the great circles qs, sp, pq (list)
+        # return: the sides pq, qs, sp squared (list, len=3)
+        on = convert((RADIUS, angles[0], angles[1], pi/2), True)
+        new = []
+        for normal in normals:  # Reflect the point across each great circle
+            k = sum([on[t]*normal[t] for t in range(3)])
+            new.append([0.0 if abs(x) < EPSILON else x for x in
+                        [on[t] - 2*k*normal[t] for t in range(3)]])
+        return [sum([(new[i][t] - new[i-2][t])**2 for t in range(3)])
+                for i in range(3)]
+
+    def _schwarz(self, selection, triangles, n, order):
         # Reflect the generating point everywhere.
         # selection: the lype of reflection (str)
         #            a = reflect every triangle vertex
@@ -1608,117 +1989,319 @@ class Creator():
         #            all elements are lists of vertices (list, len=3)
         #            all vertices are in Cartesian coordinates (list, len=4)
         # n: the generating point in Cartesian coordinates (list, len=4)
+        # order: the order of the reflection group (int)
         # return: the points and side length squared (list, len=2)
         #         the points are in a list of vertices (list)
         #         all vertices are in Cartesian coordinates (list, len=4)
 
-        depth = 16  # Depth to reflect until
-        side = 0    # Length of the sides
-
-        triangles[0].append(n)
         points = [n]    # Points in the final polyhedron
+        pointcoords = {snap(n)}
         if selection == 'b':
             points = [] # Generating point of snub polyhedron not included
+            pointcoords = set()
 
-        # Identification system without negative zeros to test membership
-        numa = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*triangles[0][0])
-        numb = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*triangles[0][1])
-        numc = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*triangles[0][2])
-        numn = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*triangles[0][3])
-        tricoords = [''.join(sorted([numa, numb, numc]))+numn]
-        pointcoords = [numn]
-
-        # Reflect each unreflected triangle once in each side
-        while depth > 0:
-            for triangle in reversed(triangles):    # Reversed makes a queue
-                if selection == 'a':    # Add all points of all triangles
-                    points.extend([triangle[t] for t in range(3)])
-
-                # Find normals to great circles
-                op = triangle[0]
-                oq = triangle[1]
-                os = triangle[2]
-                on = triangle[3]
-                qs = cross3D(oq, os)
-                sp = cross3D(os, op)
-                pq = cross3D(op, oq)
-
-                # Reflect points across great circles
-                # |qs| = 1, oq.qs = 0, and k = -op.qs
-                kp = sum([op[t]*qs[t] for t in range(3)])
-                kq = sum([oq[t]*sp[t] for t in range(3)])
-                ks = sum([os[t]*pq[t] for t in range(3)])
-                knp = sum([on[t]*qs[t] for t in range(3)])
-                knq = sum([on[t]*sp[t] for t in range(3)])
-                kns = sum([on[t]*pq[t] for t in range(3)])
-                newp = [0.0 if abs(x) < EPSILON else x for x in
-                        [op[t] - 2*kp*qs[t] for t in range(3)]] + [0]
-                newq = [0.0 if abs(x) < EPSILON else x for x in
-                        [oq[t] - 2*kq*sp[t] for t in range(3)]] + [0]
-                news = [0.0 if abs(x) < EPSILON else x for x in
-                        [os[t] - 2*ks*pq[t] for t in range(3)]] + [0]
-                newnp = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*knp*qs[t] for t in range(3)]] + [0]
-                newnq = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*knq*sp[t] for t in range(3)]] + [0]
-                newns = [0.0 if abs(x) < EPSILON else x for x in
-                         [on[t] - 2*kns*pq[t] for t in range(3)]] + [0]
-
-                # Identify triangle points with unique coordinate strings
-                nump = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*op)
-                numq = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*oq)
-                nums = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*os)
-                nuwp = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*newp)
-                nuwq = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*newq)
-                nuws = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*news)
-                nuwnp = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*newnp)
-                nuwnq = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*newnq)
-                nuwns = '{:=+04.0f}{:=+04.0f}{:=+04.0f}'.format(*newns)
-
-                # Make new triangles from results and remove old triangle
-                numa = ''.join(sorted([nuwp, numq, nums])) + nuwnp
-                numb = ''.join(sorted([nump, nuwq, nums])) + nuwnq
-                numc = ''.join(sorted([nump, numq, nuws])) + nuwns
-                if numa not in tricoords:
-                    tricoords.append(numa)
-                    triangles.append([newp, oq, os, newnp])
-                    if nuwnp not in pointcoords:
-                        if selection != 'b' or depth % 2 != 1:
-                            points.append(newnp)
-                        pointcoords.append(nuwnp)
-                if numb not in tricoords:
-                    tricoords.append(numb)
-                    triangles.append([op, newq, os, newnq])
-                    if nuwnq not in pointcoords:
-                        if selection != 'b' or depth % 2 != 1:
-                            points.append(newnq)
-                        pointcoords.append(nuwnq)
-                if numc not in tricoords:
-                    tricoords.append(numc)
-                    triangles.append([op, oq, news, newns])
-                    if nuwns not in pointcoords:
-                        if selection != 'b' or depth % 2 != 1:
-                            points.append(newns)
-                        pointcoords.append(nuwns)
-                triangles.remove(triangle)
-
-                # Find the square of the side length
-                if side == 0:
-                    if selection == 'a':
-                        side = 1
-                    elif selection == 'b':
-                        side = sum([(newnp[t]-newnq[t])**2 for t in range(3)])
-                    else:
-                        side = (max(knp, knq, kns)*2)**2
-            depth -= 1
+        # Find the square of the side length from the fundamental triangle
+        op, oq, os = triangles[0]
+        qs = cross3D(oq, os)
+        sp = cross3D(os, op)
+        pq = cross3D(op, oq)
+        knp = sum([n[t]*qs[t] for t in range(3)])
+        knq = sum([n[t]*sp[t] for t in range(3)])
+        kns = sum([n[t]*pq[t] for t in range(3)])
+        if selection == 'a':
+            side = 1
+        elif selection == 'b':
+            side = sum([((n[t] - 2*knp*qs[t]) - (n[t] - 2*knq*sp[t]))**2
+                        for t in range(3)])
+        else:
+            side = (max(knp, knq, kns)*2)**2
+
+        # Map the triangle and the generating point by every group element
+        corners = np.array(triangles[0], dtype=float)[:,:3].T
+        levels = self._coxeter(triangles[0], order)
+        for length, level in enumerate(levels):
+            if selection == 'a':    # Add all points of all triangles
+                for element in reversed(level):
+                    points.extend([[0.0 if abs(x) < EPSILON else x
+                                    for x in vertex] + [0] for vertex in
+                                   (element @ corners).T.tolist()])
+            elif length > 0:        # Add each new reflected generating point
+                if selection == 'b' and length % 2 == 0:
+                    continue        # Snubs only take every other point
+                for element in level:
+                    point = [0.0 if abs(x) < EPSILON else x for x in
+                             (element @ n[:3]).tolist()] + [0]
+                    if snap(point) not in pointcoords:
+                        points.append(point)
+                        pointcoords.add(snap(point))
         return points, side
 
+    def _coxeter(self, triangle, order):
+        # Enumerate the reflection group generated by a Schwarz triangle.
+        # Elements are words in the reflections in the sides opposite p, q
+        # and s, and a word is new if it moves the triangle somewhere new.
+        # Stop as soon as the group is complete, no matter how long words are.
+        # triangle: the fundamental triangle (list, len=3)
+        #           all vertices are in Cartesian coordinates (list, len=4)
+        # order: the order of the reflection group (int)
+        # return: the group elements sorted by word length (list)
+        #         all elements are lists of the elements of that length,
+        #         each the matrix that maps the fundamental triangle to
+        #         one of its images (np.ndarray, 3x3)
+        corners = np.array(triangle, dtype=float)[:,:3].T
+        mirrors = []
+        for i in range(3):  # Reflect across the side opposite each vertex
+            normal = np.array(cross3D(triangle[i-2], triangle[i-1]))
+            mirrors.append(np.eye(3) - 2*np.outer(normal, normal))
+
+        # Breadth-first search of the Cayley graph, one word length at a time
+        # Words of each length are extended from last to first, p, q, then s
+        levels = [[np.eye(3)]]
+        images = {tuple([snap(v) for v in corners.T])}
+        count = 1
+        while count < order and levels[-1]:
+            level = []
+            for element in reversed(levels[-1]):
+                for mirror in mirrors:
+                    new = element @ mirror
+                    image = new @ corners
+                    image[abs(image) < EPSILON] = 0.0
+                    image = tuple([snap(v) for v in image.T])
+                    if image not in images and count < order:
+                        images.add(image)
+                        level.append(new)
+                        count += 1
+            levels.append(level)
+        return levels
+
+
+
+class Cache():
+
+    """
+    Mathematical class that remembers the most recently created polytopes.
+
+    Public methods:
+    get_creator         Return the creator of a symbol, creating it if needed.
+    get_counts          Return the number of cache hits and misses.
+
+    Private methods:
+    __init__            Construct Cache class.
+
+    Private variables:
+    _library            Where creators load and save polytopes (Library)
+    _creators           The remembered creators, least recently used first
+                            keys are canonical symbols (str)
+                            values are creators of those symbols (Creator)
+    _size               The most creators to remember at once (int)
+    _hits               The number of symbols that were remembered (int)
+    _misses             The number of symbols that had to be created (int)
+    """
+
+    def __init__(self, size, library=None):
+        """
+        Construct Cache class.
+        size: the most creators to remember at once (int), > 0
+        library: where creators load and save polytopes (Library)
+                 default None to always create them
+        """
+        self._library = library
+        self._creators = collections.OrderedDict()
+        self._size = size
+        self._hits = 0
+        self._misses = 0
+
+    def get_creator(self, entry):
+        """
+        Return the creator of a symbol, creating it if needed.
+        entry: the text input (str): '{d}', '{d/d}', '{d,d}', '(d | d d)' etc.
+        return: the creator of the symbol written in a standard way (Creator)
+                its polytopes are copies, so they can be rotated freely
+        """
+        symbol = canonical(entry)
+        if symbol in self._creators:
+            self._hits += 1
+            self._creators.move_to_end(symbol)
+        else:
+            self._misses += 1
+            self._creators[symbol] = Creator(symbol, self._library)
+            if len(self._creators) > self._size:
+                self._creators.popitem(last=False)  # Least recently used
+        return self._creators[symbol]
+
+    def get_counts(self):
+        """
+        Return the number of cache hits and misses.
+        return: the number of hits and the number of misses (tuple, len=2)
+        """
+        return self._hits, self._misses
+
+
 
+class Library():
 
-class Canvas(tk.Canvas):
+    """
+    Storage class that saves created polytopes to disk between runs.
+    Every polytope is saved in its own file, as a header followed by
+    little-endian arrays, which are read back through a memory map:
+        header          format, source and data checksums, RADIUS,
+                        and the array lengths
+        wythoff         the fundamental triangle numbers (ascii, padded)
+        points          the pristine points (float64, Nx4)
+        edges           the pairs of point indices (int32, Ex2)
+        colours         the points and their colours (int32, Cx2)
+        faceSides       the number of each polygon type, 3 to 20 (int32, 18)
+        faceTypes       the polygon type of each face (int32, F)
+        faceStarts      where the points of each face start (int32, F+1)
+        corners         the points of every face in order (int32)
+    The source checksum is the CRC-32 of this file, so any change to the
+    program that could make different polytopes makes every saved file
+    out of date, and the data checksum is the CRC-32 of everything after
+    the header, so damaged files are found too. Files of another format,
+    source, or RADIUS, or whose data does not match, are not loaded,
+    so their polytopes are created again and the files replaced.
+    The folder is only made when the first polytope is saved.
+
+    Public methods:
+    load                Load a saved polytope, if it is up to date.
+    save                Save a polytope to disk.
+
+    Private methods:
+    __init__            Construct Library class.
+    _path               Find the file a symbol is saved in.
+
+    Private variables:
+    _folder             The folder to save polytopes in (str)
+                            None to save nothing
+    _source             The CRC-32 of this file (int)
+    _format             The version of the file format (int)
+    _magic              The first bytes of every file (bytes)
+    _header             The layout of the header (struct.Struct)
+    """
+
+    def __init__(self, folder):
+        """
+        Construct Library class.
+        folder: the folder to save polytopes in, made when the first
+                polytope is saved (str), or None or '' to save nothing
+        """
+        self._folder = folder or None
+        self._source = 0
+        if self._folder is not None:
+            try:
+                with open(os.path.abspath(__file__), 'rb') as source:
+                    self._source = zlib.crc32(source.read())
+            except OSError:     # Cannot tell if saved files are up to date
+                self._folder = None
+        self._format = 2
+        self._magic = b'TSKY'
+        # Magic, format, source checksum, data checksum, radius, number of
+        # points, edges, colours, faces, corners, length of wythoff, noSnub
+        self._header = struct.Struct('<4sH2Id5I2B')
+
+    def load(self, symbol):
+        """
+        Load a saved polytope, if it is up to date.
+        symbol: the canonical symbol of the polytope (str)
+        return: the polytope, its Wythoff numbers or None, and whether it
+                cannot be snubbed (tuple, len=3), as Creator would make them
+                or None if the polytope is not saved or is out of date
+        """
+        path = self._path(symbol)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            data = np.memmap(path, dtype=np.uint8, mode='r')
+            magic, version, source, checksum, radius, nPoints, nEdges, \
+                nColours, nFaces, nCorners, nWythoff, noSnub = \
+                self._header.unpack_from(data)
+            if magic != self._magic or version != self._format \
+                or source != self._source or radius != RADIUS:
+                return None
+            start = self._header.size
+            if zlib.crc32(data[start:]) != checksum:
+                return None     # Damaged or cut short
+            wythoff = bytes(data[start:start+nWythoff]).decode('ascii')
+            offset = (start + nWythoff + 7) // 8 * 8
+            arrays = []
+            for dtype, shape in [('<f8', (nPoints, 4)), ('<i4', (nEdges, 2)),
+                                 ('<i4', (nColours, 2)), ('<i4', (18,)),
+                                 ('<i4', (nFaces,)), ('<i4', (nFaces+1,)),
+                                 ('<i4', (nCorners,))]:
+                count = shape[0] * (shape[1] if len(shape) > 1 else 1)
+                arrays.append(np.frombuffer(data, dtype, count, offset)
+                              .reshape(shape))
+                offset += count * np.dtype(dtype).itemsize
+        except (OSError, ValueError, UnicodeDecodeError, struct.error):
+            return None     # Unreadable or cut short, so create it again
+        points, edges, colours, sides, types, starts, corners = arrays
+        starts = starts.tolist()
+        corners = corners.tolist()
+        faces = [tuple(corners[starts[f]:starts[f+1]]) for f in range(nFaces)]
+        polytope = Polytope([points, [tuple(e) for e in edges.tolist()],
+                             [tuple(c) for c in colours.tolist()], faces,
+                             types.tolist(), dict(zip(range(3,21),
+                                                      sides.tolist()))])
+        return polytope, wythoff.split() or None, bool(noSnub)
+
+    def save(self, symbol, polytope, wythoff, noSnub):
+        """
+        Save a polytope to disk, replacing any older file.
+        symbol: the canonical symbol of the polytope (str)
+        polytope: the polytope created from the symbol (Polytope)
+        wythoff: the fundamental triangle numbers (list, len=3) or None
+        noSnub: if the polytope cannot be snubbed (bool)
+        """
+        path = self._path(symbol)
+        if path is None:
+            return
+        points, edges, colours, faces, types, sides = polytope.get_data()
+        if not len(points):     # Nothing to draw, so not worth saving
+            return
+        text = ' '.join(wythoff or []).encode('ascii')
+        corners = [x for face in faces for x in face]
+        starts = [0]
+        for face in faces:
+            starts.append(starts[-1] + len(face))
+        padding = bytes(-(self._header.size + len(text)) % 8)
+        arrays = [np.asarray(points, dtype='<f8'),
+                  np.asarray(edges, dtype='<i4').reshape(-1, 2),
+                  np.asarray(colours, dtype='<i4').reshape(-1, 2),
+                  np.asarray([sides[i] for i in range(3,21)], dtype='<i4'),
+                  np.asarray(types, dtype='<i4'),
+                  np.asarray(starts, dtype='<i4'),
+                  np.asarray(corners, dtype='<i4')]
+        body = text + padding + b''.join([array.tobytes() for array in arrays])
+        header = self._header.pack(self._magic, self._format, self._source,
+                                   zlib.crc32(body), RADIUS, len(points),
+                                   len(edges), len(colours), len(faces),
+                                   len(corners), len(text), noSnub)
+        # Write somewhere else first, so no one reads a half-written file
+        temp = '{}.{}'.format(path, os.getpid())
+        try:
+            os.makedirs(self._folder, exist_ok=True)
+            with open(temp, 'wb') as file:
+                file.write(header + body)
+            os.replace(temp, path)
+        except OSError:
+            pass            # Saving is only to load faster next time
+
+    def _path(self, symbol):
+        # Find the file a symbol is saved in.
+        # symbol: the canonical symbol of the polytope (str)
+        # return: the path of the file (str), or None if nothing is saved
+        if self._folder is None:
+            return None
+        return os.path.join(self._folder, symbol.encode('utf-8').hex()+'.tsk')
+
+
+
+class Canvas():
 
     """
     Display class that manages object rotation and display.
+    Making one makes a tk.Canvas, loading Tk, see tk_class, unless it
+    is subclassed with something else that draws, like bench.TkCounter.
 
     Public methods:
     make_polytope       Make new polytope and re-render.
@@ -1726,48 +2309,133 @@ class Canvas(tk.Canvas):
     set_bar             Change the generating point and make new polyhedron.
     rotate              Rotate objects on button press and re-render.
     get_data            Return data about the current polytope.
-    render              Clear the canvas and display the objects.
+    set_profiler        Start or stop timing every frame.
+    clear_palette       Forget the face colours, rebuild them when needed.
+    invalidate          Re-render once the waiting events are handled.
+    render              Display the objects, reusing canvas items.
 
     Public variables:
     parent              Parent of class (Main)
     rotAxis             The rotation plane's basis vectors (list)
 
     Private methods:
+    __new__             Make a tk.Canvas that is also a Canvas.
+    _set_picture        Find the bases of the picture hyperplane.
     _view               Project 4D points on the viewing plane.
+    _begin_frame        Start a new frame of canvas items.
+    _draw               Draw a canvas item, reusing an old item if possible.
+    _finish_frame       Hide undrawn canvas items and send the frame to Tk.
+    _restack            Raise the fewest layers needed to fix the stacking.
+    _set_palette        Find the colour of every face type and shade.
+    _render_polytope    Display the current polytope.
+    _render_hud         Display the profiler statistics over the objects.
+    _flush              Re-render if anything changed since the last render.
 
     Private variables:
     _currPolytope       Instance of Polytope class (Polytope)
     _sphere             Instance of Sphere class (Sphere)
     _axes               Instance of Axes class (Axes)
+    _rotation           The rotations shared by all objects (Rotation)
+    _picture            The scaled picture bases w, h, u (np.ndarray, 4x3)
+    _pictureDist        The distance of the camera for this frame (int)
+    _pictureCentre      The canvas coordinates of the picture origin (tuple)
+    _path               The Tk path name of the canvas, for commands (str)
+    _items              The canvas items of everything drawn so far (dict)
+                            keys are what the items represent (tuple)
+                            values are canvas item IDs (int)
+    _itemStates         The kind, coords, options, key, and layer of every
+                        item, as last sent to Tk (dict)
+    _pool               Hidden canvas items that can be reused (dict)
+                            keys are kinds of items (str)
+                            values are canvas item IDs, hidden longest
+                            first (collections.OrderedDict, as a set)
+    _stack              Every item, from bottom to top, as Tk stacks them (list)
+    _frame              The items drawn this frame (set)
+    _script             The Tk commands of this frame, sent at once (list)
+    _layerTags          The tag of each layer, from the bottom (list)
+    _edgeStyles         The colour and width of the edges in each depth
+                        bucket, from closest to furthest (list)
+    _faceOrder          The order to paint faces in (DepthOrder)
+    _edgeOrder          The order to paint edges in (DepthOrder)
+    _sorted             The order that sorted the last frame (DepthOrder)
+                            or None if nothing was sorted yet
+    _palette            The colour of every face type and shade (dict)
+                            keys are the number of sides of the face (int)
+                            values are colours from darkest to lightest (list)
+    _cache              The recently created polytopes (Cache)
+    _profiler           The timings of the last frames (Profiler)
+                            or None when not profiling
+    _hud                To show the profiler statistics on the canvas (bool)
+    _dirty              To know if a re-render is waiting (bool)
+    _renders            The number of renders so far (int)
+    _avoided            The number of renders saved by waiting (int)
     _currWythoff        To keep track of the current Wythoff numbers (list)
     _noSnub             To keep track of if the snub does not exist (bool)
     """
 
+    def __new__(cls, *args, **kwargs):
+        """Make a tk.Canvas that is also an instance of cls."""
+        if not hasattr(cls, 'create_polygon'):  # Nothing else draws it
+            cls = tk_class(cls, tk.Canvas)
+        return super().__new__(cls)
+
     def __init__(self, parent):
         """
         Construct Canvas class.
         parent: the parent of canvas (Main)
         """
         self.parent = parent
-        tk.Canvas.__init__(self, parent, relief=tk.GROOVE,
-                           background=self.parent.cols['menu']['canvas'],
-                           borderwidth=5, width=300, height=200)
+        super().__init__(parent, relief='groove',
+                         background=self.parent.cols['menu']['canvas'],
+                         borderwidth=5, width=300, height=200)
         self._currPolytope = Polytope([])
         self._sphere = Sphere(SPHERENUM, RADIUS)
         self._axes = Axes()
         self._noSnub = False
+        self._path = str(self)
+        self._items = {}
+        self._itemStates = {}
+        self._pool = {kind: collections.OrderedDict()
+                      for kind in ('polygon', 'line', 'oval', 'text')}
+        self._stack = []
+        self._frame = set()
+        # Layers from the bottom: the sphere, the axes, the points, the
+        # faces or edges in DEPTHBUCKETS buckets from furthest, the HUD
+        self._layerTags = ['layer{}'.format(layer)
+                           for layer in range(DEPTHBUCKETS + 4)]
+        self._edgeStyles = []
+        for bucket in range(DEPTHBUCKETS):
+            # Colour of closest line is 0, colour of furthest line is 240
+            # Width of closest line is 5, width of furthest line is 1
+            depth = (bucket + 0.5) / DEPTHBUCKETS   # 0 closest, 1 furthest
+            self._edgeStyles.append(('#' + '{0:02x}{0:02x}{0:02x}'.format(
+                int(240 * depth)), int(5 - 4 * depth)))
+        self._faceOrder = DepthOrder()
+        self._edgeOrder = DepthOrder()
+        self._sorted = None
+        self._palette = None
+        self._cache = Cache(CACHESIZE, Library(LIBRARY))
+        self._profiler = None
+        self._hud = False
+        self._dirty = False
+        self._renders = 0
+        self._avoided = 0
+        self.set_rotaxes(((0, pi/2, pi/2), (0, 0, 0)))  # Start with xw
 
     def make_polytope(self, entry):
         """
         Create a new polytope object and re-render.
+        If it cannot be drawn, the last polytope is kept and the error raised.
         entry: the text input that represents the object (str)
         """
         if not entry:   # Make blank polytope`
             self._currPolytope = Polytope([])
+            self.set_rotaxes(None)
         else:
-            creator = Creator(entry)
+            creator = self._cache.get_creator(entry)
             polytope = creator.get_polytope()
             if polytope:
+                previous = self._currPolytope
                 self._currPolytope = polytope
                 if creator.get_wythoff()[0]:
                     self._currWythoff, self._noSnub = creator.get_wythoff()
@@ -1779,7 +2447,16 @@ class Canvas(tk.Canvas):
                 else:
                     self.parent.change('y', 0)  # No, this is not a Wythoff
                 self.set_rotaxes(None)
-                self.render()
+                # Render now instead of once idle, so that a polytope that
+                # cannot be drawn is raised to Main.take_input as bad input
+                try:
+                    self.render()
+                except Exception:
+                    self._finish_frame()    # Keep Tk in step with the items
+                    self._currPolytope = previous
+                    self.set_rotaxes(None)
+                    self.invalidate()
+                    raise
 
     def set_rotaxes(self, rotAxis):
         """
@@ -1788,44 +2465,21 @@ class Canvas(tk.Canvas):
                  default is the previous one, when only _currPolytope changes
                  all elements are in spherical coordinates (list, len=3)
         """
-        if rotAxis:
-            self._currPolytope.set_rotaxis(rotAxis)
-            self._sphere.set_rotaxis(rotAxis)
-            self._axes.set_rotaxis(rotAxis)
+        if rotAxis:     # All objects share the same rotation matrices
+            self.rotAxis = rotAxis
+            self._rotation = Rotation(rotAxis)
+            self._currPolytope.set_rotaxis(self._rotation)
+            self._sphere.set_rotaxis(self._rotation)
+            self._axes.set_rotaxis(self._rotation)
         else:
-            rotAxis = [(self.parent.rutheta.get(), self.parent.ruphi.get(),
-                        self.parent.ruomega.get()),
-                       (self.parent.rvtheta.get(), self.parent.rvphi.get(),
-                        self.parent.rvomega.get())]
-            self._currPolytope.set_rotaxis(rotAxis)
+            self._currPolytope.set_rotaxis(self._rotation)
 
     def set_bar(self, bar):
         """
         Change the Wythoff generating point and make new uniform polyhedron.
         bar: the type of generating point (str)
         """
-        p = str(self._currWythoff[0])
-        q = str(self._currWythoff[1])
-        s = str(self._currWythoff[2])
-        if bar == 'a':
-            symbol = ' '.join(['(',p,q,s,')'])
-        elif bar == 'b':
-            symbol = ' '.join(['(','|',p,q,s,')'])
-        elif bar == 'c':
-            symbol = ' '.join(['(',p,q,s,'|',')'])
-        elif bar == 'p':
-            symbol = ' '.join(['(',p,'|',q,s,')'])
-        elif bar == 'q':
-            symbol = ' '.join(['(',q,'|',s,p,')'])
-        elif bar == 's':
-            symbol = ' '.join(['(',s,'|',p,q,')'])
-        elif bar == 'pq':
-            symbol = ' '.join(['(',p,q,'|',s,')'])
-        elif bar == 'qs':
-            symbol = ' '.join(['(',q,s,'|',p,')'])
-        elif bar == 'sp':
-            symbol = ' '.join(['(',s,p,'|',q,')'])
-        self.make_polytope(symbol)
+        self.make_polytope(place_bar(self._currWythoff, bar))
         self.parent.set_status('faces')
 
     def rotate(self, direction, rotAngle=ROTANGLE):
@@ -1834,17 +2488,19 @@ class Canvas(tk.Canvas):
         direction: left is 0, right is 1 (int)
         rotAngle: number of radians to rotate (float), default ROTANGLE
         """
+        if self._profiler is not None:
+            self._profiler.begin()
         if direction == 0:
-            if self._currPolytope.get_points():
-                self._currPolytope.rotate(rotAngle)
+            self._currPolytope.rotate(rotAngle)
             self._sphere.rotate(rotAngle)
             self._axes.rotate(rotAngle)
         elif direction == 1:    # Opposite direction is backwards rotation
-            if self._currPolytope.get_points():
-                self._currPolytope.rotate(-rotAngle)
+            self._currPolytope.rotate(-rotAngle)
             self._sphere.rotate(-rotAngle)
             self._axes.rotate(-rotAngle)
-        self.render()
+        if self._profiler is not None:
+            self._profiler.mark('rotate')
+        self.invalidate()
 
     def get_data(self, event):
         """
@@ -1856,218 +2512,1312 @@ class Canvas(tk.Canvas):
             return self._currPolytope.get_face_sides()
         if event == 'star':
             return self._currPolytope.star
+        if event == 'swaps':    # None if the last frame was sorted from scratch
+            if self._sorted is not None:
+                return self._sorted.get_swaps()
+        if event == 'cache':
+            return self._cache.get_counts()
+        if event == 'profile':  # None unless profiling, see get_stats
+            if self._profiler is not None:
+                return self._profiler.get_stats()
+        if event == 'renders':  # Renders done, and renders saved by waiting
+            return self._renders, self._avoided
+        if event == 'items':    # Canvas items shown by the last frame
+            return len(self._frame)
+
+    def set_profiler(self, profile, hud=True):
+        """
+        Start or stop timing the phases of every frame, and re-render.
+        The timings are returned by get_data('profile').
+        profile: whether to time every frame (bool)
+        hud: whether to show the timings on the canvas (bool)
+        """
+        if not profile:
+            self._profiler = None
+        elif self._profiler is None:
+            self._profiler = Profiler(PROFILEFRAMES)
+        self._hud = profile and hud
+        self.invalidate()
+
+    def _set_picture(self, viewAxis, centre):
+        # Find the bases of the picture hyperplane once per frame.
+        # viewAxis: the viewing axis in spherical coordinates (list, len=3)
+        # centre: the canvas coordinates of the viewing plane origin (tuple)
+        self._picture = picture_bases(viewAxis, self.parent.view.zoom)
+        self._pictureDist = self.parent.view.dist   # Distance along viewAxis
+        self._pictureCentre = centre
 
-    def _view(self, points, viewAxis):
+    def _view(self, points):
         # Project 4D points on the plane normal to the viewing axis.
-        # points: a list of points in 4D (list)
-        #         all elements are in spherical coordinates (list, len=4)
-        # viewAxis: the viewing axis in spherical coordinates (list, len=3)
-        # return: a list of points on the viewing plane (list)
+        # points: the points in 4D (np.ndarray, Nx4, or list)
+        #         rows are in Cartesian coordinates
+        # return: the points on the canvas, to the nearest pixel (list)
         #         all elements are in Cartesian coordinates (list, len=2)
-
-        so = math.sin(viewAxis[2])
-        co = math.cos(viewAxis[2])
-        sp = math.sin(viewAxis[1])
-        cp = math.cos(viewAxis[1])
-        st = math.sin(viewAxis[0])
-        ct = math.cos(viewAxis[0])
-
-        w = (-st, ct, 0, 0)                     # Directions of bases of
-        h = (cp*ct, cp*st, -sp, 0)              # the picture hyperplane
-        b = (-co*sp*ct, -co*sp*st, -co*cp, so)
-        u = (so*sp*ct, so*sp*st, so*cp, co)     # Direction of viewAxis
-        d = self.parent.dist.get()              # Distance along viewAxis
-        f = d + RETINA                          # Distance to picture plane
-
-        result = []
-        for i in points:
-            e = sum([i[j]*u[j] for j in range(3)])
-            t = (f-e)/(d-e)
-            g = 1-t
-            k = d*t-f
-
-            # Gotta find m,n,p to satisfy the vector equation:
-            # g.i + k.u = p.b + n.h + m.w
-            # Expands into this system of equations. Can't divide by zero!
-            # g*x + k*so*sp*ct = - p*co*sp*ct + n*cp*ct - m*st
-            # g*y + k*so*sp*st = - p*co*sp*st + n*cp*st + m*ct
-            # g*z + k*so*cp    = - p*co*cp    - n*sp
-            # g*w + k*co       = + p*so
-            if abs(so) < EPSILON:
-                if abs(sp) < EPSILON:
-                    p = (g*i[2] + k*u[2]) / -1
-                    if abs(st) < EPSILON:
-                        n = (g*i[0] + k*u[0] - p*b[0])
-                        m = (g*i[1] + k*u[1] - p*b[1] - n*h[1])
-                    elif abs(ct) < EPSILON:
-                        n = (g*i[1] + k*u[1] - p*b[1])
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -1
-                    else:
-                        n = (g*i[0] + k*u[0] - p*b[0]) * ct + \
-                            (g*i[1] + k*u[1] - p*b[1]) * st
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -st
-                else:
-                    if abs(st) < EPSILON:
-                        p = ((g*i[0] + k*u[0]) * sp +  \
-                             (g*i[2] + k*u[2]) * cp) / \
-                            (b[0] * sp + b[2] * cp)
-                        n = (g*i[0] + k*u[0] - p*b[0]) / cp
-                        m = (g*i[1] + k*u[1] - p*b[1] - n*h[1])
-                    elif abs(ct) < EPSILON:
-                        p = ((g*i[1] + k*u[1]) * sp +  \
-                             (g*i[2] + k*u[2]) * cp) / \
-                            (b[1] * sp + b[2] * cp)
-                        n = (g*i[1] + k*u[1] - p*b[1]) / cp
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -1
-                    else:
-                        p = (((g*i[0] + k*u[0]) * ct +                  \
-                              (g*i[1] + k*u[1]) * st) * sp +            \
-                             (h[0]*ct + h[1]*st) * (g*i[2] + k*u[2])) / \
-                            ((b[0]*ct + b[1]*st) * sp +                 \
-                             (h[0]*ct + h[1]*st) * b[2])
-                        n = (g*i[2] + k*u[2] - p*b[2]) / -sp
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -st
+        # The viewing plane origin is the centre of the canvas
+        # Points that move less than half a pixel are not sent to Tk again
+        # Tk only takes text, so this is the one place pixels become ints
+        return np.rint(project(points, self._picture, self._pictureDist,
+                               self._pictureCentre)).astype(int).tolist()
+
+    def _begin_frame(self):
+        # Start a new frame, remembering which items are drawn.
+        self._frame = set()
+        self._script = []
+
+    def _draw(self, key, kind, coords, layer, **options):
+        # Draw a canvas item, reusing the item with the same key if possible.
+        # Changes are only sent to Tk when the frame is finished.
+        # key: what the item represents, such as ('face', 3) (tuple)
+        # kind: the type of item, 'polygon', 'line', 'oval', or 'text' (str)
+        # coords: the flattened canvas coordinates of the item (list)
+        # layer: the layer to stack the item in, the top is last (int)
+        # options: the item options, such as fill and width (dict)
+        #          values must not have braces or end in a backslash
+        options['state'] = 'normal'
+        options['tags'] = self._layerTags[layer]
+        item = self._items.get(key)
+        if item is None:
+            pool = self._pool[kind]
+            if pool:    # Recycle the item of the same kind hidden longest
+                item = next(iter(pool))
+                del self._items[self._itemStates[item][3]]
+                self._itemStates[item][3] = key
+            else:       # Only create an item if there is none
+                item = getattr(self, 'create_' + kind)(coords, **options)
+                if self._profiler is not None:
+                    self._profiler.count('create')
+                self._itemStates[item] = [kind, coords, dict(options), key,
+                                          layer]
+                self._stack.append(item)    # New items are made on top
+            self._items[key] = item
+        self._pool[kind].pop(item, None)
+
+        # Only send Tk whatever has changed since the last frame
+        state = self._itemStates[item]
+        if state[1] != coords:
+            self._script.append('{} coords {} {}'.format(
+                self._path, item, ' '.join(map(str, coords))))
+            state[1] = coords
+            if self._profiler is not None:
+                self._profiler.count('coords')
+        changes = {option: value for option, value in options.items()
+                   if state[2].get(option) != value}
+        if changes:     # Such as a new shade, or a new layer, or both
+            self._script.append('{} itemconfigure {} {}'.format(
+                self._path, item, ' '.join('-{} {{{}}}'.format(option, value)
+                                           for option, value
+                                           in changes.items())))
+            state[2].update(changes)
+            if self._profiler is not None:
+                self._profiler.count('itemconfig')
+        state[4] = layer
+        self._frame.add(item)
+
+    def _finish_frame(self):
+        # Hide the items that were not drawn, restack the drawn items,
+        # and send all the changes of the frame to Tk in one call.
+        for item in self._stack:
+            if item not in self._frame:
+                state = self._itemStates[item]
+                if state[2]['state'] != 'hidden':
+                    self._script.append('{} itemconfigure {} -state hidden'
+                                        .format(self._path, item))
+                    state[2]['state'] = 'hidden'
+                    self._pool[state[0]][item] = None
+                    if self._profiler is not None:
+                        self._profiler.count('hide')
+        self._restack()
+        if self._script:
+            self.tk.eval('\n'.join(self._script))
+            if self._profiler is not None:
+                self._profiler.count('eval')
+
+    def _restack(self):
+        # Raise as few layers as possible so the items stack by layer.
+        # Raising a layer raises all its items but keeps their order. The
+        # items below the first one stacked over a higher layer are still
+        # in order, so only raise that layer and every one above it.
+        states = self._itemStates
+        highest = lowest = None
+        for item in self._stack:
+            if item in self._frame:     # Hidden items can stack anywhere
+                layer = states[item][4]
+                if highest is None or layer >= highest:
+                    highest = layer
+                elif lowest is None or layer < lowest:
+                    lowest = layer
+        if lowest is None:
+            return
+        layers = sorted({states[item][4] for item in self._frame
+                         if states[item][4] >= lowest})
+        raised = {layer: [] for layer in layers}    # The items moved up
+        for layer in layers:
+            self._script.append('{} raise {}'.format(self._path,
+                                                     self._layerTags[layer]))
+            if self._profiler is not None:
+                self._profiler.count('raise')
+        stack = []
+        for item in self._stack:    # Tk raises hidden items of a layer too
+            layer = states[item][4]
+            if layer in raised:
+                raised[layer].append(item)
             else:
-                p = (g*i[3] + k*u[3]) / so
-                if abs(sp) < EPSILON:
-                    if abs(st) < EPSILON:
-                        n = (g*i[0] + k*u[0] - p*b[0])
-                        m = (g*i[1] + k*u[1] - p*b[1] - n*h[1])
-                    elif abs(ct) < EPSILON:
-                        n = (g*i[1] + k*u[1] - p*b[1])
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -1
-                    else:
-                        n = (g*i[0] + k*u[0] - p*b[0]) * ct + \
-                            (g*i[1] + k*u[1] - p*b[1]) * st
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -st
-                else:
-                    n = (g*i[2] + k*u[2] - p*b[2]) / -sp
-                    if abs(ct) < EPSILON:
-                        m = (g*i[0] + k*u[0] - p*b[0] - n*h[0]) / -st
-                    else:
-                        m = (g*i[1] + k*u[1] - p*b[1] - n*h[1]) / ct
+                stack.append(item)
+        for layer in layers:
+            stack.extend(raised[layer])
+        self._stack = stack
+
+    def invalidate(self):
+        """
+        Re-render once the events waiting now are handled, instead of now.
+        Changing several things at once, like the view, light, and rotation
+        axis-plane, then only renders once, after the last of them.
+        """
+        if self._dirty:
+            self._avoided += 1
+        else:
+            self._dirty = True
+            self.after_idle(self._flush)
 
-            result.append((m*self.parent.zoom.get(),n*self.parent.zoom.get()))
-        return result
+    def _flush(self):
+        # Re-render if anything changed since the last render.
+        if self._dirty:
+            if self._profiler is not None:  # Time since rotating, if any
+                self._profiler.begin()
+                self._profiler.mark('wait')
+            self.render()
 
     def render(self):
-        """Clear the canvas, center the frame, and display the objects."""
-
-        self.delete(tk.ALL)         # Clear the canvas
+        """Display the objects, reusing the items of the last frame."""
+
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.begin()
+        self._dirty = False
+        self._renders += 1
+        self._begin_frame()
         w = self.winfo_width()//2   # Center the frame
         h = self.winfo_height()//2
 
         # Get viewAxis and lightAxis data from parent
-        viewAxis = [self.parent.vtheta.get(), self.parent.vphi.get(),
-                    self.parent.vomega.get()]
+        view = self.parent.view
+        viewAxis = [view.vtheta, view.vphi, view.vomega]
+        self._set_picture(viewAxis, (w, h))
         # Light axis only has theta and phi, omega will always be 1.57
-        lightAxis = [self.parent.ltheta.get(), self.parent.lphi.get(), pi/2]
-        laxis = convert([self.parent.dist.get()] + lightAxis,True)
-        lint = self.parent.lint.get()
-        lcol = [self.parent.lred.get(), self.parent.lgreen.get(),
-                self.parent.lblue.get()]
+        lightAxis = [view.ltheta, view.lphi, pi/2]
+        laxis = convert([view.dist] + lightAxis,True)
+        if self._palette is None:   # Light or face colours have changed
+            self._set_palette()
+        if profiler is not None:
+            profiler.mark('setup')
 
         # Draw the sphere overlay
-        if w != 0 and h != 0 and self.parent.sphere.get() == True:
+        if w != 0 and h != 0 and view.sphere == True:
             # Draw the lines of longitude and latitude
-            # _view flipped the x-coordinates upside down for some reason
-            # w and h map the viewing plane origin to the centre of the screen
-            points = [(-point[0]+w, point[1]+h) for point in
-                      self._view(self._sphere.get_points(), viewAxis)]
+            points = self._view(self._sphere.get_point_array())
             edges = self._sphere.get_edges()
-            for edge in edges:
-                self.create_line(points[edge[0]], points[edge[1]], width=3,
-                                 fill=self.parent.cols['line']['sphere'])
+            for i,edge in enumerate(edges):
+                self._draw(('sphere', i), 'line',
+                           points[edge[0]] + points[edge[1]], 0, width=3,
+                           fill=self.parent.cols['line']['sphere'])
 
         # Draw the coordinate axes
-        if w != 0 and h != 0 and self.parent.axes.get() == True:
+        if w != 0 and h != 0 and view.axes == True:
             # Half-length of the axis, hard-coded, ZeroDivisionError somewhere
-            l = 0.3 * RADIUS * self.parent.dist.get() / self.parent.zoom.get()
+            l = 0.3 * RADIUS * view.dist / view.zoom
             axes = [normalize(axis, [l]) for axis in self._axes.get_points()]
-            points = [(-point[0]+w, point[1]+h) for point in
-                      self._view(axes, viewAxis)]
+            points = self._view(axes)
             edges = self._axes.get_edges()
             for i,edge in enumerate(edges):
-                self.create_line(points[edge[0]], points[edge[1]],
-                                 fill=self.parent.cols['axis'][i], width=5)
-
-        if not self._currPolytope.get_points():
-            return      # Do nothing if the polytope is empty
+                self._draw(('axis', i), 'line',
+                           points[edge[0]] + points[edge[1]], 1,
+                           fill=self.parent.cols['axis'][i], width=5)
+
+        if profiler is not None:
+            profiler.mark('overlay')
+
+        # Draw the actual polytope, if it exists
+        if len(self._currPolytope.get_point_array()):
+            self._render_polytope(viewAxis, laxis)
+        if profiler is not None:
+            profiler.mark('draw')
+            if self._hud:
+                self._render_hud()
+            self._finish_frame()
+            profiler.mark('finish')
+            profiler.end((len(self._currPolytope.get_point_array()),
+                          len(self._currPolytope.get_edges()),
+                          len(self._currPolytope.get_faces())))
+        else:
+            self._finish_frame()
 
-        # Draw the actual polytope, since we know it exists
-        points = [(-point[0]+w, point[1]+h) for point in
-                  self._view(self._currPolytope.get_points(), viewAxis)]
+    def _render_hud(self):
+        # Display the profiler statistics of the last frames in the corner.
+        # The frame being drawn has not ended, so it is not included yet.
+        stats = self._profiler.get_stats()
+        if stats is None:
+            return
+        phases = sorted(stats['means'].items(), key=lambda x: -x[1])
+        calls = stats['calls']
+        text = '\n'.join([
+            'frame {:.1f} ms, p50 {:.1f}, p90 {:.1f}, p99 {:.1f} ms'.format(
+                stats['seconds']*1000,
+                *[x*1000 for x in stats['percentiles']]),
+            ', '.join('{} {:.1f}'.format(phase, spent*1000)
+                      for phase, spent in phases) + ' ms',
+            'tk: {} created, {} moved, {} configured, {} raised, '
+            'in {} calls'.format(
+                calls.get('create', 0), calls.get('coords', 0),
+                calls.get('itemconfig', 0), calls.get('raise', 0),
+                calls.get('create', 0) + calls.get('eval', 0)),
+            '{} renders, {} avoided by waiting'.format(self._renders,
+                                                       self._avoided),
+            '{} vertices, {} edges, {} faces'.format(*stats['sizes'])])
+        self._draw(('hud', 0), 'text', [8, 8], DEPTHBUCKETS + 3, text=text,
+                   anchor='nw', font='TkFixedFont',
+                   fill=self.parent.cols['text']['normal'])
+
+    def clear_palette(self):
+        """Forget the face colours, so the next render rebuilds them."""
+        self._palette = None
+
+    def _set_palette(self):
+        # Find the colour of every face type at every shade of the light.
+        view = self.parent.view
+        lint = view.lint
+        lcol = [view.lred, view.lgreen, view.lblue]
+        self._palette = {}
+        for sides, hexcol in self.parent.cols['face'].items():
+            self._palette[sides] = ['#{0:02x}{1:02x}{2:02x}'.format(*colour)
+                                    for colour in shade_colours(hexcol, lcol,
+                                                                lint)]
+
+    def _render_polytope(self, viewAxis, laxis):
+        # Display the current polytope, which is known to exist.
+        # viewAxis: the viewing axis in spherical coordinates (list, len=3)
+        # laxis: the light position in Cartesian coordinates (list, len=4)
+        profiler = self._profiler
+        points = self._view(self._currPolytope.get_point_array())
         # As the camera moves away, the light source moves the same distance
-        camera = convert([self.parent.dist.get()] + viewAxis,True)
+        camera = convert([self.parent.view.dist] + viewAxis,True)
+        if profiler is not None:
+            profiler.mark('view')
 
         # Display by drawing polygons in normal mode
-        if self.parent.wire.get() == False:
+        if self.parent.view.wire == False:
             faces = self._currPolytope.get_faces()
             shades = self._currPolytope.get_shades(laxis)
-            centres = self._currPolytope.get_face_centres()
             sideTypes = self._currPolytope.get_faces_by_side()
-            distances = {}
+            if profiler is not None:
+                profiler.mark('shades')
 
             # If the polytope is a single polygon, both sides should be shaded
             if len(faces) == 1:
-                colour = []                         # Get polygon base colour
-                hexcol = self.parent.cols['face'][sideTypes[0]]
-                for i in range(3):
-                    deccol = int(hexcol[1+i], 16)   # Convert hex to dec
-                    # Multiply deccol (0-15) by 16, since lcol is (0-255)
-                    # Average base colour and light colour times intensity
-                    # Then multiply result by shade and intensity again
-                    col = (deccol*16 + lcol[i] * lint)/2 * shades * lint
-                    # Use min and abs so that result is positive and under 255
-                    colour.append(int(min(255, abs(col))))
-                rgb = '#{0:02x}{1:02x}{2:02x}'.format(*colour)
-                edges = [points[side] for side in faces[0]]
-                self.create_polygon(edges,width=3,fill=rgb,
-                                    outline=self.parent.cols['line']['face'])
+                # Use min and abs so that the shade is positive and under 1
+                step = int(min(1, abs(shades)) * SHADESTEPS + 0.5)
+                rgb = self._palette[sideTypes[0]][step]
+                edges = [x for side in faces[0] for x in points[side]]
+                self._draw(('face', 0), 'polygon', edges, 3, width=3,
+                           fill=rgb, outline=self.parent.cols['line']['face'])
                 return
 
             # Otherwise, sort faces by distance to the camera and draw them
-            for face in faces:
-                distances[face] = distance2(centres[face], camera)
-            order = sorted(distances, key=distances.get, reverse=True)
+            # Back faces are never sent to the canvas
+            distances = self._currPolytope.get_depths(camera)
+            if profiler is not None:
+                profiler.mark('depths')
+            order = self._faceOrder.sort(distances)
+            self._sorted = self._faceOrder
+            if profiler is not None:
+                profiler.mark('sort')
+            closest = self.parent.view.dist - RADIUS
+            scale = DEPTHBUCKETS / (2 * RADIUS)
             for face in order:              # Colour the faces
-                hexcol = self.parent.cols['face'][sideTypes[face]]
-                colour = []
-                for i in range(3):
-                    deccol = int(hexcol[1+i], 16)
-                    col = (deccol*16 + lcol[i] * lint)/2 * shades[face] * lint
-                    colour.append(int(max(0, min(255, col))))
-                rgb = '#{0:02x}{1:02x}{2:02x}'.format(*colour)
-                edges = [points[side] for side in faces[face]]
-                self.create_polygon(edges,width=3,fill=rgb,
-                                    outline=self.parent.cols['line']['face'])
-            return
+                step = int(max(0, min(1, shades[face])) * SHADESTEPS + 0.5)
+                rgb = self._palette[sideTypes[face]][step]
+                edges = [x for side in faces[face] for x in points[side]]
+                d = math.sqrt(distances[face][0])
+                bucket = max(0, min(DEPTHBUCKETS-1, int((d - closest) *
+                                                        scale)))
+                self._draw(('face', face), 'polygon', edges,
+                           DEPTHBUCKETS + 2 - bucket, width=3, fill=rgb,
+                           outline=self.parent.cols['line']['face'])
 
         # Display by drawing lines in wireframe mode
-        elif self.parent.wire.get() == True:
+        elif self.parent.view.wire == True:
             edges = self._currPolytope.get_edges()
             centres = self._currPolytope.get_edge_centres()
             colours = self._currPolytope.get_point_colours()
-            for colour in colours:
-                self.create_oval([p-5 for p in points[colour[0]]],
-                                 [p+5 for p in points[colour[0]]],
-                                 fill=self.parent.cols['point'][colour[1]])
-            # Create list of doubles of edge distance and edge number
-            distances = []
+            for i,colour in enumerate(colours):
+                self._draw(('point', i), 'oval',
+                           [p-5 for p in points[colour[0]]] +
+                           [p+5 for p in points[colour[0]]], 2,
+                           fill=self.parent.cols['point'][colour[1]])
+            if profiler is not None:
+                profiler.mark('draw')
+            # Create dict of doubles of edge distance and edge number
+            distances = {}
             for i in range(len(edges)):
-                distances.append((math.sqrt(distance2(centres[i],camera)), i))
-            order = sorted(distances, reverse=True)
-            closest = self.parent.dist.get() - RADIUS
-            for d,e in order:
-                # Colour of closest line is 0, colour of furthest line is 240
-                col = max(0, min(255, int(120 * (d - closest) / RADIUS)))
-                rgb = '#' + '{0:02x}{0:02x}{0:02x}'.format(col)
-                # Width of closest line is 5, width of furthest line is 1
-                width = int(5 - 2 * (d - closest) / RADIUS)
-                self.create_line(points[edges[e][0]], points[edges[e][1]],
-                                 fill=rgb, width=width)
+                distances[i] = (math.sqrt(distance2(centres[i],camera)), i)
+            if profiler is not None:
+                profiler.mark('depths')
+            order = self._edgeOrder.sort(distances)
+            self._sorted = self._edgeOrder
+            if profiler is not None:
+                profiler.mark('sort')
+            closest = self.parent.view.dist - RADIUS
+            scale = DEPTHBUCKETS / (2 * RADIUS)
+            for d,e in [distances[i] for i in order]:
+                # Edges in the same depth bucket have the same colour and
+                # width, so only edges that change bucket are reconfigured
+                bucket = max(0, min(DEPTHBUCKETS-1, int((d - closest) *
+                                                        scale)))
+                rgb, width = self._edgeStyles[bucket]
+                self._draw(('edge', e), 'line',
+                           points[edges[e][0]] + points[edges[e][1]],
+                           DEPTHBUCKETS + 2 - bucket, fill=rgb, width=width)
+
+
+
+class Raster():
+
+    """
+    Display class that draws polytopes into a pixel buffer, without Tk.
+    Points are projected, faces shaded, and items painted from back to
+    front just like Canvas.render, but every item of a frame is filled in
+    at once: the edges of each item cross the rows of pixels, the pixels
+    between crossings are filled if the edges wind around them, and each
+    pixel takes the colour of the last item painted over it. With the
+    z-buffer, it takes the colour of the closest face instead.
+
+    Public methods:
+    render              Draw a polytope as a new frame.
+    get_pixels          Return the pixels of the last frame.
+    save                Write the last frame to a PPM or PNG file.
+
+    Public variables:
+    viewAxis            The viewing axis in spherical coordinates (list, len=3)
+    lightAxis           The light axis in spherical coordinates (list, len=2)
+    lint                The intensity of the light (float)
+    lcol                The colour of the light, from 0 to 255 (list, len=3)
+    zoom                The zoom of the camera (int)
+    dist                The distance of the camera (int)
+    wire                To draw edges and points instead of faces (bool)
+    cols                The colours to draw with, like Main.cols (dict)
+
+    Private methods:
+    __init__            Construct Raster class.
+    _set_palette        Find the colour of every face type and shade.
+    _render_faces       Paint the faces of a polytope.
+    _render_wire        Paint the edges and points of a polytope.
+    _paint              Fill in every item of the frame at once.
+    _spread             Count up along many spans at once.
+    _lines              Find the outlines of thick lines.
+    _colour             Convert a colour to red, green, and blue.
+
+    Private variables:
+    _width              The width of the frame in pixels (int)
+    _height             The height of the frame in pixels (int)
+    _zbuffer            To hide faces by their depth at every pixel (bool)
+    _pixels             The red, green, and blue of each pixel
+                            (np.ndarray, height x width x 3, uint8)
+    _faceOrder          The order to paint faces in (DepthOrder)
+    _edgeOrder          The order to paint edges in (DepthOrder)
+    _palette            The colour of every face type and shade (dict)
+                            keys are the number of sides of the face (int)
+                            values are colours from darkest to lightest
+                            (np.ndarray, (SHADESTEPS+1) x 3)
+    _paletteKey         The light and face colours of _palette (tuple)
+    _best               The largest key painted at each pixel
+                            (np.ndarray, height*width, int64)
+    _ramp               The numbers from 0, as many as the most pixels
+                            painted at once so far (np.ndarray, int32)
+    """
+
+    def __init__(self, width, height, zbuffer=False):
+        """
+        Construct Raster class, with the same view as a reset Main.
+        width: the width of the frame in pixels (int)
+        height: the height of the frame in pixels (int)
+        zbuffer: whether to show the closest face at every pixel, instead
+                 of the last face painted, so faces passing through each
+                 other are drawn right (bool)
+        """
+        self.viewAxis = [0, 0, pi/2]
+        self.lightAxis = [0, 0]
+        self.lint = 1
+        self.lcol = [255, 255, 255]
+        self.zoom = ZOOM
+        self.dist = int(ZOOM*RADIUS*RETINA/20**(3/2))
+        self.wire = False
+        self.cols = COLOURS
+        self._width = width
+        self._height = height
+        self._zbuffer = zbuffer
+        self._pixels = np.zeros((height, width, 3), dtype=np.uint8)
+        self._faceOrder = DepthOrder()
+        self._edgeOrder = DepthOrder()
+        self._palette = None
+        self._paletteKey = None
+        self._best = np.empty(height * width, dtype=np.int64)
+        self._ramp = np.arange(0, dtype=np.int32)
+
+    def render(self, polytope):
+        """
+        Draw a polytope as a new frame, in its current orientation.
+        polytope: the polytope to draw (Polytope)
+        """
+        points = polytope.get_point_array()
+        if not len(points):
+            self._pixels[:] = self._colour(self.cols['menu']['canvas'])
+            return
+        bases = picture_bases(self.viewAxis, self.zoom)
+        whu = points.dot(bases)
+        points = project(points, bases, self.dist,
+                         (self._width//2, self._height//2))
+        camera = convert([self.dist] + list(self.viewAxis), True)
+        if self.wire:
+            self._render_wire(polytope, points, camera)
+        else:
+            # Light only has theta and phi, omega will always be pi/2
+            laxis = convert([self.dist] + list(self.lightAxis) + [pi/2], True)
+            self._render_faces(polytope, points, 1/(self.dist - whu[:,2]),
+                               camera, laxis)
+
+    def get_pixels(self):
+        """
+        Return the pixels of the last frame.
+        return: the red, green, and blue of each pixel, from the top left
+                (np.ndarray, height x width x 3, uint8)
+        """
+        return self._pixels
+
+    def save(self, path):
+        """
+        Write the last frame to a file, as PNG if the path ends in .png,
+        and as binary PPM otherwise.
+        path: the path of the file (str)
+        """
+        height, width = self._height, self._width
+        if path.lower().endswith('.png'):
+            def chunk(kind, data):
+                return (struct.pack('>I', len(data)) + kind + data +
+                        struct.pack('>I', zlib.crc32(kind + data)))
+            rows = np.zeros((height, width*3 + 1), dtype=np.uint8)
+            rows[:,1:] = self._pixels.reshape(height, -1)   # Filter type 0
+            data = (b'\x89PNG\r\n\x1a\n' +
+                    chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                               8, 2, 0, 0, 0)) +
+                    chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) +
+                    chunk(b'IEND', b''))
+        else:
+            data = ('P6\n{} {}\n255\n'.format(width, height).encode('ascii')
+                    + self._pixels.tobytes())
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    def _set_palette(self):
+        # Find the colour of every face type at every shade of the light,
+        # only if the light or the face colours have changed.
+        key = (self.lint, tuple(self.lcol),
+               tuple(sorted(self.cols['face'].items())))
+        if key != self._paletteKey:
+            self._palette = {
+                sides: np.array(shade_colours(hexcol, self.lcol, self.lint),
+                                dtype=np.uint8)
+                for sides, hexcol in self.cols['face'].items()}
+            self._paletteKey = key
+
+    def _render_faces(self, polytope, points, inverses, camera, laxis):
+        # Paint the faces of a polytope, from the furthest to the closest.
+        # points: the picture coordinates of the points (np.ndarray, Nx2)
+        # inverses: one over the depth of each point (np.ndarray, N)
+        # camera: the camera position in Cartesian coordinates (list, len=4)
+        # laxis: the light position in Cartesian coordinates (list, len=4)
+        self._set_palette()
+        faces = polytope.get_faces()
+        shades = polytope.get_shades(laxis)
+        sideTypes = polytope.get_faces_by_side()
+        if len(faces) == 1:     # Both sides of a polygon are shaded
+            order = [0]
+            shades = [abs(shades)]
+        else:
+            order = self._faceOrder.sort(polytope.get_depths(camera))
+        if not order:
+            self._pixels[:] = self._colour(self.cols['menu']['canvas'])
             return
 
+        # Face k in the order is item 2k, and its outline is item 2k+1
+        ranks = np.full(len(faces), -1)
+        ranks[order] = np.arange(len(order))
+        starts, ends, owners = polytope.get_mesh().get_sides().T
+        shown = ranks[owners] >= 0
+        starts, ends, owners = starts[shown], ends[shown], ranks[owners[shown]]
+        heads, tails = points[starts], points[ends]
+        edges = np.vstack((np.hstack((heads, tails)),
+                           self._lines(heads, tails, 3)))
+        owner = np.concatenate((2*owners, np.tile(2*owners + 1, 4)))
+        colours = np.empty((2*len(order), 3), dtype=np.uint8)
+        colours[0::2] = [
+            self._palette[sideTypes[face]][
+                int(max(0, min(1, shades[face])) * SHADESTEPS + 0.5)]
+            for face in order]
+        colours[1::2] = self._colour(self.cols['line']['face'])
+        isFace = np.arange(2*len(order)) % 2 == 0
+
+        planes = None
+        if self._zbuffer:
+            # One over the depth is linear across the picture of a face,
+            # so fit a*x + b*y + c to it at the corners of every face
+            corners = np.column_stack((heads, np.ones(len(heads))))
+            gram = np.zeros((len(order), 3, 3))
+            np.add.at(gram, owners, corners[:,:,None] * corners[:,None,:])
+            moments = np.zeros((len(order), 3))
+            np.add.at(moments, owners, corners * inverses[starts][:,None])
+            planes = np.repeat(np.matmul(np.linalg.pinv(gram),
+                                         moments[:,:,None])[:,:,0], 2, axis=0)
+        self._paint(edges, owner, colours, isFace, planes)
+
+    def _render_wire(self, polytope, points, camera):
+        # Paint the points and edges of a polytope, from furthest to closest.
+        # points: the picture coordinates of the points (np.ndarray, Nx2)
+        # camera: the camera position in Cartesian coordinates (list, len=4)
+        edges = polytope.get_edges()
+        centres = polytope.get_edge_centres()
+        pointColours = polytope.get_point_colours()
+
+        # Points are circles of radius 5 with a black outline, like Canvas,
+        # so point k is a black circle as item 2k, filled in by a smaller
+        # circle as item 2k+1, and edge k in the order is item 2P+k
+        circle = np.array([(math.cos(pi*k/8), math.sin(pi*k/8))
+                           for k in range(17)])
+        spots = points[[point for point,colour in pointColours]][:,None,:]
+        rings = np.concatenate((spots + 5.5*circle, spots + 4.5*circle),
+                               axis=1)
+        heads = np.delete(rings, [16, 33], axis=1).reshape(-1, 2)
+        tails = np.delete(rings, [0, 17], axis=1).reshape(-1, 2)
+        number = len(pointColours)
+        owners = np.repeat(np.arange(2*number), 16)
+        colours = []
+        for point, colour in pointColours:
+            colours += [(0, 0, 0), self._colour(self.cols['point'][colour])]
+
+        distances = {}
+        for i in range(len(edges)):
+            distances[i] = (math.sqrt(distance2(centres[i],camera)), i)
+        order = self._edgeOrder.sort(distances)
+        closest = self.dist - RADIUS
+        depths = np.array([distances[i][0] for i in order]) - closest
+        # Colour of closest line is 0, colour of furthest line is 240
+        greys = np.clip((120 * depths / RADIUS).astype(int), 0, 255)
+        colours += [(grey, grey, grey) for grey in greys.tolist()]
+        # Width of closest line is 5, width of furthest line is 1
+        widths = (5 - 2 * depths / RADIUS).astype(int)
+        ends = np.array([edges[i] for i in order], dtype=int).reshape(-1, 2)
+
+        lines = self._lines(points[ends[:,0]], points[ends[:,1]], widths)
+        self._paint(np.vstack((np.hstack((heads, tails)), lines)),
+                    np.concatenate((owners, np.tile(2*number +
+                                                    np.arange(len(order)), 4))),
+                    np.array(colours, dtype=np.uint8).reshape(-1, 3),
+                    np.arange(len(colours)) < 2*number)
+
+    def _paint(self, edges, owner, colours, isFace, planes=None):
+        # Fill in every item of the frame at once, each inside its edges.
+        # edges: the edges of every item, as x0, y0, x1, y1 (np.ndarray, Ex4)
+        # owner: the item each edge is around (np.ndarray, E)
+        # colours: the red, green, and blue of each item (np.ndarray, Ix3)
+        # isFace: whether each item is a face (np.ndarray, I)
+        #         faces are filled where an odd number of edges wind around,
+        #         like stars, and thick lines where any edges wind around
+        # planes: one over the depth of each item is a*x + b*y + c
+        #         (np.ndarray, Ix3), or None to show the last item painted
+        # Hard-coded constants
+        bias = 0.01     # Fraction of depth outlines may be behind faces
+        batch = 65536   # Number of pixels to fill at a time
+
+        height, width = self._height, self._width
+        x0, y0, x1, y1 = edges.T
+
+        # Pixel k covers k to k+1, so each edge crosses the rows of pixels
+        # whose centres are from its lowest to just before its highest end
+        first = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, height)
+        last = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, height)
+        number = (last - first).astype(int)
+        slope = np.divide(x1 - x0, y1 - y0, out=np.zeros(len(edges)),
+                          where=number > 0)
+        edge = np.repeat(np.arange(len(edges)), number)
+        row = self._spread(first.astype(int), number)
+        x = (x0 + (0.5 - y0) * slope)[edge] + row * slope[edge]
+        # Crossings left or right of the frame still wind around pixels
+        col = np.clip(np.ceil(x - 0.5), 0, width).astype(int)
+
+        # Sort crossings along each row of each item, with whether the edge
+        # goes down or up in the lowest bit, and count windings
+        key = (row * (width + 1) + col) << 1
+        key += (owner * height * (width + 1) << 1 | (y1 > y0))[edge]
+        key.sort()
+        turn = (key & 1) * 2 - 1
+        key >>= 1
+        line = key // (width + 1)
+        col = key - line * (width + 1)
+        winding = np.cumsum(turn)
+        starts = np.flatnonzero(np.concatenate(([True],
+                                                line[1:] != line[:-1])))
+        lengths = np.diff(np.append(starts, len(line)))
+        winding -= np.repeat(winding[starts] - turn[starts], lengths)
+
+        # Pixels from one crossing to the next are inside the item if the
+        # edges wind around them, an odd number of times for faces
+        items = line[:-1] // height
+        inside = np.where(isFace[items], winding[:-1] % 2 != 0,
+                          winding[:-1] != 0)
+        inside &= (line[:-1] == line[1:]) & (col[:-1] < col[1:])
+        items = items[inside]
+        rows = line[:-1][inside] - items * height
+        cols = col[:-1][inside]
+        lengths = col[1:][inside] - cols
+
+        # Each pixel shows the item with the largest key, which is the last
+        # item painted, or the closest face with the z-buffer. Keys hold the
+        # item in their lowest bits, so one pass finds the largest key and
+        # its item, and of items just as close the last one painted wins.
+        shift = len(colours).bit_length()
+        best = self._best
+        best.fill(-1)
+        if planes is not None:
+            planes = planes * np.where(isFace, 1, 1 + bias)[:,None]
+            # One over the depth is a*x + b*y + c at the centre of pixel
+            # x, y, so it goes up by a at every pixel along a span. It is
+            # scaled to whole numbers from 2**(60-shift) to 3 times that.
+            a, b, c = planes[items].T
+            depth = a * (cols + 0.5) + b * (rows + 0.5) + c
+            top = max(np.abs(depth).max(initial=1e-300),
+                      np.abs(depth + a * (lengths - 1)).max(initial=0))
+            scale = 2.0**(60 - shift) / top
+            steps = np.rint(a * scale).astype(np.int64) << shift
+            keys = (np.rint((depth + 2 * top) * scale).astype(np.int64)
+                    << shift | items)
+
+        # Spans are filled a batch at a time, so their keys stay in the cache
+        cuts = [0] + np.searchsorted(np.cumsum(lengths), np.arange(
+            batch, lengths.sum(), batch)).tolist() + [len(items)]
+        starts = rows * width + cols
+        for span in map(slice, cuts[:-1], cuts[1:]):
+            index = self._spread(starts[span], lengths[span])
+            if planes is None:
+                key = np.repeat(items[span], lengths[span])
+            else:
+                key = self._spread(keys[span], lengths[span], steps[span])
+            np.maximum.at(best, index, key)
+
+        # Pixels outside every item have a key of -1, and the last colour
+        palette = np.empty((1 << shift, 3), dtype=np.uint8)
+        palette[:len(colours)] = colours
+        palette[-1] = self._colour(self.cols['menu']['canvas'])
+        best &= (1 << shift) - 1
+        np.take(palette, best, axis=0, out=self._pixels.reshape(-1, 3))
+
+    def _spread(self, starts, lengths, steps=None):
+        # Count up along many spans at once, from the start of each span
+        # for as many numbers as its length.
+        # starts: the first number of each count (np.ndarray, N)
+        # lengths: how many numbers each count has (np.ndarray, N)
+        # steps: what each count goes up by, or None to go up by one
+        #        (np.ndarray, N), and counts may wrap around past the
+        #        largest int64 on the way, as long as they end up in it
+        # return: all the counts, one after another (np.ndarray)
+        total = lengths.sum()
+        if len(self._ramp) < total:
+            self._ramp = np.arange(2 * total, dtype=np.int32)
+        firsts = np.cumsum(lengths) - lengths
+        if steps is None:
+            counts = np.repeat((starts - firsts).astype(np.int32), lengths)
+            counts += self._ramp[:total]
+        else:
+            counts = np.repeat(steps, lengths)
+            counts *= self._ramp[:total]
+            counts += np.repeat(starts - steps * firsts, lengths)
+        return counts
+
+    def _lines(self, heads, tails, width):
+        # Find the outlines of thick lines, each a rectangle around a line.
+        # Rectangles all turn the same way, so where they overlap, they
+        # wind around the pixels more and are still filled in.
+        # heads, tails: the ends of the lines (np.ndarray, Lx2)
+        # width: the width of the lines in pixels (int or np.ndarray, L)
+        # return: the edges of the rectangles, as x0, y0, x1, y1, first the
+        #         first edge of every rectangle, then the second, and so on
+        #         (np.ndarray, 4Lx4)
+        along = tails - heads
+        lengths = np.sqrt((along**2).sum(axis=1))
+        lengths[lengths == 0] = 1   # Lines with no length are not filled
+        across = along[:,::-1] * [-1, 1] / lengths[:,None]
+        across *= (np.maximum(width, 1) / 2)[...,None]
+        a, b = heads + across, tails + across
+        c, d = tails - across, heads - across
+        return np.vstack((np.hstack((a, b)), np.hstack((b, c)),
+                          np.hstack((c, d)), np.hstack((d, a))))
+
+    def _colour(self, hexcol):
+        # Convert a colour to red, green, and blue.
+        # hexcol: the colour (str): '#rgb' or '#rrggbb'
+        # return: the red, green, and blue from 0 to 255 (tuple, len=3)
+        digits = (len(hexcol) - 1) // 3
+        scale = 17 if digits == 1 else 1    # #f is #ff
+        return tuple([int(hexcol[1+digits*i:1+digits*(i+1)], 16) * scale
+                      for i in range(3)])
+
+
+
+class Rotation():
+
+    """
+    Mathematical class that builds and caches rotations about an axis-plane.
+
+    Public methods:
+    get_matrix          Return the rotation matrix for an angle.
+
+    Private methods:
+    __init__            Construct Rotation class.
+    _build              Build the rotation matrix for an angle.
+
+    Private variables:
+    _plane              Projection onto the axis-plane (np.ndarray, 4x4)
+    _turn0              Projection onto the rotated plane (np.ndarray, 4x4)
+    _turn90             Quarter turn of the rotated plane (np.ndarray, 4x4)
+    _matrices           The rotation matrices of the arrow keys (dict)
+                            keys are ROTANGLE and -ROTANGLE (float)
+                            values are rotation matrices (np.ndarray, 4x4)
+    """
+
+    def __init__(self, axes):
+        """
+        Construct Rotation class.
+        axes: the perpendicular unit axes of rotation (list, len=2)
+              all elements are in spherical coordinates (list, len=3)
+        """
+        # Remember to add in the value for the radius when converting
+        i = np.array(normalize(convert([1] + list(axes[0]), True)))
+        j = np.array(normalize(convert([1] + list(axes[1]), True)))
+
+        # Make the basis of the axis-plane orthonormal first
+        j = j - i.dot(j)*i
+        if np.sqrt(j.dot(j)) < EPSILON:     # Not a plane, so never rotate
+            self._plane = np.identity(4)
+            self._turn0 = np.zeros((4, 4))
+            self._turn90 = np.zeros((4, 4))
+        else:
+            j = j / np.sqrt(j.dot(j))
+            self._plane = np.outer(i, i) + np.outer(j, j)
+            # Find any unit c perpendicular to the axis-plane, then d = c x i x j
+            complement = np.identity(4) - self._plane
+            c = complement[np.argmax(np.diag(complement))]
+            c = c / np.sqrt(c.dot(c))
+            d = np.array(cross4D(c, i, j))
+            self._turn0 = np.outer(c, c) + np.outer(d, d)
+            self._turn90 = np.outer(d, c) - np.outer(c, d)
+
+        # Arrow keys rotate by ROTANGLE, so build those once right away
+        self._matrices = {angle: self._build(angle)
+                          for angle in (ROTANGLE, -ROTANGLE)}
+
+    def get_matrix(self, rotAngle):
+        """
+        Return the matrix that fixes the axis-plane and rotates its
+        orthogonal complement by an angle. Only the arrow key angles are
+        kept; held buttons rotate by the time each frame took, so their
+        angles are never the same twice and are built every time.
+        rotAngle: the angle to rotate by (float)
+        return: the orthogonal rotation matrix (np.ndarray, 4x4)
+        """
+        matrix = self._matrices.get(rotAngle)
+        if matrix is None:
+            matrix = self._build(rotAngle)
+        return matrix
+
+    def _build(self, rotAngle):
+        # Build the rotation matrix for an angle.
+        # rotAngle: the angle to rotate by (float)
+        # return: the orthogonal rotation matrix (np.ndarray, 4x4)
+        return (self._plane + math.cos(rotAngle)*self._turn0 +
+                math.sin(rotAngle)*self._turn90)
+
+
+
+class DepthOrder():
+
+    """
+    Mathematical class that keeps things sorted from furthest to closest.
+
+    Public methods:
+    sort                Sort things by depth, starting from the last order.
+    get_swaps           Return the number of things the last sort moved.
+
+    Private methods:
+    __init__            Construct DepthOrder class.
+
+    Private variables:
+    _order              The keys in the order of the last sort (list)
+    _last               The keys in the order before the last sort (list)
+                            or None if it sorted from scratch
+    """
+
+    def __init__(self):
+        """Construct DepthOrder class."""
+        self._order = []
+        self._last = None
+
+    def sort(self, depths):
+        """
+        Sort things by depth, furthest first, by repairing the last order.
+        The camera barely moves between frames, so the last order is nearly
+        sorted, and list.sort finds the runs that are still in order and
+        merges them, instead of sorting every thing from scratch like
+        sorted. If things appeared or disappeared, sort from scratch.
+        depths: the depth of each thing (dict)
+                all keys are anything that can be sorted (hashable)
+                all values are the depths of those things (comparable)
+        return: the keys of depths from furthest to closest (list)
+        """
+        last = self._order
+        order = None
+        if len(last) == len(depths):
+            order = last[:]
+            try:    # Any new thing means an old thing is not in depths
+                order.sort(key=depths.__getitem__, reverse=True)
+            except KeyError:
+                order = None
+        if order is None:   # Things appeared or disappeared
+            last = None
+            order = sorted(depths, key=depths.__getitem__, reverse=True)
+        self._order = order
+        self._last = last
+        return order
+
+    def get_swaps(self):
+        """
+        Return the number of things the last sort moved from their place
+        in the order before it, only counted when asked for.
+        return: the number of things moved (int), or None if the last sort
+                had to start from scratch
+        """
+        if self._last is None:
+            return None
+        return sum(map(operator.ne, self._last, self._order))
+
+
+
+class Profiler():
+
+    """
+    Helper class that times each phase of the frames drawn on the canvas.
+    A frame begins, each mark adds the time since the last mark to a
+    phase, and the frame ends, joining the last frames in the window.
+
+    Public methods:
+    begin               Begin a frame, unless one has already begun.
+    mark                Add the time since the last mark to a phase.
+    count               Count a call made to Tk during the frame.
+    end                 End the frame and keep it in the window.
+    get_stats           Return statistics about the last frames.
+
+    Private methods:
+    __init__            Construct Profiler class.
+
+    Private variables:
+    _window             The last frames, oldest first (collections.deque)
+                            elements are the seconds, phase seconds,
+                            Tk call counts, and sizes of a frame (tuple)
+    _frames             The number of frames ever ended (int)
+    _start              When this frame began, or None if not begun (float)
+    _last               When the last mark was made (float)
+    _phases             The seconds of each phase this frame (dict)
+    _calls              The number of each Tk call this frame (dict)
+    """
+
+    def __init__(self, size):
+        """
+        Construct Profiler class.
+        size: the number of frames to keep for the statistics (int)
+        """
+        self._window = collections.deque(maxlen=size)
+        self._frames = 0
+        self._start = None
+
+    def begin(self):
+        """Begin a frame, unless one has already begun."""
+        if self._start is None:
+            self._start = self._last = time.perf_counter()
+            self._phases = {}
+            self._calls = {}
+
+    def mark(self, phase):
+        """
+        Add the time since the last mark, or the beginning, to a phase.
+        phase: the name of the phase that just finished (str)
+        """
+        now = time.perf_counter()
+        self._phases[phase] = self._phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    def count(self, call):
+        """
+        Count a call made to Tk during the frame.
+        call: the name of the call, such as 'create' (str)
+        """
+        self._calls[call] = self._calls.get(call, 0) + 1
+
+    def end(self, sizes):
+        """
+        End the frame and keep it in the window.
+        sizes: the number of vertices, edges, and faces drawn (tuple, len=3)
+        """
+        seconds = time.perf_counter() - self._start
+        self._window.append((seconds, self._phases, self._calls, sizes))
+        self._frames += 1
+        self._start = None
+
+    def get_stats(self):
+        """
+        Return statistics about the frames in the window.
+        return: None if no frame has ended, otherwise (dict) with keys
+                'frames': the number of frames ever ended (int)
+                'window': the number of frames in the window (int)
+                'seconds': the seconds of the last frame (float)
+                'phases': the seconds of each phase of the last frame (dict)
+                'calls': the number of each Tk call of the last frame (dict)
+                'sizes': the vertices, edges, and faces drawn (tuple, len=3)
+                'percentiles': the 50th, 90th, and 99th percentile seconds
+                               of the frames in the window (list, len=3)
+                'means': the mean seconds of each phase in the window (dict)
+        """
+        if not self._window:
+            return None
+        seconds, phases, calls, sizes = self._window[-1]
+        means = {}
+        for frame in self._window:
+            for phase, spent in frame[1].items():
+                means[phase] = means.get(phase, 0) + spent/len(self._window)
+        percentiles = np.percentile([frame[0] for frame in self._window],
+                                    [50, 90, 99]).tolist()
+        return {'frames': self._frames, 'window': len(self._window),
+                'seconds': seconds, 'phases': dict(phases),
+                'calls': dict(calls), 'sizes': sizes,
+                'percentiles': percentiles, 'means': means}
+
+
+
+class Scheduler():
+
+    """
+    Helper class that calls a function once per frame until stopped.
+    The function is told how many seconds passed since its last call, so
+    anything it animates moves at the same speed on slow and fast machines.
+    Frames start at most rate times a second, and a slow frame only delays
+    the next one, since the frames it overran are skipped, not queued.
+
+    Public methods:
+    start               Start calling a function once per frame.
+    stop                Stop calling the function.
+    is_running          Return if the function is being called.
+
+    Private methods:
+    __init__            Construct Scheduler class.
+    _tick               Call the function and schedule the next frame.
+                        If the function raises, it is stopped instead.
+
+    Private variables:
+    _widget             The widget whose event loop runs the frames (tk.Misc)
+    _period             The fewest seconds between frames (float)
+    _step               The function to call every frame (function)
+    _last               When the function was last called (float)
+    _afterID            To cancel the next frame (str), or None if stopped
+    """
+
+    def __init__(self, widget, rate):
+        """
+        Construct Scheduler class.
+        widget: the widget to schedule frames with (tk.Misc)
+        rate: the most frames per second (int)
+        """
+        self._widget = widget
+        self._period = 1 / rate
+        self._step = None
+        self._afterID = None
+
+    def start(self, step):
+        """
+        Start calling a function once per frame, starting right away.
+        Any function already being called is stopped first.
+        step: the function to call with the seconds since its last call,
+              which is one frame for the first call (function)
+        """
+        self.stop()
+        self._step = step
+        self._last = time.perf_counter() - self._period
+        self._tick()
+
+    def stop(self):
+        """Stop calling the function, and cancel its next frame."""
+        if self._afterID is not None:
+            self._widget.after_cancel(self._afterID)
+            self._afterID = None
+        self._step = None
+
+    def is_running(self):
+        """
+        Return if the function is being called every frame.
+        return: true if started and not yet stopped (bool)
+        """
+        return self._step is not None
+
+    def _tick(self):
+        # Call the function, then schedule the next frame one period after
+        # this one started, or as soon as possible if this one overran.
+
+        # Hard-coded constants
+        longest = 0.25      # Most seconds to catch up on after a freeze
+
+        now = time.perf_counter()
+        elapsed = min(now - self._last, longest)
+        self._last = now
+        self._afterID = None
+        try:
+            self._step(elapsed)
+        except Exception:
+            # Stop, so is_running is false and the next start is not
+            # ignored, then let the event loop report the error
+            self.stop()
+            raise
+        if self._step is not None:      # Not stopped by the function
+            wait = self._period - (time.perf_counter() - now)
+            self._afterID = self._widget.after(max(1, int(wait * 1000)),
+                                               self._tick)
+
+
+
+class Mesh():
+
+    """
+    Mathematical class that links the faces and edges of a polytope.
+    Every face has a half-edge along each of its sides, linked around it.
+    Edges on fewer than two faces get outside half-edges with no face (-1).
+    Faces are not always orientable, and an edge can be on more than two
+    faces, so the half-edges along an edge are linked in a ring by twin,
+    instead of pointing the opposite way. The faces and edges are both
+    read back from the half-edges.
+
+    Public methods:
+    get_faces           Return a dict of faces as lists of points.
+    get_edges           Return a list of edges as pairs of points.
+    get_sides           Return the sides of every face, in order around it.
+    get_face_neighbours Return the faces sharing an edge with a face.
+    get_vertex_star     Return the edges and faces around a point.
+    get_edge_faces      Return the faces on an edge.
+    get_silhouette      Return the edges between front and back faces.
+    is_closed           Return whether the faces close up with no holes.
+
+    Private methods:
+    __init__            Construct Mesh class.
+
+    Private variables:
+    _vertex             The point each half-edge leaves from (np.ndarray)
+    _target             The point each half-edge goes to (np.ndarray)
+    _next               The next half-edge around its face (np.ndarray)
+                            -1 for outside half-edges
+    _twin               The next half-edge along the same edge (np.ndarray)
+    _face               The face of each half-edge (np.ndarray)
+                            -1 for outside half-edges
+    _edge               The edge of each half-edge (np.ndarray)
+    _faceHalf           The first half-edge of each face (np.ndarray)
+    _edgeHalf           The first half-edge of each edge, going the same
+                        way as the edge it was made with (np.ndarray)
+    _starStart          Where the half-edges of each point start (np.ndarray)
+    _star               The half-edges touching each point (np.ndarray)
+                            sorted by point, each appears at both ends
+    _sides              The number of half-edges along faces, which come
+                        before the outside half-edges (int)
+    _edges              The edges, walked from the half-edges (list)
+    _faces              The faces, walked from the half-edges (dict)
+    """
+
+    def __init__(self, edges, faces, number):
+        """
+        Construct Mesh class.
+        edges: the edges of the polytope (list)
+               all elements are pairs of point indices (list, len=2)
+               sides of faces that are not edges are added after them
+        faces: the faces of the polytope, numbered from zero (list)
+               all elements are cycles of point indices (tuple)
+        number: the number of points of the polytope (int)
+        """
+        ends = [tuple(edge) for edge in edges]
+        index = {(min(edge), max(edge)): i for i,edge in enumerate(ends)}
+        vertex, target, nxt, face, edge = [], [], [], [], []
+        faceHalf = []
+        for f,cycle in enumerate(faces):
+            faceHalf.append(len(vertex))
+            for i,a in enumerate(cycle):
+                b = cycle[(i+1)%len(cycle)]
+                key = (min(a, b), max(a, b))
+                if key not in index:    # A side that is not an edge yet
+                    index[key] = len(ends)
+                    ends.append((a, b))
+                vertex.append(a)
+                target.append(b)
+                nxt.append(len(vertex) if i+1 < len(cycle) else faceHalf[f])
+                face.append(f)
+                edge.append(index[key])
+        self._sides = len(vertex)
+
+        # Give edges on fewer than two faces outside half-edges
+        halves = [[] for e in ends]
+        for h,e in enumerate(edge):
+            halves[e].append(h)
+        for e,(a, b) in enumerate(ends):
+            for side in range(len(halves[e]), 2):
+                halves[e].append(len(vertex))
+                vertex.append((b, a)[side])
+                target.append((a, b)[side])
+                nxt.append(-1)
+                face.append(-1)
+                edge.append(e)
+
+        # Link the half-edges of each edge in a ring, starting from one
+        # that goes the same way as the edge
+        twin = [0] * len(vertex)
+        edgeHalf = []
+        for e,ring in enumerate(halves):
+            for i,h in enumerate(ring):
+                twin[h] = ring[(i+1)%len(ring)]
+            edgeHalf.append(next((h for h in ring
+                                  if vertex[h] == ends[e][0]), ring[0]))
+
+        self._vertex = np.array(vertex, dtype=int)
+        self._target = np.array(target, dtype=int)
+        self._next = np.array(nxt, dtype=int)
+        self._twin = np.array(twin, dtype=int)
+        self._face = np.array(face, dtype=int)
+        self._edge = np.array(edge, dtype=int)
+        self._faceHalf = np.array(faceHalf, dtype=int)
+        self._edgeHalf = np.array(edgeHalf, dtype=int)
+        # Sort the half-edges by both of their points, to find stars
+        points = np.concatenate([self._vertex, self._target])
+        order = np.argsort(points, kind='stable')
+        self._star = order % len(vertex) if len(vertex) else order
+        self._starStart = np.searchsorted(points[order],
+                                          np.arange(number + 1))
+
+        # Walk each edge and each face from its first half-edge
+        self._edges = list(zip(self._vertex[self._edgeHalf].tolist(),
+                               self._target[self._edgeHalf].tolist()))
+        self._faces = {}
+        for f,first in enumerate(faceHalf):
+            cycle = []
+            h = first
+            while True:
+                cycle.append(vertex[h])
+                h = nxt[h]
+                if h == first:
+                    break
+            self._faces[f] = tuple(cycle)
+
+    def get_faces(self):
+        """
+        Return a dictionary of faces, walked from the half-edges.
+        return: a dictionary of faces (dict)
+                all keys are face numbers (int)
+                all values are tuples of the numbers of the points (tuple)
+        """
+        return self._faces
+
+    def get_edges(self):
+        """
+        Return a list of edges, read from the first half-edge of each.
+        return: a list of edges (list)
+                all elements are pairs of point numbers (tuple, len=2)
+        """
+        return self._edges
+
+    def get_sides(self):
+        """
+        Return the sides of every face, read from the half-edges.
+        return: the point each side leaves from, the point it goes to,
+                and its face, for the sides of each face in order around
+                it, one face after another (np.ndarray, Sx3)
+        """
+        sides = slice(0, self._sides)
+        return np.column_stack((self._vertex[sides], self._target[sides],
+                                self._face[sides]))
+
+    def get_face_neighbours(self, face):
+        """
+        Return the faces across each side of a face.
+        face: the face number (int)
+        return: the face across each side, in order around the face (list)
+                all elements are face numbers (int), or -1 if none
+        """
+        neighbours = []
+        start = h = self._faceHalf[face]
+        while True:
+            neighbours.append(int(self._face[self._twin[h]]))
+            h = self._next[h]
+            if h == start:
+                return neighbours
+
+    def get_vertex_star(self, point):
+        """
+        Return the edges and faces around a point.
+        point: the point number (int)
+        return: the edge numbers and face numbers around the point (list)
+                [edges, faces], faces do not include -1 (list, len=2)
+        """
+        halves = self._star[self._starStart[point]:self._starStart[point+1]]
+        edges = sorted(set(self._edge[halves].tolist()))
+        faces = sorted(set(self._face[halves].tolist()) - {-1})
+        return [edges, faces]
+
+    def get_edge_faces(self, edge):
+        """
+        Return the faces on an edge.
+        edge: the edge number (int)
+        return: the face numbers on the edge, -1 if outside (list)
+        """
+        faces = []
+        start = h = self._edgeHalf[edge]
+        while True:
+            faces.append(int(self._face[h]))
+            h = self._twin[h]
+            if h == start:
+                return faces
+
+    def get_silhouette(self, front):
+        """
+        Return the edges between faces that face the camera and faces
+        that do not, including the edges of front faces with no neighbour.
+        front: whether each face faces the camera (list)
+               all elements are bools, indexed by face number
+        return: the edge numbers of the silhouette (list)
+        """
+        facing = np.append(np.array(front, dtype=bool), False)  # -1 is back
+        sides = facing[self._face]
+        fronts = np.bincount(self._edge, weights=sides,
+                             minlength=len(self._edges))
+        totals = np.bincount(self._edge, minlength=len(self._edges))
+        return np.nonzero((fronts > 0) & (fronts < totals))[0].tolist()
+
+    def is_closed(self):
+        """
+        Return whether the faces close up with no holes, so every side of
+        every face is shared with exactly one other face. Edges that are
+        not on any face do not count.
+        return: whether the faces close up (bool)
+        """
+        counts = np.bincount(self._edge[:self._sides],
+                             minlength=len(self._edges))
+        return bool(((counts == 0) | (counts == 2)).all())
+
 
 
 class Object():
@@ -2077,20 +3827,26 @@ class Object():
 
     Public methods:
     get_points          Return a list of points of the canvas object.
+    get_point_array     Return the points of the canvas object as an array.
     get_edges           Return a list of edges of the canvas object.
+    get_orientation     Return the accumulated rotation of the canvas object.
     set_rotaxis         Set the rotation axis-plane of the canvas object.
     rotate              Rotate the canvas object.
+    copy                Return an unrotated copy of the canvas object.
 
     Private methods:
     __init__            Construct Object class.
+    _orient             Apply the accumulated rotation to pristine points.
 
     Private variables:
-    _points             The points of the canvas object (list)
-                            elements are in Cartesian coordinates (list)
+    _points             The pristine points of the object (np.ndarray, Nx4)
+                            rows are in Cartesian coordinates
     _edges              The edges of the canvas object (list)
                             elements are lists of point indices (list)
-    _axis_i             A basis vector of the rotation axis-plane (list)
-    _axis_j             A basis vector, both in Cartesian coordinates (list)
+    _rotation           The rotations about the axis-plane (Rotation)
+    _orientMatrix       The accumulated rotation (np.ndarray, 4x4)
+    _rotations          The number of rotations since last orthonormal (int)
+    _oriented           Oriented coordinates until the next rotation (dict)
     """
 
     def __init__(self, points, edges):
@@ -2101,8 +3857,12 @@ class Object():
         edges: the edges of the canvas object (list)
             elements are lists of edge endpoints (list, len=2)
         """
-        self._points = points
+        # Keep all points in one contiguous buffer to rotate them together
+        self._points = np.array(points, dtype=float).reshape(-1, 4)
         self._edges = edges
+        self._orientMatrix = np.identity(4)
+        self._rotations = 0
+        self._oriented = {}
 
     def get_points(self):
         """
@@ -2110,7 +3870,20 @@ class Object():
         return: a list of points of the canvas object (list)
                 all elements are in Cartesian coordinates (list, len=4)
         """
-        return self._points
+        if 'points' not in self._oriented:
+            self._oriented['points'] = self.get_point_array().tolist()
+        return self._oriented['points']
+
+    def get_point_array(self):
+        """
+        Return the points of the canvas object as one array, which is
+        what drawing uses, so they are never turned into lists each frame.
+        return: the points of the canvas object (np.ndarray, Nx4)
+                rows are in Cartesian coordinates, and must not be changed
+        """
+        if 'array' not in self._oriented:
+            self._oriented['array'] = self._orient(self._points)
+        return self._oriented['array']
 
     def get_edges(self):
         """
@@ -2120,35 +3893,55 @@ class Object():
         """
         return self._edges
 
-    def set_rotaxis(self, axes):
+    def get_orientation(self):
         """
-        Set the perpendicular unit axes of rotation of the canvas object.
-        axes: the perpendicular unit axes of rotation (list, len=2)
-              all elements are in spherical coordinates (list, len=3)
+        Return the accumulated rotation of the canvas object.
+        return: the rotation from the pristine points (np.ndarray, 4x4)
         """
-        # Remember to add in the value for the radius when converting
-        self._axis_i = normalize(convert([1] + list(axes[0]), True))
-        self._axis_j = normalize(convert([1] + list(axes[1]), True))
+        return self._orientMatrix
+
+    def set_rotaxis(self, rotation):
+        """
+        Set the rotation axis-plane of the canvas object.
+        rotation: the rotations about the axis-plane, which may be shared
+                  with other canvas objects (Rotation)
+        """
+        self._rotation = rotation
 
     def rotate(self, rotAngle):
         """
         Rotate the canvas object.
         rotAngle: the angle to rotate the canvas object by (float)
         """
-        i = self._axis_i
-        j = self._axis_j
-        cos = math.cos(rotAngle)
-        sin = math.sin(rotAngle)
-        for n in range(len(self._points)):
-            p = self._points[n]
-            r = sum([p[t]*i[t] for t in range(4)])
-            s = sum([p[t]*j[t] for t in range(4)])
-            I = [i[t]*r+j[t]*s for t in range(4)]
-            ip = [p[t]-I[t] for t in range(4)]
-            if ip != [0,0,0,0]:     # If I = P, then there is no rotation
-                iq = cross4D(ip, i, j, ip)
-                self._points[n] = [ip[t]*cos+iq[t]*sin + I[t]
-                                   for t in range(4)]
+        # Only accumulate the rotation, the points themselves never change
+        self._orientMatrix = self._rotation.get_matrix(rotAngle).dot(
+            self._orientMatrix)
+        self._rotations += 1
+        if self._rotations == ORTHOSTEPS:
+            # Snap back to the nearest orthogonal matrix to stop any drift
+            u, s, vt = np.linalg.svd(self._orientMatrix)
+            self._orientMatrix = u.dot(vt)
+            self._rotations = 0
+        self._oriented = {}
+
+    def copy(self):
+        """
+        Return an unrotated copy of the canvas object.
+        return: a canvas object that shares the pristine points, faces, and
+                so on, which never change, but rotates on its own (Object)
+        """
+        other = copy.copy(self)
+        other._orientMatrix = np.identity(4)
+        other._rotations = 0
+        other._oriented = {}
+        return other
+
+    def _orient(self, points):
+        # Apply the accumulated rotation to pristine points.
+        # points: the pristine points (np.ndarray, Nx4)
+        # return: the rotated points (np.ndarray, Nx4)
+        # Points are rows, so multiply by the transpose of the rotation
+        return points.dot(self._orientMatrix.T)
 
 
 
@@ -2160,33 +3953,42 @@ class Polytope(Object):
     Inherited methods:
     __init__            Construct Polytope class.
     get_points          Return a list of points of the polytope.
-    get_edges           Return a list of edges of the polytope.
+    get_point_array     Return the points of the polytope as an array.
+    get_orientation     Return the accumulated rotation of the polytope.
     set_rotaxis         Set the rotation axis-plane of the polytope.
-    rotate              Rotate the polytope and reset midpoints and centres.
+    rotate              Rotate the polytope.
+    copy                Return an unrotated copy of the polytope.
 
     Inherited variables:
-    _points             The points of the polytope (list)
-                            elements are in Cartesian coordinates (list)
+    _points             The pristine points of the polytope (np.ndarray)
+                            rows are in Cartesian coordinates
     _edges              The edges of the polytope (list)
                             elements are lists of point indices (list)
-    _axis_i             A basis vector of the rotation axis-plane (list)
-    _axis_j             A basis vector, both in Cartesian coordinates (list)
+    _rotation           The rotations about the axis-plane (Rotation)
+    _orientMatrix       The accumulated rotation (np.ndarray, 4x4)
 
     Public methods:
     get_point_colours   Return a list of colours of the points.
+    get_edges           Return a list of edges of the polytope.
     get_faces           Return a dict of faces of the polytope.
     get_face_sides      Return a dict of the number of each polygon.
     get_faces_by_side   Return a dict of the polygon type of each face.
     get_edge_centres    Return a list of edge midpoints of the polytope.
     get_face_centres    Return a dict of face centres of the polytope.
     get_shades          Calculate the amount of shading needed for each face.
+    get_depths          Return how far each face is from the camera.
+    get_data            Return the data needed to make the polytope again.
+    get_mesh            Return the half-edge mesh of the polytope.
+    neighbours_within   Return the points near each point of the polytope.
 
     Public variables:
     star                To keep track of if there are star faces. (bool)
+    convex              To keep track of if back faces can be culled. (bool)
 
     Private methods:
     _set_faces          Create the face dictionaries using the edge list.
-    _bfs                Breadth-first search.
+    _set_planes         Group edges by the planes they are in.
+    _cycles             Walk the cycles made by edges in one plane.
     _has_star           Check to see if a polygon is a star.
     _orientation        Find the orientation of two connected line segments.
     _set_edge_centres   Create a list of edge midpoints.
@@ -2196,6 +3998,8 @@ class Polytope(Object):
     _remove_odd_faces   Remove types of faces that there are an odd number of.
     _remove_small_faces Remove types of faces that there're a small number of.
     _remove_close_faces Remove faces that are too close to the centre.
+    _set_convex         Check to see if the polytope is convex.
+    _set_mesh           Number the faces and link them in a mesh.
 
     Private variables:
     _pointColours       The point colours of the polytope (list)
@@ -2203,19 +4007,21 @@ class Polytope(Object):
     _faces              The faces of the polytope (dict)
                             keys are face indices (int)
                             values are lists of point indices (list)
+                            once the mesh is made, a view of its faces
+    _mesh               The sides of the faces, linked by half-edges (Mesh)
     _faceSides          The number of types of each polygon face (dict)
                             keys are the number of sides of the polygon (int)
                             values are the number of those polygons (int)
     _faceTypes          The polygon type of the faces of the polytope (dict)
                             keys are face indices (int)
                             values are the number of sides of the face (int)
-    _edgeCentres        The midpoints of the edges of the polytope (list)
-                            elements are in Cartesian coordinates (list)
-    _faceCentres        The centres of the faces of the polytope (list)
-                            elements are in Cartesian coordinates (list)
+    _edgeCentres        The pristine edge midpoints (np.ndarray, Ex4)
+                            rows are in Cartesian coordinates
+    _faceCentres        The pristine centres of the faces (dict)
+                            keys are face indices (int)
+                            values are in Cartesian coordinates (list)
     _graph              To better represent edges as point neighbours (dict)
-    _visited            To keep track of already visited points (set)
-    _triangles          To keep track of already added triangles (set)
+    _coords             To read the points quickly while finding faces (list)
     """
 
     def __init__(self, data):
@@ -2223,8 +4029,20 @@ class Polytope(Object):
         Construct Polytope class.
         data: the initialization data for the polytope (list)
               each element is a list, data = [points, edges, pointColours]
+              or, to skip finding faces, the six lists from get_data
         """
-        if data:
+        if data and len(data) > 3:  # Faces were found before, reuse them
+            super().__init__(data[0], data[1])
+            self._pointColours = data[2]
+            self._faces = dict(enumerate(data[3]))
+            self._faceTypes = dict(enumerate(data[4]))
+            self._faceSides = dict(data[5])
+            self.star = any([self._faceSides[i] > 0 for i in range(12,21)])
+            self._set_edge_centres()
+            self._set_face_centres()
+            self._set_mesh()
+            self._set_convex()
+        elif data:
             super().__init__(data[0], data[1])
             self._pointColours = data[2]
             self._set_faces()
@@ -2235,18 +4053,27 @@ class Polytope(Object):
             if len(self._faces)/len(self._points) < 1/3 \
                 and len(self._faces) != 1:
                 self.star = False
-                self._points = []
+                self._points = np.empty((0, 4))
                 # canvas expects int values, but _faceSides has list values
                 self._faceSides = {i:0 for i in range(3,21)}
             else:
                 self._remove_faces()
+            self._set_mesh()
+            self._set_convex()
         else:
             super().__init__([], [])    # Empty polytope, only rotates
             self.star = False
+            self._faces = {}
+            self._faceTypes = {}
+            self._faceCentres = {}
+            self._set_mesh()
+            self.convex = False
 
     def _set_faces(self):
         # Create a dictionary of faces, a dictionary of face sides,
         # and a dictionary of faces by side, using only a list of edges.
+        # Every face lies in the plane of two of its edges, so group edges
+        # by the planes they are in, then walk each cycle in each plane.
 
         # Initialize variables
         self._graph = {}
@@ -2256,151 +4083,85 @@ class Polytope(Object):
         self._faces = {}
         self._faceSides = {i:[] for i in range(3,21)}
         self._faceTypes = {}
-
-        # Breadth-first search
-        self._visited = set()
-        self._triangles = set()
-        i = 3           # Iterate across all polygon side numbers
-        while i < 11:
-            j = 0       # Iterate across all vertices in graph
-            while j < len(self._points):
-                for start in self._graph[j]:
-                    faces = self._bfs(j, start, i)  # Find cycles of length i
-                    if faces:       # Two faces can both go from start to j
-                        for face in faces:
-                            n = len(self._faces)    # Find current face number
-                            if self._has_star(face) == True:
-                                self._faceSides[i+10].append(n)
-                                self._faceTypes[n] = i+10
-                            else:
-                                self._faceSides[i].append(n)
-                                self._faceTypes[n] = i
-                            self._faces[n] = face
-                j += 1
-            i += 1
-
-    def _bfs(self, end, start, length):
-        # Breadth-first search to find the only path between start and end.
-        # end: the ending vertex (int)
-        # start: the starting vertex (int)
-        # length: the length of the path between start and end (int)
-        # return: the path between start and end (list, len=length)
-        #         all elements are vertices (int)
-
-        # Run the loop explicitly because triangles do not have enough edges
-        # to find two by pathEnd and their vertices can be stored in any order
-        frontier = []
-        paths = []
-        faces = []
-        normals = []
-        for vertex in self._graph[start]:
-            if vertex == end:                   # Avoid drawing lines as faces
+        self._coords = self._points.tolist()
+
+        # Find faces plane by plane, then number them by size then vertex
+        faces = set()
+        for edges in self._set_planes().values():
+            faces.update(self._cycles(edges))
+        for face in sorted(faces, key=lambda face: (len(face), face)):
+            n = len(self._faces)            # Find current face number
+            i = len(face) if len(face) < 11 else 11
+            if self._has_star(face) == True:
+                i += 1 if i == 11 else 10   # Star polygons are 13 to 20
+            self._faceSides[i].append(n)    # 11 and 12 are larger polygons
+            self._faceTypes[n] = i
+            self._faces[n] = face
+
+    def _set_planes(self):
+        # Group edges by the plane of each pair of edges that meet.
+        # return: the edges in each plane (dict)
+        #         all keys are snapped unit normals and distances (tuple)
+        #         all values are sets of edges (set)
+        #         all edges are pairs of point indices, lowest first (tuple)
+        tilt = 0.0001   # Normals closer than this are the same, hard-coded
+        planes = {}
+        for vertex, neighbours in self._graph.items():
+            b = self._coords[vertex]
+            for i,j in itertools.combinations(neighbours, 2):
+                a = self._coords[i]
+                c = self._coords[j]
+                u = [b[t] - a[t] for t in range(3)]
+                v = [c[t] - b[t] for t in range(3)]
+                normal = cross3D(u, v)
+                if normal == [0, 0, 0]:
+                    continue        # Edges are parallel, so no single plane
+                distance = sum([b[t]*normal[t] for t in range(3)])
+                key = [round(x / tilt) for x in normal]
+                offset = round(distance / SNAP)
+                # Choose the normal pointing away from the centre, or any
+                # one way if the plane passes through the centre
+                if offset < 0 or offset == 0 and [x for x in key if x][0] < 0:
+                    key = [-x for x in key]
+                    offset = -offset
+                key = tuple(key + [offset])
+                plane = planes.setdefault(key, set())
+                plane.add((min(i, vertex), max(i, vertex)))
+                plane.add((min(j, vertex), max(j, vertex)))
+        return planes
+
+    def _cycles(self, edges):
+        # Walk the cycles made by edges in one plane.
+        # Vertices with one edge in the plane end a path, which is no face.
+        # Vertices with more than two edges in the plane could go on to
+        # any of them, so they are skipped, with a warning.
+        # edges: the edges in the plane (set)
+        # return: the cycles, each starting from its lowest vertex (list)
+        #         all cycles are tuples of point indices (tuple)
+        graph = {}
+        for edge in edges:
+            graph.setdefault(edge[0], []).append(edge[1])
+            graph.setdefault(edge[1], []).append(edge[0])
+        branches = sorted([x for x in graph if len(graph[x]) > 2])
+        if branches:
+            warnings.warn('Points {} have more than two edges in one plane, '
+                          'so faces through them are left out'
+                          .format(branches), RuntimeWarning)
+        cycles = []
+        visited = set()
+        for start in sorted(graph):
+            if start in visited or len(graph[start]) != 2:
                 continue
-            frontier.append(vertex)
-            paths.append([start, vertex])
-            u = [self._points[start][i] - self._points[end][i]
-                 for i in range(3)]
-            v = [self._points[vertex][i] - self._points[start][i]
-                 for i in range(3)]
-            normals.append(cross3D(u,v))  # Faces must be coplanar
-
-        # Don't have to worry about the frontier when only finding triangles
-        if length == 3:
-            while frontier:
-                vertex = frontier.pop()
-                if end in self._graph[vertex]:
-                    triangle = tuple(sorted([end, start, vertex]))
-                    if triangle in self._triangles:
-                        continue
-                    self._triangles.add(triangle)
-                    for i in range(3):
-                        pathEnd = [triangle[(i+j)%3] for j in range(3)]
-                        two = tuple(sorted([pathEnd, pathEnd[::-1]])[0])
-                        self._visited.add(two)
-                    faces.append((end, start, vertex))
-
-        # Otherwise, run the loop once without finding pathEnd and two
-        else:
-            depthTime = len(frontier)
-            while depthTime > 0:
-                vertex = frontier.pop()
-                path = paths.pop()
-                normal = normals.pop()
-                frontier = [neighbour for neighbour
-                            in self._graph[vertex]] + frontier
-                paths = [path + [neighbour] for neighbour
-                         in self._graph[vertex]] + paths
-                normals = [normal for neighbour
-                           in self._graph[vertex]] + normals
-                depthTime -= 1
-        if len(frontier) == 0:
-            return faces
-
-        # +1 depth represents depths of next layer;
-        # +2 start already went to vertex in _set_faces();
-        # +3, +4 loop already ran for the first two layers above
-        depth = 4
-        depthTime = len(frontier)
-        while depth <= length:
-            vertex = frontier.pop()
-            path = paths.pop()
-            normal = normals.pop()
-            pathEnd = path[-3:] # Two consecutive edges belong to unique face
-            two = tuple(sorted([pathEnd, pathEnd[::-1]])[0])
-
-            # First compare new edge to previous edges for coplanarity
-            if two not in self._visited and two[0] != two[2]:
-                a = self._points[pathEnd[0]]
-                b = self._points[pathEnd[1]]
-                c = self._points[pathEnd[2]]
-                u = [b[i]-a[i] for i in range(3)]
-                v = [c[i]-b[i] for i in range(3)]
-                new = cross3D(u,v)
-                coplanar = True
-                for i in range(3):
-                    if (new[i] - normal[i]) > EPSILON:
-                        coplanar = False
-
-                # Only continue if new edge is coplanar
-                if coplanar and depth == length:
-                    # Side number reached, try to find the end somewhere
-                    for neighbour in self._graph[vertex]:
-                        if neighbour == end:
-                            path.append(end)
-                            sides = []
-                            length = len(path)
-                            for i in range(length):
-                                # Find all sequences of two adjacent sides
-                                three = [path[(i+j)%length] for j in range(3)]
-                                # Find the lexicographically smallest order
-                                two = tuple(sorted([three, three[::-1]])[0])
-                                sides.append(two)
-                                # Don't add if those two adjacent sides are in
-                                if two in self._visited:
-                                    break
-                            else:
-                                self._visited.update(sides)
-                                faces.append(tuple(path))
-
-                # Side number not reached, continue the breadth-first search
-                elif coplanar:
-                    frontier = [neighbour for neighbour
-                                in self._graph[vertex]] + frontier
-                    paths = [path + [neighbour] for neighbour
-                             in self._graph[vertex]] + paths
-                    normals = [normal for neighbour
-                               in self._graph[vertex]] + normals
-
-            # Decrease the number of vertices left in the queue
-            depthTime -= 1
-            if depthTime == 0:
-                # No vertices left in current depth, increase depth by one
-                if len(frontier) == 0:
-                    break
-                else:
-                    depth += 1
-                    depthTime = len(frontier)
-        return faces
+            cycle = [start]
+            previous, vertex = start, min(graph[start])
+            while vertex != start and len(graph[vertex]) == 2:
+                cycle.append(vertex)
+                previous, vertex = vertex, [x for x in graph[vertex]
+                                            if x != previous][0]
+            visited.update(cycle)
+            if vertex == start and len(cycle) > 2:
+                cycles.append(tuple(cycle))
+        return cycles
 
     def _has_star(self, vertices):
         # Check for star polygons by seeing if a polygon's sides intersect.
@@ -2409,13 +4170,13 @@ class Polytope(Object):
         # return: whether the polygon's sides intersect (bool)
         sides = [(vertices[i], vertices[(i+1)%len(vertices)])
                  for i in range(len(vertices))]
-        a = self._points[sides[0][0]]
-        b = self._points[sides[0][1]]
+        a = self._coords[sides[0][0]]
+        b = self._coords[sides[0][1]]
         ab = [b[i] - a[i] for i in range(3)]
         for side in sides:
-            c = self._points[side[0]]
-            d = self._points[side[1]]
-            if a == c or b == c or a == d or b == d:
+            c = self._coords[side[0]]
+            d = self._coords[side[1]]
+            if side[0] in sides[0] or side[1] in sides[0]:
                 continue    # Cannot intersect if any of the points are equal
             bc = [c[i] - b[i] for i in range(3)]
             bd = [d[i] - b[i] for i in range(3)]
@@ -2437,24 +4198,30 @@ class Polytope(Object):
             return 0
         return math.copysign(1, orientation)
 
+    def _set_mesh(self):
+        # Number the faces that are left from zero and link them in a mesh.
+        # From now on, the faces are read from the mesh.
+        order = sorted(self._faces)
+        self._faceTypes = {n: self._faceTypes[f] for n,f in enumerate(order)}
+        self._faceCentres = {n: self._faceCentres[f]
+                             for n,f in enumerate(order)}
+        self._mesh = Mesh(self._edges, [self._faces[f] for f in order],
+                          len(self._points))
+        self._faces = self._mesh.get_faces()
+        if len(self._mesh.get_edges()) != len(self._edges):
+            self._edges = self._mesh.get_edges()    # Sides were not edges
+            self._set_edge_centres()
+
     def _set_edge_centres(self):
         # Create a list of edge midpoints using a list of edges and vertices.
-        self._edgeCentres = [[0,0,0,0] for i in range(len(self._edges))]
-        for i in range(len(self._edges)):
-            for j in range(4):
-                self._edgeCentres[i][j] = (
-                    self._points[self._edges[i][0]][j] +
-                    self._points[self._edges[i][1]][j])/2
+        ends = np.array(self._edges, dtype=int).reshape(-1, 2)
+        self._edgeCentres = (self._points[ends[:,0]] +
+                             self._points[ends[:,1]])/2
 
     def _set_face_centres(self):
         # Create a dict of face centres using a list of faces and vertices.
-        self._faceCentres = {face:[0, 0, 0, 0] for face in self._faces}
-        for face in self._faces:
-            for point in self._faces[face]:
-                for i in range(4):
-                    self._faceCentres[face][i] += self._points[point][i]
-            for i in range(4):
-                self._faceCentres[face][i] /= len(self._faces[face])
+        self._faceCentres = {face: self._points[list(self._faces[face])]
+                             .mean(axis=0).tolist() for face in self._faces}
 
     def _remove_faces(self):
         # Remove faces, change _faceSides to a count, set polytope as star
@@ -2466,7 +4233,7 @@ class Polytope(Object):
                 self._remove_small_faces()
         for i in range(3,21):   # Replace reference to faces with a count
             self._faceSides[i] = len(self._faceSides[i])
-        for i in range(11,21):  # Contains star faces, is a star polytope
+        for i in range(12,21):  # Contains star faces, is a star polytope
             if self._faceSides[i] > 0:
                 self.star = True
                 break
@@ -2519,6 +4286,28 @@ class Polytope(Object):
                 self._faceCentres.pop(i)
                 self._faceTypes.pop(i)
 
+    def _set_convex(self):
+        # Check to see if the polytope is convex, so back faces can be culled.
+        # Every face must lie in the plane normal to its centre, which makes
+        # the centre its outward normal, and no point can be outside of it.
+        # The faces must close up too, or back faces show through the holes.
+        # Star polytopes and polygons are never culled, neither side is back.
+        self.convex = False
+        if self.star == True or len(self._faces) < 4 or not len(self._points):
+            return
+        if not self._mesh.is_closed():
+            return              # Faces were left out, or never found
+        centres = np.array(list(self._faceCentres.values()), dtype=float)
+        heights = (centres**2).sum(axis=1)      # Distance of each plane
+        tolerance = EPSILON * RADIUS**2
+        for face, centre, height in zip(self._faces, centres, heights):
+            corners = self._points[list(self._faces[face])] @ centre
+            if np.abs(corners - height).max() > tolerance:
+                return          # Face is not normal to its centre
+        if (self._points @ centres.T - heights).max() > tolerance:
+            return              # Some point is outside of some face
+        self.convex = True
+
     def get_point_colours(self):
         """
         Return a list of colours of the points of the polytope.
@@ -2527,14 +4316,44 @@ class Polytope(Object):
         """
         return self._pointColours
 
+    def get_edges(self):
+        """
+        Return a list of edges of the polytope, read from its mesh.
+        return: a list of edges of the polytope (list)
+                all elements are pairs of edge endpoints (tuple, len=2)
+        """
+        return self._mesh.get_edges()
+
     def get_faces(self):
         """
-        Return a dictionary of faces of the polytope.
+        Return a dictionary of faces of the polytope, read from its mesh.
         return: a dictionary of faces of the polytope (dict)
-                all keys are face numbers (int)
-                all values are lists of the numbers of the points (list)
+                all keys are face numbers, from zero (int)
+                all values are tuples of the numbers of the points (tuple)
         """
-        return self._faces
+        return self._mesh.get_faces()
+
+    def get_data(self):
+        """
+        Return the data needed to make the polytope again, without faces
+        having to be found again, as in Polytope(polytope.get_data()).
+        return: [points, edges, pointColours, faces, faceTypes, faceSides]
+                points are the pristine points (np.ndarray, Nx4)
+                faces and faceTypes are lists in face number order (list)
+                faceSides is the number of each polygon type (dict, 3:21)
+        """
+        faces = self._mesh.get_faces()
+        return [self._points, self._mesh.get_edges(), self._pointColours,
+                [faces[f] for f in range(len(faces))],
+                [self._faceTypes[f] for f in range(len(faces))],
+                self._faceSides]
+
+    def get_mesh(self):
+        """
+        Return the half-edge mesh of the polytope, to walk its faces.
+        return: the faces and edges of the polytope (Mesh)
+        """
+        return self._mesh
 
     def get_face_sides(self):
         """
@@ -2560,15 +4379,23 @@ class Polytope(Object):
         return: a list of edge midpoints of the polytope (list)
                 all elements are in Cartesian coordinates (list, len=4)
         """
-        return self._edgeCentres
+        if 'edges' not in self._oriented:
+            self._oriented['edges'] = self._orient(self._edgeCentres).tolist()
+        return self._oriented['edges']
 
     def get_face_centres(self):
         """
         Return a dictionary of face centres of the polytope.
-        return: a dictionary of face centres of the polytope (list)
-                all elements are in Cartesian coordinates (list, len=4)
+        return: a dictionary of face centres of the polytope (dict)
+                all keys are face numbers (int)
+                all values are in Cartesian coordinates (list, len=4)
         """
-        return self._faceCentres
+        if 'faces' not in self._oriented:
+            centres = self._orient(np.array(list(self._faceCentres.values()),
+                                            dtype=float).reshape(-1, 4))
+            self._oriented['faces'] = dict(zip(self._faceCentres,
+                                               centres.tolist()))
+        return self._oriented['faces']
 
     def get_shades(self, laxis):
         """
@@ -2580,11 +4407,13 @@ class Polytope(Object):
                 all values are shades between 0 and 1 (int)
         """
         # If polygon, only need one number, always positive
+        points = self.get_point_array()
+        centres = self.get_face_centres()
         if len(self._faces) == 1:
-            light = [laxis[i] - self._faceCentres[0][i] for i in range(3)]
-            a = self._points[self._faces[0][0]]
-            b = self._points[self._faces[0][1]]
-            c = self._points[self._faces[0][2]]
+            light = [laxis[i] - centres[0][i] for i in range(3)]
+            a = points[self._faces[0][0]]
+            b = points[self._faces[0][1]]
+            c = points[self._faces[0][2]]
             u = [a[i] - b[i] for i in range(3)]
             v = [b[i] - c[i] for i in range(3)]
             normal = cross3D(u, v)  # Can't use self._centres[0] = [0,0,0,0]
@@ -2596,20 +4425,47 @@ class Polytope(Object):
         else:
             shades = []
             for f in self._faces:
-                light = [laxis[i]-self._faceCentres[f][i] for i in range(3)]
-                normal = self._faceCentres[f]    # Normal passes origin
+                light = [laxis[i] - centres[f][i] for i in range(3)]
+                normal = centres[f]     # Normal passes origin
                 dnm = math.sqrt(abs(distance2(normal) * distance2(light)))
                 shades.append(sum([light[i]*normal[i]/dnm for i in range(3)]))
             return shades
 
-    def rotate(self, rotAngle):
+    def get_depths(self, camera):
         """
-        Rotate the current polytope and reset edge midpoints and face centres.
-        rotAngle: the angle to rotate the current polytope by (float)
+        Return how far each face that can be seen is from the camera,
+        to paint them from furthest to closest.
+        Faces of a convex polytope that face away are hidden behind it,
+        so they are left out.
+        camera: the camera position in Cartesian coordinates (list, len=4)
+        return: a dictionary of the depths of the faces (dict)
+                all keys are face numbers (int)
+                all values are the squared distance, and minus the face
+                number so ties go to the lowest face (tuple, len=2)
+        """
+        centres = self.get_face_centres()
+        depths = {}
+        for face in self._faces:
+            centre = centres[face]
+            if self.convex and sum([centre[i] * (camera[i] - centre[i])
+                                    for i in range(4)]) <= 0:
+                continue    # Back face
+            depths[face] = (distance2(centre, camera), -face)
+        return depths
+
+    def neighbours_within(self, radius):
         """
-        super().rotate(rotAngle)
-        self._set_edge_centres()
-        self._set_face_centres()
+        Return the points of the polytope near each of its points.
+        radius: the largest distance to a neighbour (float), > 0
+        return: a list of neighbours of each point (list)
+                all elements are lists of point indices (list)
+        """
+        neighbours = [[] for point in self._points]
+        if len(self._points):
+            for i,j in pairs_within(self._points.tolist(), radius):
+                neighbours[i].append(j)
+                neighbours[j].append(i)
+        return [sorted(near) for near in neighbours]
 
 
 
@@ -2621,17 +4477,20 @@ class Sphere(Object):
     Inherited methods:
     __init__            Construct Sphere class.
     get_points          Return a list of points of the sphere.
+    get_point_array     Return the points of the sphere as an array.
     get_edges           Return a list of edges of the sphere.
+    get_orientation     Return the accumulated rotation of the sphere.
     set_rotaxis         Set the rotation axis-plane of the sphere.
     rotate              Rotate the sphere.
+    copy                Return an unrotated copy of the sphere.
 
     Inherited variables:
-    _points             The points of the sphere (list)
-                            elements are in Cartesian coordinates (list)
+    _points             The pristine points of the sphere (np.ndarray)
+                            rows are in Cartesian coordinates
     _edges              The edges of the sphere (list)
                             elements are lists of point indices (list)
-    _axis_i             A basis vector of the rotation axis-plane (list)
-    _axis_j             A basis vector, both in Cartesian coordinates (list)
+    _rotation           The rotations about the axis-plane (Rotation)
+    _orientMatrix       The accumulated rotation (np.ndarray, 4x4)
     """
 
     def __init__(self, number, radius):
@@ -2674,17 +4533,20 @@ class Axes(Object):
     Inherited methods:
     __init__            Construct Axes class.
     get_points          Return a list of points of the axes.
+    get_point_array     Return the points of the axes as an array.
     get_edges           Return a list of edges of the axes.
+    get_orientation     Return the accumulated rotation of the axes.
     set_rotaxis         Set the rotation axis-plane of the axes.
     rotate              Rotate the axes.
+    copy                Return an unrotated copy of the axes.
 
     Inherited variables:
-    _points             The points of the axes (list)
-                            elements are in Cartesian coordinates (list)
+    _points             The pristine points of the axes (np.ndarray)
+                            rows are in Cartesian coordinates
     _edges              The edges of the axes (list)
                             elements are lists of point indices (list)
-    _axis_i             A basis vector of the rotation axis-plane (list)
-    _axis_j             A basis vector, both in Cartesian coordinates (list)
+    _rotation           The rotations about the axis-plane (Rotation)
+    _orientMatrix       The accumulated rotation (np.ndarray, 4x4)
     """
 
     def __init__(self):
@@ -2696,12 +4558,233 @@ class Axes(Object):
 
 
 
-root = tk.Tk()
-main = Main(root)
-root.bind('<Up>', lambda event: main.change('d-'))
-root.bind('<Down>', lambda event: main.change('d+'))
-root.bind('<Left>', lambda event: main.canvas.rotate(0))
-root.bind('<Right>', lambda event: main.canvas.rotate(1))
-icon = tk.PhotoImage(file='icon.gif')
-root.iconphoto(icon, icon)
-root.mainloop()
+class LazyModule():
+
+    """
+    Helper class that stands for a module, and only imports it the first
+    time one of its names is used. Tkinter is only needed once a window
+    opens, so tsukiyo imports quickly and makes polytopes without Tk.
+
+    Private methods:
+    __init__            Construct LazyModule class.
+    __getattr__         Import the module, and return one of its names.
+
+    Private variables:
+    _name               The full name of the module (str)
+    """
+
+    def __init__(self, name):
+        """
+        Construct LazyModule class.
+        name: the full name of the module, such as 'tkinter.ttk' (str)
+        """
+        self._name = name
+
+    def __getattr__(self, attr):
+        """
+        Import the module, and return one of its names. Each name is kept,
+        so it is only looked up in the module once.
+        attr: the name to look up (str)
+        return: the value of the name in the module
+        raise: ImportError if the module is not installed
+        """
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+tk = LazyModule('tkinter')
+ttk = LazyModule('tkinter.ttk')
+
+@functools.lru_cache(maxsize=None)
+def tk_class(cls, base):
+    """
+    Return a class that is both a class of tsukiyo and a Tk widget, made
+    once for each pair. Main and Canvas themselves never change, so they
+    can be subclassed, patched, and checked with isinstance before Tk is
+    loaded, and the widget class made from them sees all of that.
+    cls: the class of tsukiyo, such as Canvas (type)
+    base: the Tk widget class, such as tk.Canvas (type)
+    return: a subclass of both, or cls if it is already a base (type)
+    """
+    if issubclass(cls, base):
+        return cls
+    return type(cls.__name__, (cls, base),
+                {'__doc__': cls.__doc__, '__module__': cls.__module__})
+
+def load_tk():
+    """
+    Import Tkinter now, to find out whether a window can be opened.
+    Otherwise it is only imported once a Tk name is first used.
+    return: the tkinter module
+    raise: ImportError if Tkinter is not installed
+    """
+    tk.TkVersion    # Imports tkinter, and tkinter.ttk next
+    ttk.Frame
+    return importlib.import_module('tkinter')
+
+
+
+class Timeout(Exception):
+    """
+    Raised inside a batch worker when a symbol takes too long to create.
+    """
+
+def stop_record(signum, frame):
+    """
+    Stop creating the current batch symbol when its alarm goes off.
+    signum, frame: the signal number and interrupted frame (unused)
+    """
+    raise Timeout
+
+def make_record(job):
+    """
+    Create one polytope for the batch mode and describe it.
+    Run in a worker process; an alarm stops it after the timeout.
+    Without SIGALRM, as on Windows, there is no alarm and it never stops.
+
+    job: the index, symbol, timeout in seconds or None, whether to use
+         the polytope library, and whether to leave out the points and
+         edges themselves (tuple, len=5)
+    return: the record to print as one JSON line (dict)
+    """
+    index, symbol, timeout, useLibrary, countsOnly = job
+    entry = canonical(symbol)
+    record = collections.OrderedDict([('index', index), ('symbol', entry),
+                                      ('vertices', None), ('edges', None),
+                                      ('faces', None)])
+    if not countsOnly:
+        record['points'] = record['pairs'] = None
+    record['seconds'] = record['error'] = None
+    timed = timeout is not None and hasattr(signal, 'setitimer')
+    start = time.perf_counter()
+    # The alarm can go off anywhere until it is cancelled, even in the
+    # inner finally, so Timeout is caught around all of it
+    try:
+        try:
+            if timed:
+                signal.signal(signal.SIGALRM, stop_record)
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            library = Library(LIBRARY) if useLibrary else None
+            polytope = Creator(entry, library).get_polytope()
+            if polytope is None:
+                record['error'] = 'invalid symbol'
+            else:
+                sides = polytope.get_face_sides()
+                record['vertices'] = len(polytope.get_points())
+                record['edges'] = len(polytope.get_edges())
+                record['faces'] = collections.OrderedDict(
+                    (str(n), sides[n]) for n in sorted(sides) if sides[n])
+                if not countsOnly:
+                    # Adding 0.0 turns -0.0 into 0.0
+                    record['points'] = [[round(x, BATCHDIGITS) + 0.0
+                                         for x in point]
+                                        for point in polytope.get_points()]
+                    record['pairs'] = [list(edge)
+                                       for edge in polytope.get_edges()]
+        finally:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except Timeout:
+        record['error'] = 'timed out'
+    except Exception as error:      # Report it, but keep the batch going
+        record['error'] = '{}: {}'.format(type(error).__name__, error)
+    record['seconds'] = round(time.perf_counter() - start, 6)
+    return record
+
+def batch(symbols, jobs=None, timeout=None, useLibrary=False,
+          countsOnly=False, out=sys.stdout):
+    """
+    Create many polytopes in a process pool, printing one JSON line per
+    polytope as soon as it is done, so not always in the given order.
+
+    symbols: the symbols to create, already expanded (list)
+    jobs: the number of worker processes (int), default one per CPU
+    timeout: the seconds to spend on each symbol (float), default None
+             to wait forever; needs SIGALRM, so it is ignored on Windows
+    useLibrary: load and save polytopes in the library (bool)
+    countsOnly: leave the points and edges out of the records, and only
+                count them (bool)
+    out: where to write the records (file), default standard output
+    return: the number of records with errors (int)
+    """
+    if timeout is not None and not hasattr(signal, 'setitimer'):
+        warnings.warn('symbols cannot be stopped without SIGALRM, so the '
+                      'timeout is ignored', RuntimeWarning)
+    errors = 0
+    work = [(i, symbol, timeout, useLibrary, countsOnly)
+            for i,symbol in enumerate(symbols)]
+    with multiprocessing.Pool(jobs) as pool:
+        for record in pool.imap_unordered(make_record, work):
+            if record['error'] is not None:
+                errors += 1
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+    return errors
+
+def main(args=None):
+    """
+    With no symbols, open the program window and run it until it is
+    closed. Nothing is displayed until this is called, so importing
+    tsukiyo to make polytopes does not need Tk or a display.
+    With symbols, create them all in batch mode without a display.
+
+    args: the command line arguments (list), default sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description='Display and rotate polytopes, or create them in batch '
+                    'and print one JSON line for each polytope.')
+    parser.add_argument('symbols', nargs='*', help="Schlafli or Wythoff "
+                        "symbols; any number can be a range like '{3..10}'")
+    parser.add_argument('-f', '--file', action='append', default=[],
+                        help='read more symbols from a file, one per line')
+    parser.add_argument('-b', '--bars', action='store_true',
+                        help='create Wythoff symbols with all bar positions')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    parser.add_argument('-t', '--timeout', type=float, default=60,
+                        help='seconds allowed per symbol (default: 60)')
+    parser.add_argument('-l', '--library', action='store_true',
+                        help='load and save polytopes in ~/.tsukiyo, '
+                             'or in $TSUKIYO_LIBRARY if it is set')
+    parser.add_argument('--counts-only', action='store_true',
+                        help='only count the points and edges of each '
+                             'polytope, without listing them')
+    options = parser.parse_args(args)
+
+    entries = list(options.symbols)
+    for name in options.file:
+        with open(name) as symbolFile:
+            entries += [line.strip() for line in symbolFile if line.strip()]
+    if entries:
+        symbols = []
+        for entry in entries:
+            for symbol in expand(entry):
+                numbers = canonical(symbol)[1:-1].replace('|', ' ').split()
+                if options.bars and symbol.startswith('(') \
+                    and len(numbers) == 3:
+                    symbols += [place_bar(numbers, bar) for bar in
+                                ['a','b','c','p','q','s','pq','qs','sp']]
+                else:
+                    symbols.append(symbol)
+        errors = batch(symbols, options.jobs, options.timeout,
+                       options.library, options.counts_only)
+        raise SystemExit(1 if errors else 0)
+
+    try:
+        load_tk()
+    except ImportError:
+        raise SystemExit('Tsukiyo needs Tkinter to display polytopes.')
+    root = tk.Tk()
+    app = Main(root)
+    for key, button in [('Up', 'd-'), ('Down', 'd+'),
+                        ('Left', 'r0'), ('Right', 'r1')]:
+        root.bind('<KeyPress-{}>'.format(key),
+                  lambda event, button=button: app.key_down(button))
+        root.bind('<KeyRelease-{}>'.format(key),
+                  lambda event, button=button: app.key_up(button))
+    icon = tk.PhotoImage(file=os.path.join(IMAGES, 'icon.gif'))
+    root.iconphoto(icon, icon)
+    root.mainloop()
+
+if __name__ == '__main__':
+    main()